@@ -0,0 +1,80 @@
+# admin_stats.py
+"""
+Statistik för adminpanelen
+──────────────────────────
+• snapshot(days) – artiklar per dag och kategori (med trend), prenumeranter per
+                   status, senaste körningen och OpenAI-kostnad per dag
+
+Allt läses ur små aggregattabeller i news_db som hålls uppdaterade när rader
+skrivs (triggers på articles och subscribers, en rad i runs per körning).
+Kostnaden är alltså proportionell mot antal dagar × kategorier, inte mot antal
+artiklar eller prenumeranter – och arket rörs aldrig.
+
+Artikelräkningen bygger på arkivet i news_db, som synken fyller på från
+'Artiklar' oavsett READ_MODEL (triggers räknar in varje inläst rad). Innan
+första inläsningen är klar är totalen för låg – `articles.backfilled` säger
+om den är det.
+"""
+
+from __future__ import annotations
+from datetime import date, timedelta
+
+import news_db
+
+TREND_DAYS = 7  # senaste veckan jämförs med veckan innan
+
+
+def _days(first: date, n: int) -> list[str]:
+    return [(first + timedelta(days=i)).isoformat() for i in range(n)]
+
+
+def snapshot(days: int = 14, today: date | None = None) -> dict:
+    today = today or date.today()
+    window = max(days, 2 * TREND_DAYS)
+    since = today - timedelta(days=window - 1)
+    recent_from = (today - timedelta(days=TREND_DAYS - 1)).isoformat()
+    prev_from = (today - timedelta(days=2 * TREND_DAYS - 1)).isoformat()
+
+    per_day = dict.fromkeys(_days(since, window), 0)
+    categories: dict[str, dict] = {}
+    for day, category, n in news_db.article_stats(since.isoformat()):
+        if day in per_day:
+            per_day[day] += n
+        cat = categories.setdefault(category or "–", {"recent": 0, "previous": 0})
+        if day >= recent_from:
+            cat["recent"] += n
+        elif day >= prev_from:
+            cat["previous"] += n
+
+    totals = news_db.article_totals()
+    for category, n in totals.items():
+        categories.setdefault(category or "–", {"recent": 0, "previous": 0})["total"] = n
+
+    costs = {day: (cost or 0.0, tokens or 0) for day, cost, tokens in news_db.run_costs(since.isoformat())}
+    runs = news_db.recent_runs("fetch", limit=10)
+    shown = list(per_day)[-days:]
+    peak = max((per_day[d] for d in shown), default=0)
+
+    return {
+        "articles": {
+            "total": sum(totals.values()),
+            "backfilled": news_db.get_sync_state("Artiklar")["synced_at"] is not None,
+            "recent": sum(c["recent"] for c in categories.values()),
+            "previous": sum(c["previous"] for c in categories.values()),
+            "per_day": [{"day": d, "n": per_day[d], "pct": round(100 * per_day[d] / peak) if peak else 0}
+                        for d in shown],
+            "per_category": sorted(
+                ({"category": k, "total": 0, **v} for k, v in categories.items()),
+                key=lambda c: (-c["recent"], -c["total"]),
+            ),
+        },
+        "subscribers": news_db.subscriber_counts(),
+        "last_run": runs[0] if runs else None,
+        "runs": runs,
+        "openai": {
+            "recent_usd": round(sum(c for d, (c, _) in costs.items() if d >= recent_from), 4),
+            "previous_usd": round(sum(c for d, (c, _) in costs.items() if prev_from <= d < recent_from), 4),
+            "per_day": [{"day": d, "usd": round(costs.get(d, (0.0, 0))[0], 4), "tokens": costs.get(d, (0.0, 0))[1]}
+                        for d in shown],
+        },
+    }
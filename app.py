@@ -1,13 +1,27 @@
 # app.py – AI-Nyheter (stabil grund, Sheet som källa)
-import os, sys, json
+import os, sys, json, time, base64, zlib, gzip, heapq, bisect, hashlib, secrets
+from collections import OrderedDict
+from datetime import datetime, timezone
 from functools import wraps
-from threading import Thread
+from threading import Thread, Lock, Event
 
-from flask import Flask, render_template, request, redirect, session, jsonify
+from flask import Flask, render_template, request, redirect, session, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import gspread
 from google.oauth2.service_account import Credentials
 
+# (Valfritt) brotli för komprimerade strömmar – gzip används annars
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import admin_stats
+import jobs
+import metrics
+import news_db
+from sheet_sync import sync_all, sync_subscribers, SMALL_TABS
+
 # (Valfritt) e-posthjälp – kvar för framtida bruk
 try:
     from util_email import gen_token, send_confirm, send_goodbye  # noqa
@@ -15,7 +29,7 @@ except Exception:
     gen_token = send_confirm = send_goodbye = None
 
 # ────────── Konfiguration / miljö ──────────
-# Behåll fulla scopes (du skriver till arket i /api/subscribe)
+# Behåll fulla scopes (prenumeranter speglas till arket)
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
@@ -26,6 +40,14 @@ CREDS_PATH     = os.getenv("GOOGLE_CREDS_PATH", "/etc/secrets/service_account.js
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 ADMIN_TOKEN    = os.getenv("ADMIN_TOKEN")  # används för header-skydd på /admin/run-fetch
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "https://andersasplundberggren.github.io")
+SHEET_CACHE_TTL   = float(os.getenv("SHEET_CACHE_TTL", "60"))     # sek innan en flik räknas som gammal
+SHEET_CACHE_STALE = float(os.getenv("SHEET_CACHE_STALE", "900"))  # sek som gammal data får serveras under omladdning
+# Läsmodell för publika endpoints: "sheet" (läs arket via cache) eller "sqlite" (news_db + bakgrundssynk)
+READ_MODEL    = os.getenv("READ_MODEL", "sheet").strip().lower()
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", "300"))  # sek mellan synk Sheet ⇄ SQLite
+HTTP_MAX_AGE       = int(os.getenv("HTTP_MAX_AGE", "60"))        # Cache-Control max-age för publika svar
+VARIANT_CACHE_SIZE = int(os.getenv("VARIANT_CACHE_SIZE", "16"))  # antal färdigkodade svar i minnet
+METRICS_TOKEN      = os.getenv("METRICS_TOKEN")  # (valfritt) kräv "Authorization: Bearer <token>" på /metrics
 
 if not SPREADSHEET_ID:
     print("[app] VARNING: SPREADSHEET_ID saknas!", file=sys.stderr)
@@ -63,12 +85,392 @@ def admin_required_route(fn):
         return fn(*a, **kw)
     return wrapper
 
-def _sheet_rows(tab_name: str):
-    """Hämta alla rader från en flik som lista av dicts."""
+class SheetCache:
+    """Läs-cache för flikar i arket.
+
+    • TTL: en flik läses från Sheets högst en gång per `ttl` sekunder
+    • stale-while-revalidate: inom `stale` sekunder efter TTL serveras gammal
+      data direkt medan en bakgrundstråd laddar om fliken
+    • single-flight: samtidiga missar på samma flik delar på ett enda anrop
+    • `negative`: undantag (t.ex. WorksheetNotFound) som cachas som svar
+    • version(): innehållshash + tidpunkt då innehållet senast ändrades (för ETag)
+    • derived(): något som byggs ur raderna (t.ex. ett sorterat index) – byggs om
+      bara när flikens innehållsversion ändras
+    """
+
+    def __init__(self, loader, ttl: float, stale: float, negative: tuple = ()):
+        self._loader = loader
+        self._ttl = ttl
+        self._stale = stale
+        self._negative = negative
+        self._lock = Lock()
+        self._entries = {}   # tab -> (rows, error, fetched_at, version, changed_at)
+        self._gen = {}       # tab -> generation (ökas vid invalidate)
+        self._inflight = {}  # (tab, gen) -> Event (med .result när klar)
+        self._derived = {}   # (tab, name) -> (version, värde)
+
+    def get(self, tab: str):
+        with self._lock:
+            gen = self._gen.get(tab, 0)
+            entry = self._entries.get(tab)
+            age = time.monotonic() - entry[2] if entry else None
+            if entry and age < self._ttl:
+                return self._unwrap(entry)
+            key = (tab, gen)
+            if entry and age < self._ttl + self._stale:
+                if key not in self._inflight:
+                    self._inflight[key] = Event()
+                    Thread(target=self._refresh, args=(tab, gen), daemon=True).start()
+                return self._unwrap(entry)
+            leader = key not in self._inflight
+            if leader:
+                self._inflight[key] = Event()
+            done = self._inflight[key]
+
+        if leader:
+            self._refresh(tab, gen)
+        else:
+            done.wait()
+        return self._unwrap(done.result)
+
+    def version(self, tab: str) -> tuple[str, float] | None:
+        """(innehållshash, ändrad epoch-tid) för fliken; laddar den vid behov."""
+        self.get(tab)
+        with self._lock:
+            entry = self._entries.get(tab)
+        return (entry[3], entry[4]) if entry and entry[3] else None
+
+    def derived(self, tab: str, name: str, build):
+        """build(rader) för flikens aktuella rader, återanvänt så länge innehållsversionen är densamma."""
+        rows = self.get(tab)
+        with self._lock:
+            entry = self._entries.get(tab)
+            version = entry[3] if entry and entry[0] is rows else None
+            cached = self._derived.get((tab, name))
+            if version and cached and cached[0] == version:
+                return cached[1]
+        value = build(rows)
+        if version:
+            with self._lock:
+                self._derived[(tab, name)] = (version, value)
+        return value
+
+    def invalidate(self, tab: str | None = None) -> None:
+        """Glöm en flik (eller alla). Pågående omladdningar sparas inte."""
+        with self._lock:
+            tabs = [tab] if tab else list(set(self._entries) | set(self._gen))
+            for t in tabs:
+                self._entries.pop(t, None)
+                self._gen[t] = self._gen.get(t, 0) + 1
+
+    def _refresh(self, tab: str, gen: int) -> None:
+        rows, error = None, None
+        try:
+            rows = self._loader(tab)
+        except self._negative as e:
+            error = e
+        except Exception as e:
+            error = e
+            print(f"[cache] Kunde inte läsa fliken '{tab}': {e}", file=sys.stderr)
+        version = None
+        if rows is not None:
+            raw = json.dumps(rows, ensure_ascii=False, sort_keys=True, default=str)
+            version = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        with self._lock:
+            if self._gen.get(tab, 0) == gen and (rows is not None or isinstance(error, self._negative)):
+                old = self._entries.get(tab)
+                changed = old[4] if old and old[3] == version else time.time()
+                self._entries[tab] = (rows, error, time.monotonic(), version, changed)
+            done = self._inflight.pop((tab, gen))
+        done.result = (rows, error)
+        done.set()
+
+    @staticmethod
+    def _unwrap(entry):
+        rows, error = entry[0], entry[1]
+        if error is not None:
+            raise error
+        return rows
+
+
+def _load_sheet(tab_name: str):
     if not sh:
         raise RuntimeError("Google Sheet ej initierat (saknar SPREADSHEET_ID eller creds).")
-    ws = sh.worksheet(tab_name)
-    return ws.get_all_records()  # [{col: val, ...}]
+    return sh.worksheet(tab_name).get_all_records()  # [{col: val, ...}]
+
+
+sheet_cache = SheetCache(
+    _load_sheet, ttl=SHEET_CACHE_TTL, stale=SHEET_CACHE_STALE, negative=(gspread.WorksheetNotFound,),
+)
+
+
+def _sheet_rows(tab_name: str):
+    """Hämta alla rader från en flik som lista av dicts.
+
+    READ_MODEL=sqlite: från news_db (synkas i bakgrunden), annars via sheet_cache.
+    """
+    if READ_MODEL == "sqlite":
+        if tab_name == "Artiklar":
+            return news_db.all_articles()
+        rows = news_db.tab_rows(tab_name)
+        if rows is not None:
+            return rows
+        if tab_name in SMALL_TABS:
+            raise gspread.WorksheetNotFound(tab_name)
+    return sheet_cache.get(tab_name)
+
+
+def _iter_rows(tab_name: str):
+    """Rader som iterator. Artiklar i SQLite-läge läses i omgångar direkt från databasen."""
+    if READ_MODEL == "sqlite" and tab_name == "Artiklar":
+        return news_db.iter_articles()
+    return iter(_sheet_rows(tab_name))
+
+
+# ────────── Strömmande svar (NDJSON / JSON-array) ──────────
+STREAM_CHUNK = 16 * 1024  # byte som samlas innan de komprimeras och skickas
+
+
+def _stream_format() -> str | None:
+    """'ndjson', 'json' (strömmad array) eller None (vanligt jsonify-svar).
+
+    Väljs med ?format=ndjson|json-stream, ?stream=1 eller Accept: application/x-ndjson.
+    """
+    fmt = request.args.get("format", "").strip().lower()
+    if fmt == "ndjson" or "application/x-ndjson" in request.headers.get("Accept", ""):
+        return "ndjson"
+    if fmt == "json-stream" or request.args.get("stream", "").lower() in ("1", "true"):
+        return "json"
+    return None
+
+
+def _encode_rows(rows, fmt: str):
+    """Koda rad för rad och samla ihop till bitar om ~STREAM_CHUNK byte."""
+    buf, size = [], 0
+    if fmt == "json":
+        buf.append(b"[")
+    first = True
+    for row in rows:
+        data = json.dumps(row, ensure_ascii=False).encode("utf-8")
+        if fmt == "ndjson":
+            data += b"\n"
+        elif not first:
+            data = b"," + data
+        first = False
+        buf.append(data)
+        size += len(data)
+        if size >= STREAM_CHUNK:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if fmt == "json":
+        buf.append(b"]")
+    if buf:
+        yield b"".join(buf)
+
+
+def _negotiate_encoding() -> str | None:
+    accepted = {e.split(";")[0].strip().lower() for e in request.headers.get("Accept-Encoding", "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(chunks, encoding: str | None):
+    """Komprimera i farten; varje bit flushas så att klienten får data direkt."""
+    if encoding == "gzip":
+        z = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield z.compress(chunk) + z.flush(zlib.Z_SYNC_FLUSH)
+        yield z.flush()
+    elif encoding == "br":
+        c = brotli.Compressor(quality=5)
+        for chunk in chunks:
+            yield c.process(chunk) + c.flush()
+        yield c.finish()
+    else:
+        yield from chunks
+
+
+def _stream_rows(rows, fmt: str) -> Response:
+    encoding = _negotiate_encoding()
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+    headers = {"Vary": "Accept-Encoding", "X-Accel-Buffering": "no"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    body = _compress(_encode_rows(rows, fmt), encoding)
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+
+# ────────── HTTP-cachning (ETag / Last-Modified / 304) ──────────
+# Varje datamängd har en billig versionstoken: innehållshash i sheet_cache,
+# triggerräknare / synkhash i news_db. ETag = hash(version + URL) + kodning, så
+# en oförändrad flik ger 304 utan att något läses eller kodas om. Färdigkodade
+# (och komprimerade) svar hålls i en liten LRU per ETag.
+_variants: OrderedDict = OrderedDict()  # (etag, encoding) -> bytes
+_variants_lock = Lock()
+
+
+def _dataset_version(tab_name: str) -> tuple[str, float | None] | None:
+    """(versionstoken, ändrad epoch-tid) för fliken som _sheet_rows läser, eller None."""
+    if READ_MODEL == "sqlite" and (tab_name == "Artiklar" or tab_name in SMALL_TABS):
+        return _db_version(tab_name)
+    return sheet_cache.version(tab_name)
+
+
+def _db_version(tab_name: str) -> tuple[str, float | None] | None:
+    version = news_db.dataset_version(tab_name)
+    if not version:
+        return None
+    token, changed = version
+    try:
+        ts = datetime.fromisoformat(changed.replace("Z", "+00:00")).timestamp() if changed else None
+    except ValueError:
+        ts = None
+    return token, ts
+
+
+def _validators(version):
+    """(etag, last_modified, encoding) för aktuell request och datamängdsversion."""
+    token, changed = version
+    encoding = _negotiate_encoding()
+    base = hashlib.sha1(f"{token}\x1f{request.full_path}".encode("utf-8")).hexdigest()[:32]
+    etag = f"{base}-{encoding}" if encoding else base
+    last_modified = datetime.fromtimestamp(int(changed), timezone.utc) if changed else None
+    return etag, last_modified, encoding
+
+
+def _cache_headers(resp: Response, etag: str, last_modified) -> Response:
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = f"public, max-age={HTTP_MAX_AGE}"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def _not_modified(etag: str, last_modified) -> Response | None:
+    """304 om klientens kopia är aktuell (If-None-Match går före If-Modified-Since)."""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        ims = request.if_modified_since
+        fresh = bool(ims and last_modified and last_modified <= ims)
+    return _cache_headers(Response(status=304), etag, last_modified) if fresh else None
+
+
+def _encoded_body(etag: str, encoding: str | None, build) -> bytes:
+    key = (etag, encoding)
+    with _variants_lock:
+        if key in _variants:
+            _variants.move_to_end(key)
+            return _variants[key]
+    body = (app.json.dumps(build()) + "\n").encode("utf-8")
+    if encoding == "gzip":
+        body = gzip.compress(body, 6)
+    elif encoding == "br":
+        body = brotli.compress(body, quality=5)
+    with _variants_lock:
+        _variants[key] = body
+        while len(_variants) > VARIANT_CACHE_SIZE:
+            _variants.popitem(last=False)
+    return body
+
+
+def _cached_json(version, build):
+    """JSON-svar med ETag/Last-Modified; `build()` körs bara när svaret inte finns kodat."""
+    if not version:
+        return jsonify(build())
+    etag, last_modified, encoding = _validators(version)
+    if (resp := _not_modified(etag, last_modified)) is not None:
+        return resp
+    resp = Response(_encoded_body(etag, encoding, build), mimetype="application/json")
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    return _cache_headers(resp, etag, last_modified)
+
+
+def _rows_response(tab_name: str):
+    """Hela fliken – strömmad om klienten bett om det, annars som JSON-array.
+
+    Båda varianterna får ETag/Last-Modified och svarar 304 när fliken är oförändrad.
+    """
+    version = _dataset_version(tab_name)
+    fmt = _stream_format()
+    if not fmt:
+        return _cached_json(version, lambda: _sheet_rows(tab_name))
+    if not version:
+        return _stream_rows(_iter_rows(tab_name), fmt)
+    etag, last_modified, _ = _validators(version)
+    if (resp := _not_modified(etag, last_modified)) is not None:
+        return resp
+    return _cache_headers(_stream_rows(_iter_rows(tab_name), fmt), etag, last_modified)
+
+
+# ────────── Bakgrundssynk Sheet ⇄ SQLite ──────────
+# Pull körs oavsett READ_MODEL: /public/search och adminstatistiken läser alltid ur
+# news_db, så även med READ_MODEL=sheet måste arkivet i 'Artiklar' fyllas på där.
+# Borttagningar i arket tas bort ur news_db; push bara med READ_MODEL=sqlite.
+_sync_lock = Lock()
+
+
+def run_sync() -> None:
+    """Kör en synk (hoppar över om en redan pågår i processen).
+
+    Mellan processer (gunicorn-workers) skyddas synken av jobblåset "sync" – annars
+    kan två workers skriva samma osynkade artiklar till arket samtidigt.
+    """
+    if not sh or not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        with jobs.exclusive("sync"):
+            # Med READ_MODEL=sheet skriver hämtarna själva till arket – synken läser bara
+            sync_all(sh, push=READ_MODEL == "sqlite")
+    except Exception as e:
+        print(f"[sync] fel: {e}", file=sys.stderr)
+    finally:
+        _sync_lock.release()
+
+
+def _sync_loop():
+    while True:
+        run_sync()
+        time.sleep(SYNC_INTERVAL)
+
+
+# ────────── Prenumeranter: SQLite → 'Prenumeranter' i bakgrunden ──────────
+_subscribers_changed = Event()
+
+
+def _subscriber_loop():
+    while True:
+        try:
+            with jobs.exclusive("subscribers"):
+                sync_subscribers(sh)
+        except Exception as e:
+            print(f"[subscribe] spegling mot arket misslyckades: {e}", file=sys.stderr)
+        _subscribers_changed.wait(SYNC_INTERVAL)
+        _subscribers_changed.clear()
+
+
+# ────────── Start av bakgrundstrådarna ──────────
+_background_started = False
+
+
+def start_background() -> None:
+    """Migrera news_db och starta synk- och prenumerantlooparna (en gång per process)."""
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    news_db.init()
+    if sh:
+        Thread(target=_sync_loop, daemon=True).start()
+        Thread(target=_subscriber_loop, daemon=True).start()
+
+
+start_background()
 
 # ────────── Adminpanel (enkel, valfri att använda) ──────────
 @app.route("/admin/panel", methods=["GET", "POST"])
@@ -80,80 +482,139 @@ def admin_panel():
             return redirect("/admin/panel")
         return render_template("admin.html", authed=False, error="Fel lösenord")
 
-    # Visa statistisk info (kräver ej inlogg för att se själva sidan – men knapparna kräver session)
-    try:
-        subs = sh.worksheet("Prenumeranter").get_all_records()
-    except Exception:
-        subs = []
-
-    try:
-        arts = sh.worksheet("Artiklar").get_all_records()
-    except Exception:
-        arts = []
+    # Statistik ur aggregattabellerna i news_db – bara för inloggade (arket läses aldrig här)
+    stats = None
+    if session.get("admin"):
+        try:
+            stats = admin_stats.snapshot()
+        except Exception as e:
+            print(f"[admin] Kunde inte läsa statistik: {e}", file=sys.stderr)
 
-    return render_template(
-        "admin.html",
-        authed=session.get("admin"),
-        subs=len(subs),
-        arts=len(arts),
-    )
+    return render_template("admin.html", authed=session.get("admin"), stats=stats)
 
 @app.route("/admin/logout")
 def admin_logout():
     session.pop("admin", None)
     return redirect("/admin/panel")
 
+# ────────── Bakgrundsjobb (jobs.py) ──────────
+def _fetch_job(job, profile=None, force=False):
+    from rss_fetcher import fetch_and_append
+    added = fetch_and_append(job, profile=profile, force=force)
+    sheet_cache.invalidate("Artiklar")
+    run_sync()
+    print(f"[admin] fetch klart, nya artiklar: {added}", file=sys.stderr)
+    return {"added": added}
+
+
+def _start_fetch(profile=None, force=False):
+    """Köa en hämtning. Pågår redan en (i någon worker) returneras den i stället.
+
+    force=True hämtar alla flöden, inte bara de som är förfallna enligt feed_schedule.
+    """
+    job_id, created = jobs.submit("fetch", lambda job: _fetch_job(job, profile, force))
+    if not created:
+        print(f"[admin] hämtning pågår redan – slås ihop med jobb {job_id}", file=sys.stderr)
+    return job_id, created
+
+
+def admin_token_or_session(fn):
+    """Tillåt både inloggad panel-session och header X-Admin-Token."""
+    @wraps(fn)
+    def wrapper(*a, **kw):
+        if not session.get("admin") and ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+            return jsonify({"error": "Unauthorized"}), 401
+        return fn(*a, **kw)
+    return wrapper
+
+
 # Panel-knapp som kör hämtning (session-skyddad)
 @app.route("/admin/panel/fetch", methods=["POST"])
 @admin_required_route
 def admin_rss_fetch():
-    def job():
-        try:
-            from rss_fetcher import fetch_and_append
-            added = fetch_and_append()
-            print(f"[admin] panel/fetch klart, nya artiklar: {added}", file=sys.stderr)
-        except Exception as e:
-            print(f"[admin] panel/fetch fel: {e}", file=sys.stderr)
-
-    Thread(target=job, daemon=True).start()
+    _start_fetch(force=True)  # manuell knapp: hämta alla flöden
     return redirect("/admin/panel")
 
 # **Manuell trigger** (POST) – kan anropas av GitHub Actions / externa system
 # Skicka header: X-Admin-Token: <ADMIN_TOKEN>
+# ?profile=cprofile|pyinstrument profilerar just den körningen (se metrics.py)
+# ?force=1 hämtar alla flöden, även de som inte är förfallna (se feed_schedule.py)
 @app.route("/admin/run-fetch", methods=["POST"])
 def run_fetch_now():
     if ADMIN_TOKEN and (request.headers.get("X-Admin-Token") != ADMIN_TOKEN):
         return jsonify({"error": "Unauthorized"}), 401
 
-    def job():
-        try:
-            from rss_fetcher import fetch_and_append
-            added = fetch_and_append()
-            print(f"[admin] run-fetch klart, nya artiklar: {added}", file=sys.stderr)
-        except Exception as e:
-            print(f"[admin] run-fetch fel: {e}", file=sys.stderr)
-
-    Thread(target=job, daemon=True).start()
-    return jsonify({"ok": True, "msg": "Fetch job started"}), 202
+    force = request.args.get("force", "").lower() in ("1", "true", "yes")
+    job_id, created = _start_fetch(request.args.get("profile") or None, force)
+    return jsonify({
+        "ok": True,
+        "msg": "Fetch job started" if created else "Fetch job already running",
+        "job_id": job_id,
+        "coalesced": not created,
+        "status_url": f"/admin/jobs/{job_id}",
+    }), 202
+
+@app.get("/admin/jobs")
+@admin_token_or_session
+def admin_jobs():
+    """Senaste jobben, nyast först."""
+    return jsonify(jobs.recent(min(max(request.args.get("limit", 20, type=int), 1), 100)))
+
+@app.get("/admin/jobs/<job_id>")
+@admin_token_or_session
+def admin_job_status(job_id):
+    """Status för ett jobb: status, progress-räknare, resultat eller fel."""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Okänt jobb"}), 404
+    return jsonify(job)
+
+@app.get("/admin/run-report")
+@admin_token_or_session
+def admin_run_report():
+    """Senaste körrapporten (tider per steg, bortfall, tokens, per flöde)."""
+    report = metrics.latest_report("fetch")
+    if not report:
+        return jsonify({"error": "Ingen körrapport ännu"}), 404
+    return jsonify(report)
+
+@app.get("/admin/stats")
+@admin_token_or_session
+def admin_stats_json():
+    """Samma statistik som adminpanelen: artiklar per dag/kategori, prenumeranter, körningar, kostnad."""
+    days = min(max(request.args.get("days", 14, type=int), 1), 90)
+    return jsonify(admin_stats.snapshot(days))
+
+@app.get("/admin/feeds")
+@admin_token_or_session
+def admin_feeds():
+    """Hälsa och schema per flöde: fel i rad, svarstid, takt (poster/dygn), nästa hämtning."""
+    return jsonify([{"url": url, **h} for url, h in news_db.feed_health().items()])
+
+@app.post("/admin/jobs/<job_id>/cancel")
+@admin_token_or_session
+def admin_job_cancel(job_id):
+    """Begär avbrytning – jobbet stannar vid nästa avbrytningspunkt."""
+    if not jobs.cancel(job_id):
+        return jsonify({"error": "Jobbet finns inte eller är redan klart"}), 409
+    return jsonify({"ok": True, "job_id": job_id}), 202
 
 # ────────── Publika API-endpoints (befintliga) ──────────
 @app.route("/api/all")
 def api_all():
-    """Returnerar alla artiklar (fliken 'Artiklar') som JSON."""
+    """Returnerar alla artiklar (fliken 'Artiklar') som JSON (strömmat med ?format=ndjson)."""
     try:
-        arts = sh.worksheet("Artiklar").get_all_records()
+        return _rows_response("Artiklar")
     except Exception:
-        arts = []
-    return jsonify(arts)
+        return jsonify([])
 
 @app.route("/api/settings")
 def api_settings():
     """Returnerar rader från fliken 'Inställningar' som JSON."""
     try:
-        settings = sh.worksheet("Inställningar").get_all_records()
+        return _rows_response("Inställningar")
     except Exception:
-        settings = []
-    return jsonify(settings)
+        return jsonify([])
 
 # ────────── NYTT: Läs-enda proxy för frontend (GitHub Pages) ──────────
 # Dessa används av din frontend för att slippa publicera arket på webben.
@@ -161,21 +622,125 @@ def api_settings():
 def public_sheet():
     """
     Ex: /public/sheet?sheet=Artiklar  eller  /public/sheet?sheet=Kategorier
-    Returnerar list[dict].
+    Returnerar list[dict]. Med ?format=ndjson (eller ?stream=1) strömmas svaret.
     """
     tab = request.args.get("sheet", "").strip() or "Artiklar"
     try:
-        rows = _sheet_rows(tab)
-        return jsonify(rows)
+        return _rows_response(tab)
     except gspread.WorksheetNotFound:
         return jsonify({"error": f"Fliken '{tab}' kunde inte hittas."}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+PAGE_PARAMS   = ("limit", "cursor", "category", "from", "to", "paywall", "fields")
+MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(row: dict) -> str:
+    raw = json.dumps([row.get("import_date") or "", row.get("id") or ""])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    import_date, art_id = json.loads(raw)
+    return str(import_date), str(art_id)
+
+
+class ArticleIndex:
+    """Flikens artiklar sorterade på (import_date, id) – totalt och per kategori.
+
+    Samma semantik som news_db.page_articles, men över den cachade fliken:
+    cursor och to-datum hittas med bisect och sidan läses bakåt därifrån, så
+    en sida kostar O(log n + limit) i stället för en sortering av hela arkivet.
+    Byggs en gång per innehållsversion (sheet_cache.derived).
+    """
+
+    def __init__(self, rows):
+        ordered = sorted(rows, key=self.key)
+        self.keys = [self.key(r) for r in ordered]
+        self.rows = ordered
+        self.by_category: dict[str, tuple[list, list]] = {}
+        for k, r in zip(self.keys, ordered):
+            keys, cat_rows = self.by_category.setdefault(r.get("category"), ([], []))
+            keys.append(k)
+            cat_rows.append(r)
+
+    @staticmethod
+    def key(r) -> tuple[str, str]:
+        return (str(r.get("import_date") or ""), str(r.get("id") or ""))
+
+    @staticmethod
+    def _newest_first(keys, rows, after, date_to):
+        end = bisect.bisect_left(keys, after) if after else len(keys)  # strikt äldre än cursorn
+        if date_to:
+            end = min(end, bisect.bisect_right(keys, (date_to, "\U0010ffff")))
+        for i in range(end - 1, -1, -1):
+            yield keys[i], rows[i]
+
+    def page(self, limit, after, categories, date_from, date_to, paywall) -> list[dict]:
+        if categories:
+            runs = [self._newest_first(*self.by_category[c], after, date_to)
+                    for c in dict.fromkeys(categories) if c in self.by_category]
+            candidates = heapq.merge(*runs, key=lambda kr: kr[0], reverse=True)
+        else:
+            candidates = self._newest_first(self.keys, self.rows, after, date_to)
+        out = []
+        for k, r in candidates:
+            if date_from and k[0] < date_from:
+                break
+            if paywall is not None and (str(r.get("paywall")).upper() in ("TRUE", "1")) != paywall:
+                continue
+            out.append(r)
+            if len(out) >= limit:
+                break
+        return out
+
+
+def _paged_articles(args):
+    """
+    /public/articles?limit=20&cursor=…&category=A,B&from=YYYY-MM-DD&to=YYYY-MM-DD&paywall=0&fields=id,title
+    Returnerar {"items": [...], "next_cursor": "..."|null}, nyast först.
+    """
+    try:
+        limit = min(max(int(args.get("limit", 20)), 1), MAX_PAGE_SIZE)
+        after = _decode_cursor(args["cursor"]) if args.get("cursor") else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "Ogiltig limit eller cursor"}), 400
+
+    categories = [c.strip() for c in args.get("category", "").split(",") if c.strip()] or None
+    paywall = None
+    if args.get("paywall", "") != "":
+        paywall = args["paywall"].strip().lower() in ("1", "true", "ja", "yes")
+    fields = [f.strip() for f in args.get("fields", "").split(",") if f.strip()] or None
+    if fields and (bad := [f for f in fields if f not in news_db.ARTICLE_COLS]):
+        return jsonify({"error": f"Okända fält: {', '.join(bad)}"}), 400
+    date_from, date_to = args.get("from") or None, args.get("to") or None
+
+    def build():
+        if READ_MODEL == "sqlite":
+            rows = news_db.page_articles(
+                limit, after=after, categories=categories, date_from=date_from,
+                date_to=date_to, paywall=paywall, fields=fields,
+            )
+        else:
+            index = sheet_cache.derived("Artiklar", "index", ArticleIndex)
+            rows = index.page(limit, after, categories, date_from, date_to, paywall)
+        next_cursor = _encode_cursor(rows[-1]) if len(rows) == limit else None
+        if fields:
+            rows = [{f: r.get(f) for f in fields} for r in rows]
+        return {"items": rows, "next_cursor": next_cursor}
+
+    return _cached_json(_dataset_version("Artiklar"), build)
+
+
 @app.get("/public/articles")
 def public_articles():
+    """Hela fliken som list[dict] – eller en sida om någon av PAGE_PARAMS anges."""
     try:
-        return jsonify(_sheet_rows("Artiklar"))
+        if any(p in request.args for p in PAGE_PARAMS):
+            return _paged_articles(request.args)
+        return _rows_response("Artiklar")
     except gspread.WorksheetNotFound:
         return jsonify({"error": "Fliken 'Artiklar' saknas."}), 404
     except Exception as e:
@@ -186,13 +751,36 @@ def public_categories():
     # Stöd både 'Kategorier' (ny) och 'Inställningar' (gammal) som fallback
     for tab in ("Kategorier", "Inställningar"):
         try:
-            return jsonify(_sheet_rows(tab))
+            return _rows_response(tab)
         except gspread.WorksheetNotFound:
             continue
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     return jsonify([])
 
+@app.get("/public/search")
+def public_search():
+    """
+    Ex: /public/search?q=språkmodell&limit=20&category=AI
+    Fritextsök i titel + sammanfattning (SQLite FTS5), bäst träff först.
+    """
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "Parametern q saknas"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Ogiltig limit"}), 400
+    category = request.args.get("category") or None
+    try:
+        # Sökindexet ligger alltid i news_db – versionen tas därifrån oavsett READ_MODEL
+        return _cached_json(
+            _db_version("Artiklar"),
+            lambda: {"query": q, "items": news_db.search(q, limit=limit, category=category)},
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # (Valfritt) Prenumeration – kan lämnas eller tas bort.
 @app.route("/api/subscribe", methods=["POST"])
 def api_subscribe():
@@ -204,24 +792,52 @@ def api_subscribe():
     if not name or not email or not isinstance(cats, list) or not cats:
         return jsonify({"error": "Alla fält är obligatoriska"}), 400
 
-    # Se till att fliken finns
-    try:
-        ws = sh.worksheet("Prenumeranter")
-    except gspread.WorksheetNotFound:
-        ws = sh.add_worksheet(title="Prenumeranter", rows=1, cols=5)
-        ws.append_row(["Namn", "E-post", "Kategorier", "Status", "Token"])
-
-    token = gen_token(16) if gen_token else ""
-    ws.append_row([name, email, ", ".join(cats), "pending", token])
+    # SQLite är facit (unik e-post) – arket speglas i bakgrunden
+    token = gen_token(16) if gen_token else secrets.token_urlsafe(16)
+    sub, confirm_token = news_db.add_subscriber(name, email, ", ".join(cats), token)
+    _subscribers_changed.set()
 
-    if send_confirm and token:
+    # Ny adress eller ändring av en befintlig => bekräftelse (ändringen gäller först då)
+    if send_confirm and confirm_token:
         try:
-            send_confirm(email, token)
+            send_confirm(email, confirm_token)
         except Exception as e:
             print(f"[subscribe] Kunde inte skicka bekräftelse: {e}", file=sys.stderr)
 
     return jsonify({"ok": True})
 
+
+@app.route("/api/confirm")
+def api_confirm():
+    sub = news_db.confirm_subscriber(request.args.get("email", ""), request.args.get("tok", ""))
+    if not sub:
+        return "Ogiltig eller inaktuell länk.", 400
+    _subscribers_changed.set()
+    return "Tack! Din prenumeration på AI-Nyheter är bekräftad.", 200
+
+
+@app.route("/api/unsubscribe")
+def api_unsubscribe():
+    email = request.args.get("email", "")
+    before = news_db.get_subscriber(email) if email else None
+    sub = news_db.unsubscribe(email, request.args.get("tok", ""))
+    if not sub:
+        return "Ogiltig eller inaktuell länk.", 400
+    _subscribers_changed.set()
+    if send_goodbye and before and before["status"] != "unsubscribed":
+        try:
+            send_goodbye(sub["email"])
+        except Exception as e:
+            print(f"[subscribe] Kunde inte skicka avslutsmejl: {e}", file=sys.stderr)
+    return "Du är nu avregistrerad från AI-Nyheter.", 200
+
+# Mätvärden i Prometheus-format (per process)
+@app.route("/metrics")
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Unauthorized\n", 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 # Hälsa/koll
 @app.route("/health")
 def health():
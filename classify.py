@@ -0,0 +1,258 @@
+# classify.py
+"""
+Kategori och relevans för nya poster – innan sammanfattningen kostar tokens
+──────────────────────────────────────────────────────────────────────────
+• features(text)      – gles hashad termvektor {index: vikt} (ord + ordpar)
+• vectorize(items)    – termvektorer för [(id, text)], cachade per artikel-id
+                        (news_db.article_vectors)
+• build(categories)   – Model med en prototyp per kategori: medelvektorn (tf-idf)
+                        av kategorins senaste artiklar + dess nyckelord
+• Model.score(items)  – cosinuslikhet mot alla prototyper för en hel batch
+• assess(items, ...)  – (kategori, relevans, orsak att släppa | None) per post
+
+Termerna hashas till CLASSIFY_DIM dimensioner med sublinjär tf (1 + log tf);
+IDF räknas på exempelartiklarna. Med NumPy (valfritt) byggs prototyperna och
+poängsätts hela batchen med några få vektoroperationer över de glesa
+vektorerna – utan NumPy används en ren Python-väg med samma resultat.
+
+CLASSIFY_MODE (tom = av):
+    score   släpp poster under CLASSIFY_THRESHOLD i sin egen kategori
+    route   dessutom: flytta posten till den bästa kategorin om den slår
+            den egna med minst CLASSIFY_MARGIN
+Kategorier med färre än CLASSIFY_MIN_EXAMPLES artiklar filtreras aldrig
+(prototypen bygger då mest på nyckelorden). CLASSIFY_MAX_ITEMS > 0 släpper
+bara igenom de mest relevanta posterna per körning.
+"""
+
+from __future__ import annotations
+import os, re, sys, math, hashlib
+from array import array
+from collections import Counter
+
+import news_db
+from keywords import fold, compile_keywords
+
+try:
+    import numpy as np
+except ImportError:  # valfritt – ren Python annars
+    np = None
+
+CLASSIFY_MODE         = os.getenv("CLASSIFY_MODE", "").strip().lower()   # "" | "score" | "route"
+CLASSIFY_THRESHOLD    = float(os.getenv("CLASSIFY_THRESHOLD", "0.05"))
+CLASSIFY_MARGIN       = float(os.getenv("CLASSIFY_MARGIN", "0.05"))
+CLASSIFY_MAX_ITEMS    = int(os.getenv("CLASSIFY_MAX_ITEMS", "0"))         # 0 = ingen gräns
+CLASSIFY_EXAMPLES     = int(os.getenv("CLASSIFY_EXAMPLES", "200"))        # exempelartiklar per kategori
+CLASSIFY_MIN_EXAMPLES = int(os.getenv("CLASSIFY_MIN_EXAMPLES", "10"))
+CLASSIFY_DIM          = int(os.getenv("CLASSIFY_DIM", str(2 ** 16)))
+CLASSIFY_CACHE_DAYS   = int(os.getenv("CLASSIFY_CACHE_DAYS", "30"))
+KEYWORD_WEIGHT        = 3.0  # nyckelorden väger som så många exempelartiklar
+
+Vector = dict[int, float]
+
+
+def dbg(msg: str):
+    print("[classify]", msg, file=sys.stderr)
+
+
+# ────────── Termvektorer ──────────
+def _tokens(text: str) -> list[str]:
+    words = re.findall(r"\w+", fold(re.sub(r"<[^>]+>", " ", text or "")))
+    return [w for w in words if len(w) > 1 and not w.isdigit()]
+
+
+def features(text: str) -> Vector:
+    words = _tokens(text)
+    counts = Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+    vec: Vector = {}
+    for term, n in counts.items():
+        h = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=4).digest(), "big") % CLASSIFY_DIM
+        vec[h] = vec.get(h, 0.0) + 1.0 + math.log(n)
+    return vec
+
+
+def _encode(vec: Vector) -> bytes:
+    keys = sorted(vec)
+    return array("I", keys).tobytes() + array("f", (vec[k] for k in keys)).tobytes()
+
+
+def _decode(blob: bytes) -> Vector:
+    half = len(blob) // 2
+    keys, values = array("I"), array("f")
+    keys.frombytes(blob[:half])
+    values.frombytes(blob[half:])
+    return dict(zip(keys, values))
+
+
+def vectorize(items: list[tuple[str, str]]) -> list[Vector]:
+    """Termvektorer för [(artikel-id, text)]; cachade per id, nya sparas."""
+    cached = news_db.get_vectors([i for i, _ in items], CLASSIFY_DIM)
+    out, fresh = [], {}
+    for art_id, text in items:
+        if art_id in cached:
+            out.append(_decode(cached[art_id]))
+            continue
+        vec = fresh.get(art_id) or features(text)
+        fresh[art_id] = vec
+        out.append(vec)
+    news_db.save_vectors([(i, _encode(v)) for i, v in fresh.items()], CLASSIFY_DIM)
+    return out
+
+
+# ────────── Modell ──────────
+def _flatten(vectors: list[Vector]):
+    """Glesa vektorer → (rad, index, vikt) som NumPy-arrayer."""
+    rows = np.repeat(np.arange(len(vectors)), [len(v) for v in vectors])
+    cols = np.fromiter((k for v in vectors for k in v), dtype=np.int64, count=len(rows))
+    vals = np.fromiter((x for v in vectors for x in v.values()), dtype=np.float32, count=len(rows))
+    return rows, cols, vals
+
+
+def _unit(rows, cols, vals, idf, n: int):
+    """tf · idf, normerad per rad (NumPy)."""
+    w = vals * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=w * w, minlength=n))
+    return w / np.maximum(norms, 1e-12)[rows]
+
+
+def _unit_py(vec: Vector, idf: dict[int, float], default: float) -> Vector:
+    w = {k: x * idf.get(k, default) for k, x in vec.items()}
+    norm = math.sqrt(sum(x * x for x in w.values())) or 1.0
+    return {k: x / norm for k, x in w.items()}
+
+
+class Model:
+    """Prototyper per kategori. `examples` = antal exempelartiklar bakom varje prototyp."""
+
+    def __init__(self, categories: list[str], examples: dict[str, int],
+                 docs: list[Vector], doc_cats: list[int], keyword_docs: list[Vector]):
+        self.categories = categories
+        self.examples = examples
+        n = len(docs)
+
+        if np is not None:
+            df = np.zeros(CLASSIFY_DIM, dtype=np.float32)
+            if docs:
+                rows, cols, vals = _flatten(docs)
+                df = np.bincount(cols, minlength=CLASSIFY_DIM).astype(np.float32)
+            self._idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+            protos = np.zeros((len(categories), CLASSIFY_DIM), dtype=np.float32)
+            if docs:
+                np.add.at(protos, (np.asarray(doc_cats)[rows], cols), _unit(rows, cols, vals, self._idf, n))
+            kw = [(c, v) for c, v in enumerate(keyword_docs) if v]
+            if kw:
+                rows, cols, vals = _flatten([v for _, v in kw])
+                cats = np.asarray([c for c, _ in kw])
+                np.add.at(protos, (cats[rows], cols), KEYWORD_WEIGHT * _unit(rows, cols, vals, self._idf, len(kw)))
+            norms = np.linalg.norm(protos, axis=1, keepdims=True)
+            self._protos = protos / np.maximum(norms, 1e-12)
+            return
+
+        df = Counter(k for v in docs for k in v)
+        self._default_idf = math.log(1 + n) + 1
+        self._idf = {k: math.log((1 + n) / (1 + d)) + 1 for k, d in df.items()}
+        protos: list[Vector] = [{} for _ in categories]
+        for vec, c in zip(docs, doc_cats):
+            for k, x in _unit_py(vec, self._idf, self._default_idf).items():
+                protos[c][k] = protos[c].get(k, 0.0) + x
+        for c, vec in enumerate(keyword_docs):
+            for k, x in _unit_py(vec, self._idf, self._default_idf).items():
+                protos[c][k] = protos[c].get(k, 0.0) + KEYWORD_WEIGHT * x
+        self._protos = [_unit_py(p, {}, 1.0) if p else {} for p in protos]
+
+    def trained(self, category: str) -> bool:
+        return self.examples.get(category, 0) >= CLASSIFY_MIN_EXAMPLES
+
+    def score(self, items: list[tuple[str, str]]) -> list[dict[str, float]]:
+        """{kategori: cosinuslikhet} per post i [(artikel-id, text)]."""
+        if not items or not self.categories:
+            return [{} for _ in items]
+        return self.score_vectors(vectorize(items))
+
+    def score_vectors(self, vectors: list[Vector]) -> list[dict[str, float]]:
+        if np is not None:
+            sims = np.zeros((len(vectors), len(self.categories)), dtype=np.float32)
+            if any(vectors):
+                rows, cols, vals = _flatten(vectors)
+                w = _unit(rows, cols, vals, self._idf, len(vectors))
+                np.add.at(sims, rows, (self._protos[:, cols] * w).T)
+            return [dict(zip(self.categories, map(float, s))) for s in sims]
+
+        out = []
+        for vec in vectors:
+            unit = _unit_py(vec, self._idf, self._default_idf)
+            out.append({
+                c: sum(x * p.get(k, 0.0) for k, x in unit.items())
+                for c, p in zip(self.categories, self._protos)
+            })
+        return out
+
+
+_model_cache: tuple | None = None
+
+
+def build(categories: dict[str, str]) -> Model:
+    """Modell för {kategori: nyckelordscell}. Byggs om bara när artiklarna (eller kategorierna) ändrats."""
+    global _model_cache
+    key = (news_db.dataset_version("Artiklar"), tuple(sorted(categories.items())), CLASSIFY_DIM, np is not None)
+    if _model_cache and _model_cache[0] == key:
+        return _model_cache[1]
+
+    if pruned := news_db.prune_vectors(CLASSIFY_CACHE_DAYS):
+        dbg(f"{pruned} gamla vektorer borttagna ur cachen")
+    names = list(categories)
+    index = {c: i for i, c in enumerate(names)}
+    rows = news_db.category_examples(names, CLASSIFY_EXAMPLES)
+    docs = vectorize([(art_id, f"{title} {summary}") for art_id, title, summary, _ in rows])
+    doc_cats = [index[cat] for *_, cat in rows]
+    examples = Counter(cat for *_, cat in rows)
+    keyword_docs = [
+        features(" ".join([c, *compile_keywords(categories[c] or "").names.values()])) for c in names
+    ]
+    model = Model(names, dict(examples), docs, doc_cats, keyword_docs)
+    _model_cache = (key, model)
+    dbg(f"Modell: {len(names)} kategorier, {len(docs)} exempelartiklar" + ("" if np is not None else " (utan NumPy)"))
+    return model
+
+
+def assess(items: list[dict], categories: dict[str, str]) -> list[tuple[str, float, str | None]]:
+    """(kategori, relevans, orsak | None) per post {"id", "text", "category"}.
+
+    Orsak = "low_relevance" (under tröskeln) eller "rank_cutoff" (utanför CLASSIFY_MAX_ITEMS).
+    """
+    model = build(categories)
+    out = []
+    for item, sims in zip(items, model.score([(i["id"], i["text"]) for i in items])):
+        category = item["category"]
+        if CLASSIFY_MODE == "route" and sims:
+            best = max(sims, key=sims.get)
+            if (best != category and model.trained(best) and sims[best] >= CLASSIFY_THRESHOLD
+                    and sims[best] - sims.get(category, 0.0) >= CLASSIFY_MARGIN):
+                category = best
+        relevance = sims.get(category, 0.0)
+        low = model.trained(category) and relevance < CLASSIFY_THRESHOLD
+        out.append([category, relevance, "low_relevance" if low else None])
+
+    if CLASSIFY_MAX_ITEMS > 0:
+        # Kategorier utan tillräckligt med exempel kan inte rangordnas – de går först
+        kept = [i for i, o in enumerate(out) if not o[2]]
+        kept.sort(key=lambda i: -(out[i][1] if model.trained(out[i][0]) else math.inf))
+        for i in kept[CLASSIFY_MAX_ITEMS:]:
+            out[i][2] = "rank_cutoff"
+    return [tuple(o) for o in out]
+
+
+# ────────── Mikrobenchmark ──────────
+if __name__ == "__main__":
+    import time, random
+
+    random.seed(1)
+    vocab = [f"ord{i}" for i in range(5000)]
+    texts = [" ".join(random.choices(vocab, k=60)) for _ in range(500)]
+    started = time.perf_counter()
+    vecs = [features(t) for t in texts]
+    print(f"features: {(time.perf_counter() - started) / len(texts) * 1e6:.0f} µs/post")
+    model = Model([f"k{i}" for i in range(10)], {}, vecs, [i % 10 for i in range(len(vecs))], [{}] * 10)
+    started = time.perf_counter()
+    model.score_vectors(vecs)
+    print(f"score ({'NumPy' if np is not None else 'Python'}, 10 kategorier): "
+          f"{(time.perf_counter() - started) / len(texts) * 1e6:.0f} µs/post")
@@ -0,0 +1,127 @@
+# dedupe.py
+"""
+Dubblettdetektering för nya artiklar
+────────────────────────────────────
+• canonical_url()  – normaliserad URL (utan spårningsparametrar, fragment, www.)
+• simhash()        – 64-bitars SimHash över ord och ordpar i titel + ingress
+• cluster()        – grupperar en körnings nya artiklar i "stories": en
+                     representant per grupp, övriga markeras som dubbletter
+• remember()       – lägger in representanterna i news_db.story_index
+
+Två artiklar räknas som samma story om de har samma kanoniska URL, eller om
+deras SimHash skiljer sig på högst NEAR_DUP_BITS bitar. Hashen delas i fyra
+16-bitarsband (LSH); med ≤ 3 bitars skillnad är minst ett band identiskt,
+så kandidater hittas med indexerade uppslag i stället för en full scan.
+"""
+
+from __future__ import annotations
+import os, re, hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import news_db
+from keywords import fold
+
+NEAR_DUP_BITS     = int(os.getenv("NEAR_DUP_BITS", "3"))
+NEAR_DUP_DAYS     = int(os.getenv("NEAR_DUP_DAYS", "14"))   # hur länge stories jämförs mot
+NEAR_DUP_MIN_WORDS = 5  # kortare texter jämförs bara på URL
+
+# Spårningsparametrar som inte ändrar vilken artikel URL:en pekar på
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid",
+    "ref", "ref_src", "cmpid", "ocid", "source", "_ga",
+}
+
+
+# ────────── URL ──────────
+def canonical_url(url: str) -> str:
+    """Normalisera en artikel-URL så att samma artikel får samma nyckel."""
+    try:
+        parts = urlsplit((url or "").strip())
+    except ValueError:
+        return (url or "").strip()
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme,
+                       host, path, urlencode(query), ""))
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha1(canonical_url(url).encode("utf-8")).hexdigest()
+
+
+# ────────── SimHash ──────────
+def _words(text: str) -> list[str]:
+    return re.findall(r"\w+", fold(re.sub(r"<[^>]+>", " ", text or "")))
+
+
+def simhash(text: str) -> int | None:
+    """64-bitars SimHash (osignerad), eller None om texten är för kort."""
+    words = _words(text)
+    if len(words) < NEAR_DUP_MIN_WORDS:
+        return None
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    weights = [0] * 64
+    for f in features:
+        h = int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def bands(h: int) -> tuple[int, int, int, int]:
+    return tuple((h >> (16 * i)) & 0xFFFF for i in range(4))
+
+
+def _distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# ────────── Kluster ──────────
+def cluster(items: list[dict]) -> list[str | None]:
+    """Gruppera nya artiklar. items: [{"id", "url", "title", "text"}, ...] i prioritetsordning.
+
+    Returnerar per artikel None (representant) eller id för storyn den är dubblett av
+    (en tidigare artikel i samma körning eller en känd story i news_db).
+    """
+    out: list[str | None] = []
+    seen_urls: dict[str, str] = {}
+    seen_hashes: list[tuple[int, str]] = []
+
+    keys = [url_key(it["url"]) for it in items]
+    known_urls = news_db.stories_by_url(keys)
+
+    for it, key in zip(items, keys):
+        it["url_key"] = key
+        it["simhash"] = simhash(f"{it['title']} {it.get('text', '')}")
+
+        dup = seen_urls.get(key) or known_urls.get(key)
+        if not dup and it["simhash"] is not None:
+            h = it["simhash"]
+            dup = next((i for other, i in seen_hashes if _distance(h, other) <= NEAR_DUP_BITS), None)
+            if not dup:
+                for other, i in news_db.story_candidates(bands(h), NEAR_DUP_DAYS):
+                    if _distance(h, other) <= NEAR_DUP_BITS:
+                        dup = i
+                        break
+
+        out.append(dup)
+        if not dup:
+            seen_urls[key] = it["id"]
+            if it["simhash"] is not None:
+                seen_hashes.append((it["simhash"], it["id"]))
+    return out
+
+
+def remember(items: list[dict]) -> None:
+    """Spara representanter (efter cluster()) så att senare körningar känner igen storyn."""
+    rows = [
+        (it["id"], it.get("url_key") or url_key(it["url"]), it.get("simhash"))
+        for it in items
+    ]
+    news_db.add_stories(rows, NEAR_DUP_DAYS)
@@ -0,0 +1,138 @@
+# feed_dates.py
+"""
+Datum för flödesposter
+──────────────────────
+• entry_datetime(entry)  – datetime (UTC) för en feedparser-post, eller None
+• parse_datetime(text)   – datetime (UTC) ur en datumsträng, eller None
+• entry_date(entry)      – ISO 8601 med tidszon ("2025-06-10T04:00:00+00:00"),
+                           med reserv (normalt nu) om posten saknar datum
+
+Snabbaste vägen först:
+  1. feedparsers redan tolkade published_parsed / updated_parsed (struct_time i UTC)
+  2. RFC 822 (RSS pubDate) via email.utils
+  3. ISO 8601 (Atom) via datetime.fromisoformat
+  4. dateutil som sista utväg – cachat per sträng (lru_cache)
+
+Datum utan tidszon tolkas som UTC. Allt lagras i UTC så att strängarna går
+att sortera. Kör `python feed_dates.py` för ett mikrobenchmark mot dateutil.
+"""
+
+from __future__ import annotations
+import re
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+from dateutil.parser import parse as _dateutil_parse
+
+_RFC822 = re.compile(r"^\s*(?:[A-Za-z]{3},?\s+)?\d{1,2}\s+[A-Za-z]{3}")
+_ISO    = re.compile(r"^\s*\d{4}-\d{2}-\d{2}")
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+@lru_cache(maxsize=4096)
+def _fallback(text: str) -> datetime | None:
+    try:
+        return _utc(_dateutil_parse(text))
+    except (ValueError, OverflowError, TypeError):
+        return None
+
+
+def parse_datetime(text: str | None) -> datetime | None:
+    if not text:
+        return None
+    text = text.strip()
+    if _RFC822.match(text):
+        try:
+            return _utc(parsedate_to_datetime(text))
+        except (TypeError, ValueError, IndexError):
+            pass
+    elif _ISO.match(text):
+        iso = text[:-1] + "+00:00" if text.endswith(("Z", "z")) else text
+        try:
+            return _utc(datetime.fromisoformat(iso))
+        except ValueError:
+            pass
+    return _fallback(text)
+
+
+def entry_datetime(entry) -> datetime | None:
+    """Publicerings- (eller uppdaterings-) tid för en feedparser-post."""
+    for key in ("published", "updated"):
+        parsed = entry.get(f"{key}_parsed")
+        if parsed:
+            try:
+                return datetime(*parsed[:6], tzinfo=timezone.utc)
+            except (TypeError, ValueError):
+                pass
+        if entry.get(key):
+            return parse_datetime(entry[key])
+    return None
+
+
+def format_datetime(dt: datetime) -> str:
+    return _utc(dt).isoformat(timespec="seconds")
+
+
+def entry_date(entry, default: datetime | None = None) -> str:
+    """ISO 8601-tid (UTC) för posten; `default` (eller nu) om datum saknas/inte går att tolka."""
+    dt = entry_datetime(entry)
+    return format_datetime(dt or default or datetime.now(timezone.utc))
+
+
+# ────────── Mikrobenchmark ──────────
+# Datumsträngar som de ser ut i verkliga flöden (RSS pubDate, Atom, WordPress, m.fl.)
+SAMPLE_DATES = [
+    "Tue, 10 Jun 2025 04:00:00 GMT",
+    "Tue, 10 Jun 2025 06:15:42 +0200",
+    "Mon, 09 Jun 2025 21:03:11 -0400",
+    "Mon, 9 Jun 2025 18:00:00 EST",
+    "Wed, 04 Jun 2025 12:00:00 +0000",
+    "10 Jun 2025 08:30:00 +0100",
+    "Fri, 06 Jun 2025 14:22:05 UT",
+    "2025-06-10T04:00:00Z",
+    "2025-06-10T06:15:42+02:00",
+    "2025-06-09T21:03:11.123456-04:00",
+    "2025-06-10T08:30:00.000Z",
+    "2025-06-10 09:00:00",
+    "2025-06-10",
+    "June 10, 2025",
+    "Tue, 10 Jun 2025 04:00:00 CEST",
+]
+
+
+def _benchmark(rounds: int = 2000) -> None:
+    import time
+
+    for text in SAMPLE_DATES:
+        ours, ref = parse_datetime(text), _utc(_dateutil_parse(text))
+        flag = "" if ours == ref else "   (skiljer sig från dateutil)"
+        print(f"  {text:<36} → {format_datetime(ours) if ours else None}{flag}")
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in SAMPLE_DATES:
+            _dateutil_parse(text)
+    slow = time.perf_counter() - started
+
+    # Tom cache varje varv – annars mäts bara lru_cache-träffar för reservsträngarna
+    fast = 0.0
+    for _ in range(rounds):
+        _fallback.cache_clear()
+        started = time.perf_counter()
+        for text in SAMPLE_DATES:
+            parse_datetime(text)
+        fast += time.perf_counter() - started
+
+    n = rounds * len(SAMPLE_DATES)
+    print(f"\n{n} strängar: dateutil {slow / n * 1e6:.1f} µs/st, feed_dates {fast / n * 1e6:.1f} µs/st"
+          f" ({slow / fast:.1f}× snabbare, utan cacheträffar)")
+
+
+if __name__ == "__main__":
+    import warnings
+    warnings.simplefilter("ignore")  # dateutil varnar för okända tidszonsnamn (CEST)
+    _benchmark()
@@ -0,0 +1,120 @@
+# feed_fetch.py
+"""
+Hämtsteg för RSS-jobben
+───────────────────────
+• download_feeds()  – laddar ner många flöden parallellt
+                      (begränsad trådpool, max samtidiga anrop per värd,
+                      total timeout per flöde)
+• parse_feed()      – kör feedparser på redan nedladdade bytes
+
+Med sparade validatorer (news_db.feed_states) skickas villkorliga anrop
+(If-None-Match / If-Modified-Since). Svar 304, eller en kropp med samma
+hash som förra gången, markeras som `unchanged` och behöver inte parsas.
+
+Nedladdningen sker först för alla flöden, sedan parsas de i ursprunglig
+ordning – så raderna som skrivs blir deterministiska oavsett vilket flöde
+som svarade först.
+"""
+
+from __future__ import annotations
+import os, time, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import feedparser
+import httpx
+
+from metrics import profile_thread
+
+# ────────── Konfiguration ──────────
+FETCH_WORKERS  = int(os.getenv("FETCH_WORKERS", "16"))
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "2"))
+FETCH_TIMEOUT  = float(os.getenv("FETCH_TIMEOUT", "20"))   # sekunder, totalt per flöde
+USER_AGENT     = os.getenv("FETCH_USER_AGENT", "AI-Nyheter/1.0 (+https://andersasplundberggren.github.io)")
+
+_host_slots: dict[str, threading.BoundedSemaphore] = {}
+_host_guard = threading.Lock()
+
+
+# ────────── Hjälpare ──────────
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    """Semafor per värd så att vi inte öppnar för många anslutningar mot samma sajt."""
+    host = urlparse(url).netloc.lower()
+    with _host_guard:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(FETCH_PER_HOST)
+    return slot
+
+
+def _download(client: httpx.Client, url: str, state: dict | None = None) -> dict:
+    """Hämta ett flöde. Fel returneras i resultatet i stället för att kastas."""
+    result = {
+        "url": url, "status": None, "body": None, "headers": {}, "error": None, "elapsed": 0.0,
+        "etag": None, "last_modified": None, "content_hash": None, "unchanged": False,
+    }
+    state = state or {}
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+
+    with _host_slot(url):
+        start = time.monotonic()
+        deadline = start + FETCH_TIMEOUT
+        try:
+            with client.stream("GET", url, headers=headers) as resp:
+                chunks = []
+                for chunk in resp.iter_bytes():
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"timeout efter {FETCH_TIMEOUT:.0f}s")
+                    chunks.append(chunk)
+                result["status"] = resp.status_code
+                result["headers"] = {k.lower(): v for k, v in resp.headers.items()}
+                result["headers"]["content-location"] = str(resp.url)
+                result["etag"] = resp.headers.get("etag")
+                result["last_modified"] = resp.headers.get("last-modified")
+                if resp.status_code == 304:
+                    result["unchanged"] = True
+                elif resp.status_code >= 400:
+                    result["error"] = f"HTTP {resp.status_code}"
+                else:
+                    body = b"".join(chunks)
+                    result["body"] = body
+                    result["content_hash"] = hashlib.sha1(body).hexdigest()
+                    result["unchanged"] = result["content_hash"] == state.get("content_hash")
+        except Exception as e:
+            result["error"] = str(e) or e.__class__.__name__
+        result["elapsed"] = time.monotonic() - start
+    return result
+
+
+# ────────── Publikt API ──────────
+def download_feeds(urls: list[str], states: dict[str, dict] | None = None) -> dict[str, dict]:
+    """Ladda ner alla flöden parallellt. Returnerar {url: resultat}.
+
+    Samma URL hämtas bara en gång även om den förekommer i flera kategorier.
+    `states` är sparade validatorer per URL; utelämnas de görs vanliga GET.
+    """
+    states = states or {}
+    unique = list(dict.fromkeys(urls))
+    if not unique:
+        return {}
+
+    timeout = httpx.Timeout(FETCH_TIMEOUT, connect=min(FETCH_TIMEOUT, 10.0))
+    limits  = httpx.Limits(max_connections=FETCH_WORKERS, max_keepalive_connections=FETCH_WORKERS)
+    with httpx.Client(
+        timeout=timeout,
+        limits=limits,
+        follow_redirects=True,
+        headers={"User-Agent": USER_AGENT},
+    ) as client, ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(unique))) as pool:
+        results = list(pool.map(profile_thread(lambda u: _download(client, u, states.get(u))), unique))
+
+    return dict(zip(unique, results))
+
+
+def parse_feed(result: dict):
+    """Parsa ett nedladdat flöde med feedparser (utan ny nätverkstrafik)."""
+    return feedparser.parse(result["body"], response_headers=result["headers"])
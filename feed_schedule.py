@@ -0,0 +1,116 @@
+# feed_schedule.py
+"""
+Adaptivt hämtschema per flöde
+─────────────────────────────
+• plan()     – vilka flöden som ska hämtas nu (next_poll passerat eller force)
+• observe()  – ny hälsa för ett flöde efter en hämtning
+• record()   – spara hälsa + nästa hämttid i news_db.feed_state
+
+Per flöde sparas: antal hämtningar, fel i rad, svarstid och publiceringstakt
+(nya poster per dygn) som glidande medel. Nästa hämtning beräknas så här:
+
+    fel i rad      FEED_POLL_DEFAULT · 2^(fel-1), högst FEED_POLL_FAIL_MAX
+    okänd takt     FEED_POLL_DEFAULT
+    annars         FEED_TARGET_ITEMS / takt, inom [FEED_POLL_MIN, FEED_POLL_MAX]
+
+(±10 % slump så att flödena inte klumpar ihop sig). Ett flöde räknas som
+förfallet FEED_DUE_SLACK sekunder i förväg, så att timvisa körningar inte
+missar flöden som ska hämtas "om en minut".
+"""
+
+from __future__ import annotations
+import os, time, random
+
+import news_db
+
+FEED_POLL_MIN      = float(os.getenv("FEED_POLL_MIN", "900"))          # 15 min
+FEED_POLL_DEFAULT  = float(os.getenv("FEED_POLL_DEFAULT", "3600"))     # 1 h
+FEED_POLL_MAX      = float(os.getenv("FEED_POLL_MAX", "86400"))        # 1 dygn
+FEED_POLL_FAIL_MAX = float(os.getenv("FEED_POLL_FAIL_MAX", "604800"))  # 1 vecka
+FEED_TARGET_ITEMS  = float(os.getenv("FEED_TARGET_ITEMS", "3"))        # nya poster per hämtning
+FEED_DUE_SLACK     = float(os.getenv("FEED_DUE_SLACK", "600"))
+
+RATE_WINDOW = 7 * 86400  # sek bakåt som räknas vid takt från postdatum
+EWMA_ALPHA  = 0.3
+DAY = 86400.0
+
+
+def plan(urls: list[str], force: bool = False, now: float | None = None) -> tuple[list[str], dict[str, float]]:
+    """(flöden att hämta nu, {url: next_poll} för flöden som inte är förfallna)."""
+    if force:
+        return list(urls), {}
+    now = time.time() if now is None else now
+    health = news_db.feed_health(urls)
+    due, later = [], {}
+    for url in urls:
+        next_poll = (health.get(url) or {}).get("next_poll")
+        if next_poll is None or next_poll <= now + FEED_DUE_SLACK:
+            due.append(url)
+        else:
+            later[url] = next_poll
+    return due, later
+
+
+def publication_rate(timestamps: list[float], now: float) -> float | None:
+    """Poster per dygn utifrån postdatum i flödet, eller None om datum saknas."""
+    if not timestamps:
+        return None
+    recent = sorted(t for t in timestamps if now - RATE_WINDOW <= t <= now + 3600)
+    if len(recent) >= 2 and len(recent) == len(timestamps):
+        # Hela flödet ligger inom fönstret – flödet är kapat, mät över det spann som syns
+        return (len(recent) - 1) / max(recent[-1] - recent[0], 3600.0) * DAY
+    return len(recent) / RATE_WINDOW * DAY
+
+
+def next_interval(failures: int, rate: float | None) -> float:
+    if failures:
+        interval = min(FEED_POLL_FAIL_MAX, FEED_POLL_DEFAULT * 2 ** (failures - 1))
+    elif not rate:
+        interval = FEED_POLL_DEFAULT if rate is None else FEED_POLL_MAX
+    else:
+        interval = min(FEED_POLL_MAX, max(FEED_POLL_MIN, FEED_TARGET_ITEMS / rate * DAY))
+    return interval * random.uniform(0.9, 1.1)
+
+
+def _ewma(old: float | None, value: float) -> float:
+    return value if old is None else old + EWMA_ALPHA * (value - old)
+
+
+def observe(result: dict, old: dict | None, timestamps: list[float] | None, now: float) -> dict:
+    """Ny hälsa för ett flöde. `timestamps` = postdatum (epoch) om flödet parsades."""
+    old = old or {}
+    row = {
+        "url": result["url"],
+        "polls": (old.get("polls") or 0) + 1,
+        "avg_latency": old.get("avg_latency"),
+        "rate": old.get("rate"),
+        "last_success": old.get("last_success"),
+        "last_error": None,
+        "failures": 0,
+    }
+    if result.get("error"):
+        row["failures"] = (old.get("failures") or 0) + 1
+        row["last_error"] = str(result["error"])[:500]
+    else:
+        row["avg_latency"] = _ewma(old.get("avg_latency"), result.get("elapsed") or 0.0)
+        if result.get("unchanged"):
+            observed = 0.0  # inget nytt sedan förra gången
+        else:
+            observed = publication_rate(timestamps or [], now)
+            if observed is None:
+                # Inga datum i flödet – räkna en ändring sedan förra hämtningen som en ny post
+                since = now - (old.get("last_success") or now - FEED_POLL_DEFAULT)
+                observed = DAY / max(since, 60.0)
+        row["rate"] = _ewma(old.get("rate"), observed)
+        row["last_success"] = now
+    row["next_poll"] = now + next_interval(row["failures"], row["rate"])
+    return row
+
+
+def record(results: list[dict], timestamps: dict[str, list[float]], now: float | None = None) -> list[dict]:
+    """Uppdatera hälsa för alla hämtade flöden. Returnerar de sparade raderna."""
+    now = time.time() if now is None else now
+    old = news_db.feed_health([r["url"] for r in results])
+    rows = [observe(r, old.get(r["url"]), timestamps.get(r["url"]), now) for r in results]
+    news_db.save_feed_health(rows)
+    return rows
@@ -0,0 +1,199 @@
+# jobs.py
+"""
+Bakgrundsjobb (t.ex. RSS-hämtning) med single-flight och avbrytning
+───────────────────────────────────────────────────────────────────
+• submit(kind, fn)    – lägg ett jobb i kö; pågår redan ett jobb av samma typ
+                        (i någon process) returneras det i stället
+• get(job_id)         – status, progress, resultat / fel
+• cancel(job_id)      – begär avbrytning; jobbet avslutas vid nästa check()
+• exclusive(kind)     – ta jobblåset direkt (t.ex. vid körning från kommandoraden)
+• Job                 – skickas till jobbfunktionen: .progress(**räknare), .check()
+
+Jobben körs ett i taget av en worker-tråd per process. Själva körningen
+skyddas både av ett processlås och av ett lås i SQLite (news_db.leases) som
+förnyas av en heartbeat-tråd – så två gunicorn-workers kör aldrig samma typ
+av jobb samtidigt. Ett jobb vars process dött (ingen heartbeat på
+JOB_LEASE_TTL sekunder) markeras som failed vid nästa submit.
+
+Status: queued → running → done | failed | cancelled
+"""
+
+from __future__ import annotations
+import os, sys, time, uuid, queue, socket, threading, contextlib
+from collections import defaultdict
+
+import news_db
+
+JOB_LEASE_TTL = float(os.getenv("JOB_LEASE_TTL", "120"))  # sek utan heartbeat innan låset släpps
+PROGRESS_INTERVAL = 1.0  # sek mellan progress-skrivningar (och koll av avbrytning)
+
+
+def dbg(msg: str):
+    print("[jobs]", msg, file=sys.stderr)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """Handtag för en pågående körning. Räknare sparas i news_db.jobs.progress."""
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.counters: dict = {}
+        self.cancelled = False
+        self._written = 0.0
+
+    def progress(self, force: bool = False, **counters) -> None:
+        self.counters.update(counters)
+        now = time.monotonic()
+        if force or now - self._written >= PROGRESS_INTERVAL:
+            self._written = now
+            if news_db.update_job_progress(self.id, self.counters):
+                self.cancelled = True
+
+    def check(self) -> None:
+        """Avbrytningspunkt: kastar JobCancelled om någon begärt avbrytning."""
+        self.progress()
+        if self.cancelled:
+            raise JobCancelled(self.id)
+
+
+class _NoJob:
+    """Används när jobbfunktionen körs utanför jobbsystemet (t.ex. från CLI)."""
+
+    id = None
+
+    def progress(self, force: bool = False, **counters) -> None:
+        pass
+
+    def check(self) -> None:
+        pass
+
+
+NO_JOB = _NoJob()
+
+
+# ────────── Lås ──────────
+_process_locks: dict[str, threading.Lock] = defaultdict(threading.Lock)
+_held: set[str] = set()  # lease-namn som processen håller (förnyas av heartbeat)
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@contextlib.contextmanager
+def exclusive(kind: str, job: Job | _NoJob = NO_JOB, poll: float = 2.0):
+    """Vänta tills jobblåset för `kind` är vårt (i processen och i SQLite)."""
+    news_db.init()
+    name = f"job:{kind}"
+    lock = _process_locks[kind]
+    while not lock.acquire(timeout=poll):
+        job.check()
+    try:
+        waited = False
+        while not news_db.acquire_lease(name, _owner(), JOB_LEASE_TTL, time.time()):
+            if not waited:
+                dbg(f"Väntar på låset '{name}' (hålls av en annan process)")
+                job.progress(force=True, stage="väntar på lås")
+                waited = True
+            job.check()
+            time.sleep(poll)
+        _held.add(name)
+        _ensure_threads()
+        try:
+            yield
+        finally:
+            _held.discard(name)
+            news_db.release_lease(name, _owner())
+    finally:
+        lock.release()
+
+
+# ────────── Kö + trådar ──────────
+_queue: queue.Queue = queue.Queue()
+_threads_pid = None
+_threads_lock = threading.Lock()
+
+
+def _ensure_threads() -> None:
+    """Starta worker och heartbeat (en gång per process – även efter fork)."""
+    global _threads_pid
+    with _threads_lock:
+        if _threads_pid == os.getpid():
+            return
+        _threads_pid = os.getpid()
+        threading.Thread(target=_worker, daemon=True).start()
+        threading.Thread(target=_heartbeat, daemon=True).start()
+
+
+def _heartbeat() -> None:
+    while True:
+        time.sleep(JOB_LEASE_TTL / 3)
+        now = time.time()
+        try:
+            news_db.heartbeat_jobs(_owner(), now)
+            for name in list(_held):
+                news_db.acquire_lease(name, _owner(), JOB_LEASE_TTL, now)
+        except Exception as e:
+            dbg(f"heartbeat-fel: {e}")
+
+
+def _worker() -> None:
+    while True:
+        job_id, kind, fn = _queue.get()
+        try:
+            _run(job_id, kind, fn)
+        except Exception as e:  # t.ex. databasfel – workern ska aldrig dö
+            dbg(f"{kind} {job_id}: oväntat fel i worker: {e}")
+
+
+def _run(job_id: str, kind: str, fn) -> None:
+    if not news_db.start_job(job_id):
+        dbg(f"{kind} {job_id}: avbrutet innan start")
+        return
+    job = Job(job_id)
+    started = time.monotonic()
+    try:
+        with exclusive(kind, job):
+            result = fn(job)
+    except JobCancelled:
+        news_db.finish_job(job_id, "cancelled", job.counters)
+        dbg(f"{kind} {job_id}: avbrutet efter {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        news_db.finish_job(job_id, "failed", job.counters, error=str(e))
+        dbg(f"{kind} {job_id}: fel: {e}")
+    else:
+        news_db.finish_job(job_id, "done", job.counters, result=result)
+        dbg(f"{kind} {job_id}: klart på {time.monotonic() - started:.1f}s")
+
+
+# ────────── Publikt API ──────────
+def submit(kind: str, fn) -> tuple[str, bool]:
+    """Köa fn(job) som ett jobb av typen `kind`. Returnerar (jobb-id, nytt jobb?).
+
+    Finns redan ett köat eller pågående jobb av samma typ slås anropet ihop med det.
+    """
+    news_db.init()
+    now = time.time()
+    if stale := news_db.fail_stale_jobs(kind, now - JOB_LEASE_TTL):
+        dbg(f"{stale} övergivna '{kind}'-jobb markerade som failed")
+    job_id, created = news_db.create_job(uuid.uuid4().hex[:16], kind, _owner(), now)
+    if created:
+        _ensure_threads()
+        _queue.put((job_id, kind, fn))
+    return job_id, created
+
+
+def get(job_id: str) -> dict | None:
+    return news_db.get_job(job_id)
+
+
+def recent(limit: int = 20) -> list[dict]:
+    return news_db.recent_jobs(limit)
+
+
+def cancel(job_id: str) -> bool:
+    return news_db.request_job_cancel(job_id)
@@ -0,0 +1,101 @@
+# keywords.py
+"""
+Nyckelordsfilter per kategori
+─────────────────────────────
+• compile_keywords()  – kompilerar en 'Nyckelord'-cell en gång (cachas)
+• KeywordMatcher      – .match(title, summary) → (släpps igenom?, matchade nyckelord)
+
+Syntax i cellen (separerade med , eller ;):
+    robot        delsträng, som tidigare ("robot" matchar "robotar", "vårdrobot")
+    "ai"         helt ord (matchar "AI" och "AI-verktyg", men inte "said")
+    -krypto      negativt: artiklar som matchar stoppas (även !krypto)
+
+Matchningen är skiftlägesokänslig och ignorerar diakriter (é = e, å = a),
+och alla nyckelord slås ihop till ett trie-byggt reguljärt uttryck – så
+kostnaden växer med textens längd, inte med antalet nyckelord.
+"""
+
+from __future__ import annotations
+import re, unicodedata
+from functools import lru_cache
+
+
+def fold(text: str) -> str:
+    """Gemener, utan diakriter och med enkla mellanslag."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def _trie_pattern(words: list[str]) -> str:
+    """Bygg ett regex-mönster ur ett prefixträd – längsta träff prioriteras."""
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+def _compile(words: list[str], whole: list[str]) -> re.Pattern | None:
+    parts = []
+    if words:
+        parts.append(_trie_pattern(words))
+    if whole:
+        parts.append(r"(?<!\w)" + _trie_pattern(whole) + r"(?!\w)")
+    if not parts:
+        return None
+    # Lookahead med grupp → hittar nyckelord som överlappar (t.ex. "ai" i "openai")
+    return re.compile("(?=(" + "|".join(parts) + "))")
+
+
+class KeywordMatcher:
+    def __init__(self, keywords_str: str):
+        pos, pos_whole, neg, neg_whole = [], [], [], []
+        self.names: dict[str, str] = {}  # vikt form → nyckelord som det skrevs i cellen
+        for raw in re.split(r"[,;\n]+", keywords_str or ""):
+            kw = raw.strip()
+            negative = kw[:1] in ("-", "!")
+            if negative:
+                kw = kw[1:].strip()
+            whole = len(kw) > 1 and kw[0] == kw[-1] == '"'
+            if whole:
+                kw = kw[1:-1].strip()
+            folded = fold(kw)
+            if not folded:
+                continue
+            target = (neg_whole if whole else neg) if negative else (pos_whole if whole else pos)
+            target.append(folded)
+            if not negative:
+                self.names.setdefault(folded, " ".join(kw.split()))
+
+        self.has_positive = bool(pos or pos_whole)
+        self._positive = _compile(pos, pos_whole)
+        self._negative = _compile(neg, neg_whole)
+
+    def match(self, title: str, summary: str = "") -> tuple[bool, list[str]]:
+        """(True, [matchade nyckelord]) om artikeln ska med. Utan positiva nyckelord släpps allt igenom."""
+        text = fold(f"{title} {summary}")
+        if self._negative and self._negative.search(text):
+            return False, []
+        if not self._positive:
+            return True, []
+        found = dict.fromkeys(self.names.get(m.group(1), m.group(1)) for m in self._positive.finditer(text))
+        return bool(found), list(found)
+
+
+@lru_cache(maxsize=256)
+def compile_keywords(keywords_str: str) -> KeywordMatcher:
+    return KeywordMatcher(keywords_str)
@@ -0,0 +1,365 @@
+# metrics.py
+"""
+Mätvärden och körrapporter för hämtningsjobbet
+──────────────────────────────────────────────
+• Counter / Gauge / Histogram – enkla mätare med etiketter, i processens minne
+• render()                    – alla mätare i Prometheus textformat (app.py: /metrics)
+• RunReport                   – tider per steg, statistik per flöde, bortfall per
+                                orsak och OpenAI-tokens/kostnad för en körning;
+                                skrivs som JSON i RUN_REPORT_DIR
+• profiled()                  – valfri profilering av en körning (cProfile eller
+                                pyinstrument om det är installerat)
+• profile_thread(fn)          – låt poolens trådar ingå i en pågående cProfile-körning
+                                (före Python 3.12)
+
+Mätarna är per process: med flera gunicorn-workers syns en körning i den
+worker som körde jobbet. Körrapporterna på disk är gemensamma.
+"""
+
+from __future__ import annotations
+import os, io, sys, json, time, pstats, cProfile, pathlib, threading, contextlib
+from datetime import datetime, timezone
+
+RUN_REPORT_DIR  = pathlib.Path(os.getenv("RUN_REPORT_DIR", "run_reports"))
+RUN_REPORT_KEEP = int(os.getenv("RUN_REPORT_KEEP", "50"))  # antal rapporter/profiler som sparas
+# OpenAI-pris i USD per miljon tokens (standard: gpt-4o-mini)
+OPENAI_PRICE_PROMPT     = float(os.getenv("OPENAI_PRICE_PROMPT", "0.15"))
+OPENAI_PRICE_COMPLETION = float(os.getenv("OPENAI_PRICE_COMPLETION", "0.60"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry: list["_Metric"] = []
+
+
+def dbg(msg: str):
+    print("[metrics]", msg, file=sys.stderr)
+
+
+# ────────── Mätare ──────────
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labels
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self):
+        """(suffix, etiketter, värde) för render()."""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", dict(zip(self.labelnames, key)), value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for _, labels, (counts, total, n) in super().samples():
+            for bound, c in zip(self.buckets, counts):
+                yield "_bucket", {**labels, "le": _num(bound)}, c
+            yield "_bucket", {**labels, "le": "+Inf"}, n
+            yield "_sum", labels, round(total, 6)
+            yield "_count", labels, n
+
+
+def _num(v: float) -> str:
+    return repr(float(v))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render() -> str:
+    """Alla mätare i Prometheus textformat (version 0.0.4)."""
+    out = []
+    for m in _registry:
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        for suffix, labels, value in m.samples():
+            lbl = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+            out.append(f"{m.name}{suffix}{{{lbl}}} {value}" if lbl else f"{m.name}{suffix} {value}")
+    return "\n".join(out) + "\n"
+
+
+# ────────── Mätare för hämtningen ──────────
+STAGE_SECONDS = Histogram(
+    "ingest_stage_seconds", "Tid per steg i fetch_and_append", ("stage",),
+)
+FEED_FETCH_SECONDS = Histogram(
+    "ingest_feed_fetch_seconds", "Nedladdningstid per flöde", ("feed",),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+FEED_FETCHES = Counter(
+    "ingest_feed_fetches_total", "Hämtningar per flöde och utfall (ok, unchanged, error, parse_error, not_due)",
+    ("feed", "outcome"),
+)
+ITEMS_ADDED = Counter("ingest_items_added_total", "Nya artiklar per flöde", ("feed",))
+ITEMS_DROPPED = Counter(
+    "ingest_items_dropped_total", "Poster som inte blev artiklar, per orsak", ("reason",),
+)
+RUNS = Counter("ingest_runs_total", "Körningar per utfall", ("status",))
+LAST_RUN = Gauge("ingest_last_run_timestamp_seconds", "Sluttid för senaste körning (epoch)")
+LAST_RUN_SECONDS = Gauge("ingest_last_run_duration_seconds", "Längd på senaste körning")
+
+OPENAI_TOKENS = Counter("openai_tokens_total", "Förbrukade OpenAI-tokens", ("kind",))
+OPENAI_REQUESTS = Counter(
+    "openai_requests_total", "OpenAI-anrop per utfall (ok, retry, error)", ("outcome",),
+)
+OPENAI_SECONDS = Histogram("openai_request_seconds", "Svarstid per OpenAI-anrop")
+CLASSIFY_RELEVANCE = Histogram(
+    "classify_relevance", "Relevans (cosinuslikhet) mot postens kategori, classify.py",
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5),
+)
+SUMMARY_CACHE = Counter(
+    "summary_cache_lookups_total", "Uppslag i sammanfattningscachen", ("result",),
+)
+
+
+# ────────── Körrapport ──────────
+class RunReport:
+    """Samlar statistik för en körning; finish() skriver JSON och uppdaterar mätarna."""
+
+    def __init__(self, name: str = "fetch"):
+        self.name = name
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.feeds: dict[str, dict] = {}
+        self.dropped: dict[str, int] = {}
+        self.profile: dict | None = None
+        self._tokens_before = {k: OPENAI_TOKENS.value(kind=k) for k in ("prompt", "completion")}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Tid för ett steg; flera anrop med samma namn summeras."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def feed(self, url: str, **fields) -> dict:
+        stats = self.feeds.setdefault(url, {"added": 0, "dropped": {}})
+        stats.update(fields)
+        return stats
+
+    def fetched(self, result: dict, outcome: str) -> None:
+        url = result["url"]
+        self.feed(url, outcome=outcome, status=result.get("status"),
+                  fetch_seconds=round(result.get("elapsed") or 0.0, 3),
+                  bytes=len(result.get("body") or b""))
+        FEED_FETCHES.inc(feed=url, outcome=outcome)
+        if result.get("elapsed") is not None:
+            FEED_FETCH_SECONDS.observe(result["elapsed"], feed=url)
+
+    def skipped(self, url: str, outcome: str = "not_due", **fields) -> None:
+        self.feed(url, outcome=outcome, **fields)
+        FEED_FETCHES.inc(feed=url, outcome=outcome)
+
+    def added(self, url: str, n: int = 1) -> None:
+        self.feed(url)["added"] += n
+        ITEMS_ADDED.inc(n, feed=url)
+
+    def drop(self, reason: str, url: str | None = None, n: int = 1) -> None:
+        self.dropped[reason] = self.dropped.get(reason, 0) + n
+        if url:
+            per_feed = self.feed(url)["dropped"]
+            per_feed[reason] = per_feed.get(reason, 0) + n
+        ITEMS_DROPPED.inc(n, reason=reason)
+
+    def finish(self, status: str = "ok", **totals) -> dict:
+        duration = time.perf_counter() - self._started
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+        RUNS.inc(status=status)
+        LAST_RUN.set(time.time())
+        LAST_RUN_SECONDS.set(duration)
+
+        tokens = {k: int(OPENAI_TOKENS.value(kind=k) - v) for k, v in self._tokens_before.items()}
+        report = {
+            "name": self.name,
+            "status": status,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_seconds": round(duration, 3),
+            "totals": totals,
+            "stages": {k: round(v, 3) for k, v in sorted(self.stages.items(), key=lambda kv: -kv[1])},
+            "dropped": self.dropped,
+            "openai_tokens": tokens,
+            "openai_cost_usd": round(openai_cost(**tokens), 6),
+            "feeds": self.feeds,
+            "profile": self.profile,
+        }
+        try:
+            path = _report_path(self.name, self.started_at, ".json")
+            path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+            report["path"] = str(path)
+            _prune()
+        except OSError as e:
+            dbg(f"Kunde inte skriva körrapport: {e}")
+        return report
+
+
+def openai_cost(prompt: int = 0, completion: int = 0) -> float:
+    """Uppskattad OpenAI-kostnad i USD (OPENAI_PRICE_PROMPT / OPENAI_PRICE_COMPLETION)."""
+    return (prompt * OPENAI_PRICE_PROMPT + completion * OPENAI_PRICE_COMPLETION) / 1_000_000
+
+
+def _report_path(name: str, started: datetime, suffix: str) -> pathlib.Path:
+    RUN_REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    return RUN_REPORT_DIR / f"{name}-{started.strftime('%Y%m%dT%H%M%S')}{suffix}"
+
+
+def _prune() -> None:
+    for suffix in ("*.json", "*.prof", "*.html"):
+        files = sorted(RUN_REPORT_DIR.glob(suffix))
+        for old in files[:-RUN_REPORT_KEEP]:
+            old.unlink(missing_ok=True)
+
+
+def latest_report(name: str = "fetch") -> dict | None:
+    files = sorted(RUN_REPORT_DIR.glob(f"{name}-*.json"))
+    if not files:
+        return None
+    return json.loads(files[-1].read_text(encoding="utf-8"))
+
+
+# ────────── Profilering ──────────
+# cProfile ser bara tråden som anropar enable(), men nedladdningar och
+# sammanfattningar körs i ThreadPoolExecutor-trådar. Under en cProfile-körning
+# profilerar profile_thread() varje uppgift i sin egen tråd och lägger profilen
+# här; profiled() slår ihop dem med huvudtrådens innan rapporten skrivs.
+# Från Python 3.12 bygger cProfile på sys.monitoring, som delas av alla trådar:
+# bara en profilerare får vara aktiv, så där profileras bara huvudtråden.
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+_worker_profiles: list[cProfile.Profile] | None = None
+_worker_lock = threading.Lock()
+
+
+def profile_thread(fn):
+    """Omslag för funktioner som körs i en trådpool (pool.map(profile_thread(f), ...))."""
+    def run(*args, **kwargs):
+        if _worker_profiles is None:
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # en annan profilerare är redan aktiv (sys.monitoring)
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with _worker_lock:
+                if _worker_profiles is not None:
+                    _worker_profiles.append(profiler)
+    return run
+
+
+@contextlib.contextmanager
+def profiled(mode: str | None, report: RunReport):
+    """Profilera blocket med mode = "cprofile" | "pyinstrument" (None/"" = av).
+
+    Resultatet sparas bredvid körrapporten och sökvägen hamnar i report.profile.
+    Med cprofile ingår även trådpoolsuppgifter som körs via profile_thread() –
+    men bara före Python 3.12; från 3.12 (och med pyinstrument, som bara samplar
+    den anropande tråden) saknas poolarbetet och syns som väntan i pool.map.
+    """
+    mode = (mode or "").strip().lower()
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            dbg("pyinstrument är inte installerat – använder cProfile")
+            mode = "cprofile"
+    if mode not in ("cprofile", "pyinstrument"):
+        if mode:
+            dbg(f"Okänt profileringsläge '{mode}' – profilerar inte")
+        yield
+        return
+
+    if mode == "pyinstrument":
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            path = _report_path(report.name, report.started_at, ".html")
+            path.write_text(profiler.output_html(), encoding="utf-8")
+            report.profile = {"mode": mode, "path": str(path)}
+        return
+
+    global _worker_profiles
+    profiler = cProfile.Profile()
+    with _worker_lock:
+        _worker_profiles = [] if PER_THREAD_PROFILES else None
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _worker_lock:
+            workers, _worker_profiles = _worker_profiles or [], None
+        buf = io.StringIO()
+        stats = pstats.Stats(profiler, stream=buf)
+        for p in workers:
+            stats.add(p)
+        path = _report_path(report.name, report.started_at, ".prof")
+        stats.dump_stats(str(path))
+        stats.sort_stats("cumulative").print_stats(25)
+        report.profile = {"mode": mode, "path": str(path), "threads": 1 + len(workers),
+                          "top": buf.getvalue().splitlines()}
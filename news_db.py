@@ -1,65 +1,527 @@
 # news_db.py
-import sqlite3, contextlib, pathlib, sys
+import os, re, html, sqlite3, contextlib, pathlib, sys, json, hashlib, threading
 from datetime import datetime, timedelta
 
-DB_PATH = pathlib.Path("news.sqlite")
+DB_PATH = pathlib.Path(os.getenv("NEWS_DB_PATH", "news.sqlite"))
 
+# Pragmas som sätts på varje ny anslutning (WAL: läsare blockerar inte skrivare)
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+)
 
-def init() -> None:
-    """Skapar tabell + migrerar vid behov."""
-    with connect() as con:
+_local = threading.local()
+
+
+# ────────── Schema / migreringar ──────────
+# Varje migrering körs en gång; versionen sparas i PRAGMA user_version.
+# Stegen är idempotenta så att databaser från före versionsnumreringen
+# (user_version = 0 men tabeller finns) kan uppgraderas säkert.
+def _add_column(con, table: str, column: str, decl: str) -> None:
+    cols = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _v1_articles(con):
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS articles (
+          id          TEXT PRIMARY KEY,
+          title       TEXT,
+          url         TEXT UNIQUE,
+          date        TEXT,
+          summary     TEXT,
+          category    TEXT,
+          paywall     INTEGER DEFAULT 0,
+          import_date TEXT
+        )
+        """
+    )
+    _add_column(con, "articles", "paywall", "INTEGER DEFAULT 0")
+    _add_column(con, "articles", "import_date", "TEXT")
+
+
+def _v2_feed_state(con):
+    # Validatorer per flöde (villkorlig GET mellan körningar)
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS feed_state (
+          url           TEXT PRIMARY KEY,
+          etag          TEXT,
+          last_modified TEXT,
+          content_hash  TEXT,
+          last_fetch    TEXT
+        )
+        """
+    )
+
+
+def _v3_summary_cache(con):
+    # Sammanfattningscache (nyckel = hash av titel, kanonisk URL, prompt, modell)
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS summary_cache (
+          key       TEXT PRIMARY KEY,
+          summary   TEXT NOT NULL,
+          created   TEXT,
+          last_used TEXT
+        )
+        """
+    )
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_summary_cache_last_used ON summary_cache(last_used)"
+    )
+
+
+def _v4_sheet_sync(con):
+    # Radnummer i arket + synk-läge per flik (se sheet_sync.py)
+    _add_column(con, "articles", "sheet_row", "INTEGER")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+          tab              TEXT PRIMARY KEY,
+          last_row         INTEGER,
+          last_id          TEXT,
+          last_import_date TEXT,
+          synced_at        TEXT
+        )
+        """
+    )
+    # Ögonblicksbilder av små flikar (Inställningar, Kategorier) som JSON per rad
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sheet_rows (
+          tab     TEXT,
+          row_num INTEGER,
+          data    TEXT,
+          PRIMARY KEY (tab, row_num)
+        )
+        """
+    )
+
+
+def _v5_article_indexes(con):
+    # latest/latest_filtered/sidhämtning: keyset på (import_date, id)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_articles_import ON articles(import_date, id)")
+    # Kategorifilter + sortering i samma index
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_articles_category ON articles(category, import_date, id)"
+    )
+    # all_articles (arkets ordning) och unsynced_articles (sheet_row IS NULL)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_articles_sheet_row ON articles(sheet_row)")
+    con.execute("ANALYZE")
+
+
+def _v6_fulltext(con):
+    # FTS5-index över titel + sammanfattning, synkat med articles via triggers.
+    # unicode61 utan diakritborttagning: å, ä och ö är egna bokstäver på svenska.
+    try:
         con.execute(
             """
-            CREATE TABLE IF NOT EXISTS articles (
-              id          TEXT PRIMARY KEY,
-              title       TEXT,
-              url         TEXT UNIQUE,
-              date        TEXT,
-              summary     TEXT,
-              category    TEXT,
-              paywall     INTEGER DEFAULT 0,
-              import_date TEXT
+            CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+              title, summary,
+              content='articles', content_rowid='rowid',
+              tokenize="unicode61 remove_diacritics 0",
+              prefix='2 3'
             )
             """
         )
-        try:
-            con.execute("ALTER TABLE articles ADD COLUMN paywall INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            con.execute("ALTER TABLE articles ADD COLUMN import_date TEXT")
-        except sqlite3.OperationalError:
-            pass
+    except sqlite3.OperationalError as e:
+        print(f"[init] FTS5 saknas i denna SQLite – sök avstängt ({e})", file=sys.stderr)
+        return
+    con.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS articles_fts_ai AFTER INSERT ON articles BEGIN
+          INSERT INTO articles_fts(rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+        END;
+        CREATE TRIGGER IF NOT EXISTS articles_fts_ad AFTER DELETE ON articles BEGIN
+          INSERT INTO articles_fts(articles_fts, rowid, title, summary)
+          VALUES ('delete', old.rowid, old.title, old.summary);
+        END;
+        CREATE TRIGGER IF NOT EXISTS articles_fts_au AFTER UPDATE OF title, summary ON articles BEGIN
+          INSERT INTO articles_fts(articles_fts, rowid, title, summary)
+          VALUES ('delete', old.rowid, old.title, old.summary);
+          INSERT INTO articles_fts(rowid, title, summary) VALUES (new.rowid, new.title, new.summary);
+        END;
+        """
+    )
+    con.execute("INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')")
+
+
+def _v7_story_index(con):
+    # Dubblettindex (dedupe.py): kanonisk URL + SimHash uppdelad i fyra 16-bitarsband
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS story_index (
+          id      TEXT PRIMARY KEY,
+          url_key TEXT,
+          simhash INTEGER,
+          b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER,
+          seen    TEXT
+        )
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_story_url ON story_index(url_key)")
+    for b in ("b0", "b1", "b2", "b3"):
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_story_{b} ON story_index({b}, seen)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_story_seen ON story_index(seen)")
+
+
+def _v8_sheet_ids(con):
+    # Lokal kopia av id-kolumnen i 'Artiklar' för dedupe utan Sheets-anrop
+    con.execute("CREATE TABLE IF NOT EXISTS sheet_ids (id TEXT PRIMARY KEY) WITHOUT ROWID")
+
+
+def _v9_versions(con):
+    # Versionsräknare för HTTP-cachning (ETag / Last-Modified) – uppdateras av triggers
+    con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    con.execute(
+        "INSERT OR IGNORE INTO meta (key, value) VALUES"
+        " ('articles_version', '0'), ('articles_changed', strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))"
+    )
+    bump = """
+        UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'articles_version';
+        UPDATE meta SET value = strftime('%Y-%m-%dT%H:%M:%SZ', 'now') WHERE key = 'articles_changed';
+    """
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        con.execute(
+            f"CREATE TRIGGER IF NOT EXISTS articles_version_{event.lower()}"
+            f" AFTER {event} ON articles BEGIN {bump} END"
+        )
+    _add_column(con, "sync_state", "content_hash", "TEXT")
+
+
+def _v10_jobs(con):
+    # Bakgrundsjobb (jobs.py): status, progress som JSON och kooperativ avbrytning
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+          id               TEXT PRIMARY KEY,
+          kind             TEXT NOT NULL,
+          status           TEXT NOT NULL,
+          progress         TEXT,
+          result           TEXT,
+          error            TEXT,
+          cancel_requested INTEGER DEFAULT 0,
+          owner            TEXT,
+          created_at       TEXT,
+          started_at       TEXT,
+          finished_at      TEXT,
+          heartbeat_at     REAL
+        )
+        """
+    )
+    # Högst ett aktivt jobb per typ – samtidiga triggers slås ihop (INSERT OR IGNORE)
+    con.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active ON jobs(kind)"
+        " WHERE status IN ('queued', 'running')"
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at)")
+    # Lås med utgångstid som delas mellan processer (gunicorn-workers)
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+          name       TEXT PRIMARY KEY,
+          owner      TEXT NOT NULL,
+          expires_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def _v11_feed_health(con):
+    # Hälsa och schema per flöde (feed_schedule.py)
+    _add_column(con, "feed_state", "polls", "INTEGER DEFAULT 0")
+    _add_column(con, "feed_state", "failures", "INTEGER DEFAULT 0")   # fel i rad
+    _add_column(con, "feed_state", "avg_latency", "REAL")             # sek, glidande medel
+    _add_column(con, "feed_state", "rate", "REAL")                    # nya poster per dygn, glidande medel
+    _add_column(con, "feed_state", "last_success", "REAL")            # epoch
+    _add_column(con, "feed_state", "last_error", "TEXT")
+    _add_column(con, "feed_state", "next_poll", "REAL")               # epoch
+    con.execute("CREATE INDEX IF NOT EXISTS idx_feed_state_next_poll ON feed_state(next_poll)")
+
+
+def _v12_digest_sends(con):
+    # Utskickslogg för nyhetsbrevet: en rad per (datum, mottagare, innehåll)
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS digest_sends (
+          digest_date  TEXT NOT NULL,
+          email        TEXT NOT NULL,
+          content_hash TEXT NOT NULL,
+          status       TEXT NOT NULL,            -- pending | sending | sent | failed
+          attempts     INTEGER DEFAULT 0,
+          updated_at   TEXT,
+          PRIMARY KEY (digest_date, email, content_hash)
+        ) WITHOUT ROWID
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_digest_sends_status ON digest_sends(digest_date, status)")
+
+
+def _v13_subscribers(con):
+    # Prenumeranter – SQLite är facit, fliken 'Prenumeranter' speglas
+    # (dirty > 0 = ändringar som inte speglats; räknas upp vid varje ändring)
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS subscribers (
+          id         INTEGER PRIMARY KEY,
+          email      TEXT NOT NULL UNIQUE,
+          name       TEXT,
+          categories TEXT,
+          status     TEXT NOT NULL,               -- pending | active | unsubscribed
+          token      TEXT UNIQUE,
+          created_at TEXT,
+          updated_at TEXT,
+          sheet_row  INTEGER,
+          dirty      INTEGER NOT NULL DEFAULT 1
+        )
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_subscribers_dirty ON subscribers(id) WHERE dirty > 0")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_subscribers_status ON subscribers(status)")
+    # Antal per status, uppdaterat av triggers (adminstatistik utan COUNT(*))
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS subscriber_counts (status TEXT PRIMARY KEY, n INTEGER NOT NULL)"
+    )
+    con.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS subscribers_count_ai AFTER INSERT ON subscribers BEGIN
+          INSERT INTO subscriber_counts (status, n) VALUES (new.status, 1)
+          ON CONFLICT(status) DO UPDATE SET n = n + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS subscribers_count_ad AFTER DELETE ON subscribers BEGIN
+          UPDATE subscriber_counts SET n = n - 1 WHERE status = old.status;
+        END;
+        CREATE TRIGGER IF NOT EXISTS subscribers_count_au AFTER UPDATE OF status ON subscribers
+        WHEN old.status IS NOT new.status BEGIN
+          UPDATE subscriber_counts SET n = n - 1 WHERE status = old.status;
+          INSERT INTO subscriber_counts (status, n) VALUES (new.status, 1)
+          ON CONFLICT(status) DO UPDATE SET n = n + 1;
+        END;
+        """
+    )
+
+
+# Dag för artikelstatistiken: importdatum, annars publiceringsdatum
+_STATS_DAY = "COALESCE(NULLIF(substr({0}.import_date, 1, 10), ''), substr({0}.date, 1, 10), '')"
+
+
+def _v14_stats(con):
+    # Aggregat för adminpanelen: artiklar per dag och kategori (triggers) + en rad per körning
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS article_stats (
+          day      TEXT NOT NULL,
+          category TEXT NOT NULL,
+          n        INTEGER NOT NULL,
+          PRIMARY KEY (day, category)
+        ) WITHOUT ROWID
+        """
+    )
+    con.execute("DELETE FROM article_stats")
+    con.execute(
+        f"INSERT INTO article_stats (day, category, n)"
+        f" SELECT {_STATS_DAY.format('articles')}, COALESCE(category, ''), COUNT(*)"
+        f" FROM articles GROUP BY 1, 2"
+    )
+    add = (
+        "INSERT INTO article_stats (day, category, n)"
+        f" VALUES ({_STATS_DAY.format('new')}, COALESCE(new.category, ''), 1)"
+        " ON CONFLICT(day, category) DO UPDATE SET n = n + 1;"
+    )
+    remove = (
+        "UPDATE article_stats SET n = n - 1"
+        f" WHERE day = {_STATS_DAY.format('old')} AND category = COALESCE(old.category, '');"
+    )
+    con.executescript(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS articles_stats_ai AFTER INSERT ON articles BEGIN {add} END;
+        CREATE TRIGGER IF NOT EXISTS articles_stats_ad AFTER DELETE ON articles BEGIN {remove} END;
+        CREATE TRIGGER IF NOT EXISTS articles_stats_au
+        AFTER UPDATE OF date, category, import_date ON articles BEGIN {remove} {add} END;
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS runs (
+          name              TEXT NOT NULL,
+          started_at        TEXT NOT NULL,
+          status            TEXT,
+          duration          REAL,
+          added             INTEGER,
+          prompt_tokens     INTEGER,
+          completion_tokens INTEGER,
+          cost_usd          REAL,
+          PRIMARY KEY (name, started_at)
+        ) WITHOUT ROWID
+        """
+    )
 
-    print("[init] articles-tabellen finns/skapades OK", file=sys.stderr)
+
+def _v15_article_vectors(con):
+    # Cache för klassificeringens vektorer (classify.py): glesa hashade termfrekvenser per artikel-id
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS article_vectors (
+          id         TEXT PRIMARY KEY,
+          dim        INTEGER NOT NULL,
+          vec        BLOB NOT NULL,
+          created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_article_vectors_created ON article_vectors(created_at)")
+
+
+def _v16_subscriber_changes(con):
+    # Ändringar av en pending/aktiv prenumerant (namn, kategorier) väntar här tills
+    # de bekräftats med change_token – annars kan vem som helst skriva över dem
+    _add_column(con, "subscribers", "pending_name", "TEXT")
+    _add_column(con, "subscribers", "pending_categories", "TEXT")
+    _add_column(con, "subscribers", "change_token", "TEXT")
+
+
+def _v17_sheet_deletions(con):
+    # needs_push = 1: artikeln skapades lokalt och ska skrivas till arket (sheet_sync.push_articles).
+    # Befintliga rader har redan gått via arket – inget av det som saknas där ska pushas tillbaka.
+    _add_column(con, "articles", "needs_push", "INTEGER NOT NULL DEFAULT 0")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_articles_needs_push ON articles(needs_push) WHERE needs_push = 1")
+    # Gravstenar för artiklar som tagits bort ur 'Artiklar' – hålls borta från SQLite och dedupe
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS deleted_articles (
+          id         TEXT PRIMARY KEY,
+          url        TEXT,
+          deleted_at TEXT NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_deleted_articles_url ON deleted_articles(url)")
+    # Nästa pull blir en full läsning, så att tidigare borttagningar i arket tas bort här också
+    con.execute("DELETE FROM sync_state WHERE tab = 'Artiklar'")
+
+
+MIGRATIONS = [
+    _v1_articles,
+    _v2_feed_state,
+    _v3_summary_cache,
+    _v4_sheet_sync,
+    _v5_article_indexes,
+    _v6_fulltext,
+    _v7_story_index,
+    _v8_sheet_ids,
+    _v9_versions,
+    _v10_jobs,
+    _v11_feed_health,
+    _v12_digest_sends,
+    _v13_subscribers,
+    _v14_stats,
+    _v15_article_vectors,
+    _v16_subscriber_changes,
+    _v17_sheet_deletions,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def init() -> None:
+    """Skapar tabeller + kör migreringar som inte redan körts."""
+    with connect() as con:
+        current = con.execute("PRAGMA user_version").fetchone()[0]
+        if current >= SCHEMA_VERSION:
+            return
+        for version, migrate in enumerate(MIGRATIONS[current:], start=current + 1):
+            migrate(con)
+            con.execute(f"PRAGMA user_version = {version}")
+
+    print(f"[init] news_db migrerad v{current} → v{SCHEMA_VERSION}", file=sys.stderr)
+
+
+def _connection() -> sqlite3.Connection:
+    """En återanvänd anslutning per tråd (och process – öppnas om efter fork)."""
+    con = getattr(_local, "con", None)
+    if con is not None and _local.key == (os.getpid(), str(DB_PATH)):
+        return con
+    con = sqlite3.connect(DB_PATH, timeout=5.0, cached_statements=256)
+    for pragma in PRAGMAS:
+        con.execute(pragma)
+    _local.con, _local.key, _local.depth = con, (os.getpid(), str(DB_PATH)), 0
+    return con
 
 
 @contextlib.contextmanager
 def connect():
-    con = sqlite3.connect(DB_PATH)
+    """Trådens anslutning som en transaktion. Nästlade anrop delar på den yttersta."""
+    con = _connection()
+    _local.depth += 1
     try:
         yield con
+    except BaseException:
+        if _local.depth == 1:
+            con.rollback()
+        raise
+    else:
+        if _local.depth == 1:
+            con.commit()
     finally:
-        con.commit()
-        con.close()
+        _local.depth -= 1
 
 
 def insert(row: tuple) -> None:
+    """Spara en artikel som bara finns lokalt – sheet_sync skriver den till arket (needs_push)."""
     with connect() as con:
         con.execute(
             """
             INSERT OR IGNORE INTO articles
-            (id, title, url, date, summary, category, paywall, import_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            (id, title, url, date, summary, category, paywall, import_date, needs_push)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
             """,
             row,
         )
 
 
+def insert_many(rows: list[tuple]) -> int:
+    """Som insert(), men för många rader i en transaktion. Returnerar antal nya rader."""
+    if not rows:
+        return 0
+    with connect() as con:
+        before = con.total_changes
+        con.executemany(
+            """
+            INSERT OR IGNORE INTO articles
+            (id, title, url, date, summary, category, paywall, import_date, needs_push)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+            """,
+            rows,
+        )
+        return con.total_changes - before
+
+
 def exists(url: str) -> bool:
     with connect() as con:
-        cur = con.execute("SELECT COUNT(*) FROM articles WHERE url = ?", (url,))
-        return cur.fetchone()[0] > 0
+        cur = con.execute("SELECT 1 FROM articles WHERE url = ? LIMIT 1", (url,))
+        return cur.fetchone() is not None
+
+
+def existing_urls(urls: list[str]) -> set[str]:
+    """Vilka av `urls` som redan finns i articles – eller tagits bort ur arket (en fråga per 500 URL:er)."""
+    urls = [u for u in dict.fromkeys(urls) if u]
+    found = set()
+    with connect() as con:
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            cur = con.execute(
+                f"SELECT url FROM articles WHERE url IN ({marks})"
+                f" UNION SELECT url FROM deleted_articles WHERE url IN ({marks})",
+                chunk + chunk,
+            )
+            found.update(u for (u,) in cur.fetchall())
+    return found
 
 
 def latest(limit: int = 20) -> list[dict]:
@@ -93,3 +555,952 @@ def latest_filtered(days: int = 1, max_articles: int = 20) -> list[dict]:
         )
         cols = [d[0] for d in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+
+def feed_states(urls: list[str]) -> dict[str, dict]:
+    """Returnerar sparade validatorer {url: {etag, last_modified, content_hash, last_fetch}}."""
+    if not urls:
+        return {}
+    urls = list(dict.fromkeys(urls))
+    keys = ("etag", "last_modified", "content_hash", "last_fetch")
+    out = {}
+    with connect() as con:
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            cur = con.execute(
+                f"SELECT url, {', '.join(keys)} FROM feed_state"
+                f" WHERE url IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for url, *vals in cur.fetchall():
+                out[url] = dict(zip(keys, vals))
+    return out
+
+
+def save_feed_states(results: list[dict]) -> None:
+    """Spara validatorer från lyckade hämtningar (se feed_fetch.download_feeds)."""
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    rows = [
+        (r["url"], r.get("etag"), r.get("last_modified"), r.get("content_hash"), now)
+        for r in results
+        if not r.get("error")
+    ]
+    if not rows:
+        return
+    with connect() as con:
+        con.executemany(
+            """
+            INSERT INTO feed_state (url, etag, last_modified, content_hash, last_fetch)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+              etag          = COALESCE(excluded.etag, feed_state.etag),
+              last_modified = COALESCE(excluded.last_modified, feed_state.last_modified),
+              content_hash  = COALESCE(excluded.content_hash, feed_state.content_hash),
+              last_fetch    = excluded.last_fetch
+            """,
+            rows,
+        )
+
+
+FEED_HEALTH_COLS = (
+    "polls", "failures", "avg_latency", "rate", "last_success", "last_error", "next_poll", "last_fetch",
+)
+
+
+def feed_health(urls: list[str] | None = None) -> dict[str, dict]:
+    """Hälsa + schema per flöde (alla flöden om urls är None)."""
+    cols = ", ".join(FEED_HEALTH_COLS)
+    out = {}
+    with connect() as con:
+        if urls is None:
+            chunks = [None]
+        else:
+            urls = list(dict.fromkeys(urls))
+            chunks = [urls[i:i + 500] for i in range(0, len(urls), 500)]
+        for chunk in chunks:
+            if chunk is None:
+                cur = con.execute(f"SELECT url, {cols} FROM feed_state ORDER BY url")
+            else:
+                cur = con.execute(
+                    f"SELECT url, {cols} FROM feed_state WHERE url IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            for url, *vals in cur.fetchall():
+                out[url] = dict(zip(FEED_HEALTH_COLS, vals))
+    return out
+
+
+def save_feed_health(rows: list[dict]) -> None:
+    """Spara hälsa/schema: [{url, polls, failures, avg_latency, rate, last_success, last_error, next_poll}]."""
+    if not rows:
+        return
+    keys = ("polls", "failures", "avg_latency", "rate", "last_success", "last_error", "next_poll")
+    with connect() as con:
+        con.executemany(
+            f"""
+            INSERT INTO feed_state (url, {', '.join(keys)}) VALUES (?, {', '.join('?' * len(keys))})
+            ON CONFLICT(url) DO UPDATE SET {', '.join(f'{k} = excluded.{k}' for k in keys)}
+            """,
+            [(r["url"], *(r.get(k) for k in keys)) for r in rows],
+        )
+
+
+def cached_summaries(keys: list[str]) -> dict[str, str]:
+    """Slå upp cachade sammanfattningar {key: summary} och markera träffarna som använda."""
+    if not keys:
+        return {}
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    out = {}
+    with connect() as con:
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            cur = con.execute(
+                f"SELECT key, summary FROM summary_cache WHERE key IN ({marks})", chunk
+            )
+            out.update(cur.fetchall())
+        if out:
+            con.executemany(
+                "UPDATE summary_cache SET last_used = ? WHERE key = ?",
+                [(now, k) for k in out],
+            )
+    return out
+
+
+def cache_summaries(items: dict[str, str]) -> None:
+    """Spara {key: summary} i cachen. Tomma sammanfattningar sparas inte."""
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    rows = [(k, v, now, now) for k, v in items.items() if v]
+    if not rows:
+        return
+    with connect() as con:
+        con.executemany(
+            "INSERT OR REPLACE INTO summary_cache (key, summary, created, last_used) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+
+def prune_summary_cache(max_rows: int, max_age_days: int) -> int:
+    """Rensa poster som inte använts på `max_age_days` dagar och de äldsta över `max_rows`."""
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat(timespec="seconds")
+    with connect() as con:
+        removed = con.execute("DELETE FROM summary_cache WHERE last_used < ?", (cutoff,)).rowcount
+        removed += con.execute(
+            """
+            DELETE FROM summary_cache WHERE key IN (
+              SELECT key FROM summary_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (max_rows,),
+        ).rowcount
+    return removed
+
+
+# ────────── Synk mot Sheets (sheet_sync.py) ──────────
+ARTICLE_COLS = ("id", "title", "url", "date", "summary", "category", "paywall", "import_date")
+
+
+def get_sync_state(tab: str) -> dict:
+    with connect() as con:
+        cur = con.execute(
+            "SELECT last_row, last_id, last_import_date, synced_at FROM sync_state WHERE tab = ?",
+            (tab,),
+        )
+        row = cur.fetchone()
+    keys = ("last_row", "last_id", "last_import_date", "synced_at")
+    return dict(zip(keys, row)) if row else dict.fromkeys(keys)
+
+
+def set_sync_state(tab: str, last_row: int | None, last_id: str | None = None,
+                   last_import_date: str | None = None) -> None:
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        con.execute(
+            "INSERT OR REPLACE INTO sync_state (tab, last_row, last_id, last_import_date, synced_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (tab, last_row, last_id, last_import_date, now),
+        )
+
+
+def upsert_sheet_articles(rows: list[tuple]) -> None:
+    """Spara artiklar som finns i arket: (id, title, url, date, summary, category, paywall, import_date, sheet_row)."""
+    if not rows:
+        return
+    with connect() as con:
+        con.executemany(
+            """
+            INSERT OR IGNORE INTO articles
+            (id, title, url, date, summary, category, paywall, import_date, sheet_row)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        con.executemany(
+            "UPDATE articles SET sheet_row = ?, needs_push = 0 WHERE id = ?",
+            [(r[8], r[0]) for r in rows],
+        )
+        # Återställd i arket efter att ha tagits bort
+        con.executemany("DELETE FROM deleted_articles WHERE id = ?", [(r[0],) for r in rows])
+
+
+def article_watermark() -> int:
+    """Högsta rowid i articles – för tombstone_missing (rader som tillkommit efter läsningen rörs inte)."""
+    with connect() as con:
+        return con.execute("SELECT COALESCE(MAX(rowid), 0) FROM articles").fetchone()[0]
+
+
+def tombstone_missing(present_ids: set[str], watermark: int) -> int:
+    """Ta bort artiklar som fanns i arket men saknas i en fullständig läsning av det.
+
+    Bara rader med rowid <= watermark (fanns innan arket lästes – skrivarna skriver
+    arket först) och utan needs_push (har inte väntat på att skrivas) tas bort;
+    de sparas som gravstenar i deleted_articles. Returnerar antal borttagna.
+    """
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        con.execute("CREATE TEMP TABLE IF NOT EXISTS present_ids (id TEXT PRIMARY KEY) WITHOUT ROWID")
+        con.execute("DELETE FROM present_ids")
+        con.executemany("INSERT OR IGNORE INTO present_ids (id) VALUES (?)", [(i,) for i in present_ids])
+        missing = "rowid <= ? AND needs_push = 0 AND id NOT IN (SELECT id FROM present_ids)"
+        con.execute(
+            f"INSERT OR REPLACE INTO deleted_articles (id, url, deleted_at)"
+            f" SELECT id, url, ? FROM articles WHERE {missing}",
+            (now, watermark),
+        )
+        cur = con.execute(f"DELETE FROM articles WHERE {missing}", (watermark,))
+        con.execute("DELETE FROM present_ids")
+        return cur.rowcount
+
+
+def clear_sheet_rows() -> None:
+    """Glöm radnummer i arket (efter att rader tagits bort och numreringen flyttats)."""
+    with connect() as con:
+        con.execute("UPDATE articles SET sheet_row = NULL")
+        con.execute("DELETE FROM sync_state WHERE tab IN ('Artiklar', 'Artiklar#ids')")
+
+
+def known_sheet_ids(ids: list[str]) -> set[str]:
+    """Vilka av `ids` som finns i arkets id-kolumn (enligt det lokala indexet)."""
+    ids = [i for i in dict.fromkeys(ids) if i]
+    found = set()
+    with connect() as con:
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            cur = con.execute(
+                f"SELECT id FROM sheet_ids WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update(x for (x,) in cur.fetchall())
+    return found
+
+
+def add_sheet_ids(ids: list[str]) -> None:
+    with connect() as con:
+        con.executemany("INSERT OR IGNORE INTO sheet_ids (id) VALUES (?)", [(i,) for i in ids if i])
+
+
+def clear_sheet_ids() -> None:
+    with connect() as con:
+        con.execute("DELETE FROM sheet_ids")
+        con.execute("DELETE FROM sync_state WHERE tab = 'Artiklar#ids'")
+
+
+def count_sheet_ids() -> int:
+    with connect() as con:
+        return con.execute("SELECT COUNT(*) FROM sheet_ids").fetchone()[0]
+
+
+# sheet_row för artiklar som skrivits till arket men vars radnummer inte är kända
+# ännu – nästa pull_articles fyller i rätt rad.
+SHEET_ROW_UNKNOWN = 0
+
+
+def unsynced_articles() -> list[dict]:
+    """Lokalt skapade artiklar (needs_push) som ännu inte skrivits till arket, i insättningsordning.
+
+    Saknat radnummer räcker inte: en rad utan sheet_row kan lika gärna ha tagits bort ur arket.
+    """
+    with connect() as con:
+        cur = con.execute(
+            f"SELECT {', '.join(ARTICLE_COLS)} FROM articles WHERE needs_push = 1 ORDER BY rowid"
+        )
+        return [dict(zip(ARTICLE_COLS, row)) for row in cur.fetchall()]
+
+
+def set_sheet_rows(pairs: list[tuple[str, int]]) -> None:
+    """Markera artiklar som skrivna till arket: [(id, radnummer), ...] (radnummer kan vara SHEET_ROW_UNKNOWN)."""
+    with connect() as con:
+        con.executemany(
+            "UPDATE articles SET sheet_row = ?, needs_push = 0 WHERE id = ?", [(r, i) for i, r in pairs]
+        )
+
+
+def all_articles() -> list[dict]:
+    """Alla artiklar i samma form och ordning som fliken 'Artiklar'."""
+    with connect() as con:
+        cur = con.execute(
+            f"SELECT {', '.join(ARTICLE_COLS)} FROM articles"
+            " ORDER BY COALESCE(sheet_row, 0) = 0, sheet_row, rowid"  # okänd rad (NULL/0) sist
+        )
+        return [dict(zip(ARTICLE_COLS, row)) for row in cur.fetchall()]
+
+
+def page_articles(
+    limit: int = 20,
+    *,
+    after: tuple[str, str] | None = None,
+    categories: list[str] | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    paywall: bool | None = None,
+    fields: list[str] | None = None,
+) -> list[dict]:
+    """En sida artiklar, nyast först (keyset på (import_date, id)).
+
+    `after` är (import_date, id) för sista raden på föregående sida.
+    `date_from`/`date_to` filtrerar på import_date (inklusive).
+    """
+    cols = [c for c in (fields or ARTICLE_COLS) if c in ARTICLE_COLS]
+    # import_date och id behövs alltid för nästa cursor
+    select = list(dict.fromkeys(cols + ["import_date", "id"]))
+    where, params = [], []
+    if after:
+        where.append("(import_date, id) < (?, ?)")
+        params += list(after)
+    if categories:
+        where.append(f"category IN ({','.join('?' * len(categories))})")
+        params += categories
+    if date_from:
+        where.append("import_date >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("import_date <= ?")
+        params.append(date_to)
+    if paywall is not None:
+        where.append("paywall = ?")
+        params.append(int(paywall))
+    sql = f"SELECT {', '.join(select)} FROM articles"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY import_date DESC, id DESC LIMIT ?"
+    params.append(limit)
+    with connect() as con:
+        cur = con.execute(sql, params)
+        return [dict(zip(select, row)) for row in cur.fetchall()]
+
+
+# ────────── Dubblettindex (dedupe.py) ──────────
+def _signed64(v: int | None) -> int | None:
+    """SQLite INTEGER är signerad 64-bit – SimHash lagras därför med tvåkomplement."""
+    return v - (1 << 64) if v is not None and v >= 1 << 63 else v
+
+
+def stories_by_url(url_keys: list[str]) -> dict[str, str]:
+    """{url_key: story-id} för redan kända kanoniska URL:er."""
+    keys = list(dict.fromkeys(url_keys))
+    out = {}
+    with connect() as con:
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            cur = con.execute(
+                f"SELECT url_key, id FROM story_index WHERE url_key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            out.update(cur.fetchall())
+    return out
+
+
+def story_candidates(bands: tuple[int, int, int, int], since_days: int) -> list[tuple[int, str]]:
+    """Stories de senaste `since_days` dagarna som delar minst ett band: [(simhash, id), ...]."""
+    since = (datetime.utcnow() - timedelta(days=since_days)).isoformat(timespec="seconds")
+    with connect() as con:
+        cur = con.execute(
+            """
+            SELECT simhash, id FROM story_index
+            WHERE seen >= ? AND (b0 = ? OR b1 = ? OR b2 = ? OR b3 = ?)
+            """,
+            (since, *bands),
+        )
+        return [(h + (1 << 64) if h < 0 else h, i) for h, i in cur.fetchall()]
+
+
+def add_stories(rows: list[tuple[str, str, int | None]], keep_days: int) -> None:
+    """Spara [(id, url_key, simhash|None), ...] och rensa stories äldre än `keep_days`."""
+    now = datetime.utcnow()
+    stamp = now.isoformat(timespec="seconds")
+    cutoff = (now - timedelta(days=keep_days)).isoformat(timespec="seconds")
+    data = []
+    for art_id, key, h in rows:
+        b = tuple((h >> (16 * i)) & 0xFFFF for i in range(4)) if h is not None else (None,) * 4
+        data.append((art_id, key, _signed64(h), *b, stamp))
+    with connect() as con:
+        con.executemany(
+            "INSERT OR REPLACE INTO story_index (id, url_key, simhash, b0, b1, b2, b3, seen)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            data,
+        )
+        con.execute("DELETE FROM story_index WHERE seen < ?", (cutoff,))
+
+
+# ────────── Fritextsök (FTS5) ──────────
+_HL_START, _HL_END = "\x02", "\x03"  # markörer som byts mot <mark> efter HTML-escaping
+
+
+def _fts_query(q: str) -> str | None:
+    """Gör om fri text till en säker FTS5-fråga: alla ord måste finnas (AND).
+
+    Sista ordet, och ord som slutar på '*', matchas som prefix.
+    """
+    words = re.findall(r"\w+\*?", q or "")
+    if not words:
+        return None
+    terms = []
+    for i, w in enumerate(words):
+        prefix = w.endswith("*") or i == len(words) - 1
+        w = w.rstrip("*")
+        terms.append(f'"{w}"*' if prefix else f'"{w}"')
+    return " ".join(terms)
+
+
+def _marked(text: str | None) -> str:
+    return html.escape(text or "").replace(_HL_START, "<mark>").replace(_HL_END, "</mark>")
+
+
+def search(q: str, limit: int = 20, category: str | None = None) -> list[dict]:
+    """Sök i titel + sammanfattning. Rankas med bm25 (titel väger tyngre).
+
+    Returnerar artiklar med `title_html` och `snippet` (HTML-escapade, träffar i <mark>).
+    """
+    match = _fts_query(q)
+    if not match:
+        return []
+    sql = f"""
+        SELECT a.id, a.title, a.url, a.date, a.category, a.paywall, a.import_date,
+               highlight(articles_fts, 0, '{_HL_START}', '{_HL_END}'),
+               snippet(articles_fts, 1, '{_HL_START}', '{_HL_END}', '…', 16),
+               bm25(articles_fts, 5.0, 1.0) AS rank
+        FROM articles_fts
+        JOIN articles a ON a.rowid = articles_fts.rowid
+        WHERE articles_fts MATCH ?
+    """
+    params = [match]
+    if category:
+        sql += " AND a.category = ?"
+        params.append(category)
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    with connect() as con:
+        cur = con.execute(sql, params)
+        out = []
+        for *vals, title_hl, snip, rank in cur.fetchall():
+            row = dict(zip(("id", "title", "url", "date", "category", "paywall", "import_date"), vals))
+            row.update(title_html=_marked(title_hl), snippet=_marked(snip), score=round(-rank, 4))
+            out.append(row)
+        return out
+
+
+def iter_articles(batch: int = 500):
+    """Som all_articles(), men som generator – för strömmande svar med konstant minne."""
+    with connect() as con:
+        cur = con.execute(
+            f"SELECT {', '.join(ARTICLE_COLS)} FROM articles"
+            " ORDER BY COALESCE(sheet_row, 0) = 0, sheet_row, rowid"  # okänd rad (NULL/0) sist
+        )
+        while rows := cur.fetchmany(batch):
+            for row in rows:
+                yield dict(zip(ARTICLE_COLS, row))
+
+
+def replace_tab_rows(tab: str, rows: list[dict] | None) -> None:
+    """Ersätt ögonblicksbilden av en liten flik. None = fliken finns inte i arket."""
+    with connect() as con:
+        if rows is None:
+            con.execute("DELETE FROM sheet_rows WHERE tab = ?", (tab,))
+            con.execute("DELETE FROM sync_state WHERE tab = ?", (tab,))
+            return
+        data = [json.dumps(r, ensure_ascii=False) for r in rows]
+        digest = hashlib.sha1("\n".join(data).encode("utf-8")).hexdigest()
+        old = con.execute("SELECT content_hash FROM sync_state WHERE tab = ?", (tab,)).fetchone()
+        if old and old[0] == digest:
+            return  # oförändrad – behåll version och Last-Modified
+        con.execute("DELETE FROM sheet_rows WHERE tab = ?", (tab,))
+        con.executemany(
+            "INSERT INTO sheet_rows (tab, row_num, data) VALUES (?, ?, ?)",
+            [(tab, i, d) for i, d in enumerate(data, start=2)],
+        )
+        con.execute(
+            "INSERT OR REPLACE INTO sync_state (tab, last_row, synced_at, content_hash) VALUES (?, ?, ?, ?)",
+            (tab, len(rows) + 1, datetime.utcnow().isoformat(timespec="seconds"), digest),
+        )
+
+
+def dataset_version(tab: str) -> tuple[str, str | None] | None:
+    """(versionstoken, senast ändrad ISO-tid) för en flik i SQLite, eller None om okänd."""
+    with connect() as con:
+        if tab == "Artiklar":
+            meta = dict(con.execute(
+                "SELECT key, value FROM meta WHERE key IN ('articles_version', 'articles_changed')"
+            ).fetchall())
+            return f"a{meta.get('articles_version', 0)}", meta.get("articles_changed")
+        row = con.execute(
+            "SELECT content_hash, synced_at FROM sync_state WHERE tab = ?", (tab,)
+        ).fetchone()
+        return (row[0], row[1] + "Z") if row and row[0] else None
+
+
+def tab_rows(tab: str) -> list[dict] | None:
+    """Rader för en synkad flik, eller None om fliken inte finns (eller aldrig synkats)."""
+    with connect() as con:
+        if not con.execute("SELECT 1 FROM sync_state WHERE tab = ?", (tab,)).fetchone():
+            return None
+        cur = con.execute("SELECT data FROM sheet_rows WHERE tab = ? ORDER BY row_num", (tab,))
+        return [json.loads(d) for (d,) in cur.fetchall()]
+
+
+# ────────── Jobb och lås (jobs.py) ──────────
+JOB_COLS = (
+    "id", "kind", "status", "progress", "result", "error", "cancel_requested",
+    "owner", "created_at", "started_at", "finished_at", "heartbeat_at",
+)
+
+
+def _job_dict(row) -> dict:
+    job = dict(zip(JOB_COLS, row))
+    for key in ("progress", "result"):
+        job[key] = json.loads(job[key]) if job[key] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+def create_job(job_id: str, kind: str, owner: str, now: float) -> tuple[str, bool]:
+    """Lägg ett jobb i kö. Finns redan ett aktivt jobb av samma typ returneras det i stället.
+
+    Returnerar (jobb-id, skapades nytt?).
+    """
+    created = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        cur = con.execute(
+            "INSERT OR IGNORE INTO jobs (id, kind, status, owner, created_at, heartbeat_at)"
+            " VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, owner, created, now),
+        )
+        if cur.rowcount:
+            return job_id, True
+        row = con.execute(
+            "SELECT id FROM jobs WHERE kind = ? AND status IN ('queued', 'running')", (kind,)
+        ).fetchone()
+    return row[0], False
+
+
+def get_job(job_id: str) -> dict | None:
+    with connect() as con:
+        row = con.execute(
+            f"SELECT {', '.join(JOB_COLS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    return _job_dict(row) if row else None
+
+
+def recent_jobs(limit: int = 20) -> list[dict]:
+    with connect() as con:
+        rows = con.execute(
+            f"SELECT {', '.join(JOB_COLS)} FROM jobs ORDER BY created_at DESC, rowid DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+    return [_job_dict(r) for r in rows]
+
+
+def start_job(job_id: str) -> bool:
+    """queued → running. False om jobbet hunnit avbrytas eller redan körts."""
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        cur = con.execute(
+            "UPDATE jobs SET status = 'running', started_at = ?"
+            " WHERE id = ? AND status = 'queued' AND cancel_requested = 0",
+            (now, job_id),
+        )
+        if not cur.rowcount:
+            con.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?"
+                " WHERE id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+        return bool(cur.rowcount)
+
+
+def update_job_progress(job_id: str, progress: dict) -> bool:
+    """Spara progress; returnerar om någon begärt avbrytning."""
+    with connect() as con:
+        con.execute(
+            "UPDATE jobs SET progress = ? WHERE id = ?",
+            (json.dumps(progress, ensure_ascii=False), job_id),
+        )
+        row = con.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return bool(row and row[0])
+
+
+def finish_job(job_id: str, status: str, progress: dict | None = None,
+               result=None, error: str | None = None) -> None:
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        con.execute(
+            "UPDATE jobs SET status = ?, progress = COALESCE(?, progress), result = ?,"
+            " error = ?, finished_at = ? WHERE id = ?",
+            (
+                status,
+                json.dumps(progress, ensure_ascii=False) if progress is not None else None,
+                json.dumps(result, ensure_ascii=False) if result is not None else None,
+                error, now, job_id,
+            ),
+        )
+
+
+def request_job_cancel(job_id: str) -> bool:
+    """Begär avbrytning av ett aktivt jobb. False om jobbet inte finns eller redan är klart."""
+    with connect() as con:
+        cur = con.execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')",
+            (job_id,),
+        )
+        return bool(cur.rowcount)
+
+
+def heartbeat_jobs(owner: str, now: float) -> None:
+    with connect() as con:
+        con.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ('queued', 'running')",
+            (now, owner),
+        )
+
+
+def fail_stale_jobs(kind: str, older_than: float) -> int:
+    """Markera aktiva jobb vars ägare slutat ge livstecken (t.ex. kraschad worker) som failed."""
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        cur = con.execute(
+            "UPDATE jobs SET status = 'failed', error = 'övergivet (ingen heartbeat)', finished_at = ?"
+            " WHERE kind = ? AND status IN ('queued', 'running') AND heartbeat_at < ?",
+            (now, kind, older_than),
+        )
+        return cur.rowcount
+
+
+def acquire_lease(name: str, owner: str, ttl: float, now: float) -> bool:
+    """Ta (eller förläng) ett lås. Lyckas om det är ledigt, utgånget eller redan vårt."""
+    with connect() as con:
+        con.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+            " WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+            (name, owner, now + ttl, now),
+        )
+        row = con.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+    return bool(row and row[0] == owner)
+
+
+def release_lease(name: str, owner: str) -> None:
+    with connect() as con:
+        con.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+# ────────── Utskickslogg för nyhetsbrevet (util_email.send_digest) ──────────
+DIGEST_STATUS_RANK = {"sent": 3, "sending": 2, "failed": 1, "pending": 0}
+
+
+def digest_ledger(digest_date: str, emails: list[str]) -> dict[str, tuple[str, int]]:
+    """{email: (status, försök)} för dagens utskick – "viktigaste" status om det finns flera rader."""
+    out: dict[str, tuple[str, int]] = {}
+    emails = list(dict.fromkeys(emails))
+    with connect() as con:
+        for i in range(0, len(emails), 500):
+            chunk = emails[i:i + 500]
+            cur = con.execute(
+                "SELECT email, status, attempts FROM digest_sends"
+                f" WHERE digest_date = ? AND email IN ({','.join('?' * len(chunk))})",
+                [digest_date, *chunk],
+            )
+            for email, status, attempts in cur.fetchall():
+                old = out.get(email)
+                if not old or DIGEST_STATUS_RANK.get(status, 0) > DIGEST_STATUS_RANK.get(old[0], 0):
+                    out[email] = (status, attempts)
+    return out
+
+
+def digest_record(digest_date: str, rows: list[tuple[str, str]], status: str) -> None:
+    """Sätt status för [(email, content_hash)]. Status "sending" räknar upp försöken."""
+    if not rows:
+        return
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        con.executemany(
+            """
+            INSERT INTO digest_sends (digest_date, email, content_hash, status, attempts, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(digest_date, email, content_hash) DO UPDATE SET
+              status     = excluded.status,
+              attempts   = digest_sends.attempts + excluded.attempts,
+              updated_at = excluded.updated_at
+            """,
+            [(digest_date, e, h, status, 1 if status == "sending" else 0, now) for e, h in rows],
+        )
+
+
+def digest_counts(digest_date: str) -> dict[str, int]:
+    with connect() as con:
+        cur = con.execute(
+            "SELECT status, COUNT(*) FROM digest_sends WHERE digest_date = ? GROUP BY status",
+            (digest_date,),
+        )
+        return dict(cur.fetchall())
+
+
+# ────────── Prenumeranter ──────────
+SUBSCRIBER_COLS = ("id", "email", "name", "categories", "status", "token", "created_at", "updated_at", "sheet_row")
+
+
+def _subscriber(con, where: str, params: tuple) -> dict | None:
+    row = con.execute(
+        f"SELECT {', '.join(SUBSCRIBER_COLS)} FROM subscribers WHERE {where}", params
+    ).fetchone()
+    return dict(zip(SUBSCRIBER_COLS, row)) if row else None
+
+
+def get_subscriber(email: str) -> dict | None:
+    with connect() as con:
+        return _subscriber(con, "email = ?", (email.strip().lower(),))
+
+
+def add_subscriber(name: str, email: str, categories: str, token: str) -> tuple[dict, str | None]:
+    """Lägg till en prenumerant eller begär en ändring. Returnerar (prenumerant, token att bekräfta med).
+
+    Ny eller avanmäld adress: pending med namn, kategorier och `token`.
+    Pending eller aktiv adress: de sparade fälten behålls – namn och kategorier
+    läggs som en väntande ändring med `token` som ändringstoken och gäller
+    först när den bekräftats (confirm_subscriber). Token är None om en aktiv
+    prenumerant redan har exakt de uppgifterna (inget att bekräfta).
+    """
+    email = email.strip().lower()
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        cur = con.execute(
+            "INSERT INTO subscribers (email, name, categories, status, token, created_at, updated_at)"
+            " VALUES (?, ?, ?, 'pending', ?, ?, ?) ON CONFLICT(email) DO NOTHING",
+            (email, name, categories, token, now, now),
+        )
+        if cur.rowcount:
+            return _subscriber(con, "email = ?", (email,)), token
+
+        sub = _subscriber(con, "email = ?", (email,))
+        if sub["status"] == "unsubscribed" or sub["token"] is None:
+            con.execute(
+                "UPDATE subscribers SET name = ?, categories = ?, status = 'pending', token = ?,"
+                " pending_name = NULL, pending_categories = NULL, change_token = NULL,"
+                " updated_at = ?, dirty = dirty + 1 WHERE id = ?",
+                (name, categories, token, now, sub["id"]),
+            )
+            return _subscriber(con, "id = ?", (sub["id"],)), token
+        if sub["status"] == "active" and (sub["name"], sub["categories"]) == (name, categories):
+            return sub, None
+        con.execute(
+            "UPDATE subscribers SET pending_name = ?, pending_categories = ?, change_token = ? WHERE id = ?",
+            (name, categories, token, sub["id"]),
+        )
+        return sub, token
+
+
+def _set_subscriber_status(email: str, token: str, status: str, allowed: tuple[str, ...]) -> dict | None:
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        sub = _subscriber(con, "email = ?", (email.strip().lower(),))
+        if not sub or not token or sub["token"] != token or sub["status"] not in allowed:
+            return None
+        if sub["status"] != status:
+            con.execute(
+                "UPDATE subscribers SET status = ?, updated_at = ?, dirty = dirty + 1 WHERE id = ?",
+                (status, now, sub["id"]),
+            )
+            sub["status"] = status
+        return sub
+
+
+def confirm_subscriber(email: str, token: str) -> dict | None:
+    """pending → active (idempotent). None om adress/token inte stämmer.
+
+    Med ändringstoken från add_subscriber tillämpas även den väntande ändringen.
+    """
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        row = con.execute(
+            "SELECT id FROM subscribers WHERE email = ? AND change_token = ? AND status IN ('pending', 'active')",
+            (email.strip().lower(), token),
+        ).fetchone()
+        if token and row:
+            con.execute(
+                "UPDATE subscribers SET name = pending_name, categories = pending_categories,"
+                " status = 'active', pending_name = NULL, pending_categories = NULL, change_token = NULL,"
+                " updated_at = ?, dirty = dirty + 1 WHERE id = ?",
+                (now, row[0]),
+            )
+            return _subscriber(con, "id = ?", (row[0],))
+    return _set_subscriber_status(email, token, "active", ("pending", "active"))
+
+
+def unsubscribe(email: str, token: str) -> dict | None:
+    """→ unsubscribed (idempotent). None om adress/token inte stämmer."""
+    return _set_subscriber_status(email, token, "unsubscribed", ("pending", "active", "unsubscribed"))
+
+
+def active_subscribers() -> list[dict]:
+    with connect() as con:
+        rows = con.execute(
+            f"SELECT {', '.join(SUBSCRIBER_COLS)} FROM subscribers WHERE status = 'active' ORDER BY id"
+        ).fetchall()
+    return [dict(zip(SUBSCRIBER_COLS, r)) for r in rows]
+
+
+def subscriber_counts() -> dict[str, int]:
+    with connect() as con:
+        return dict(con.execute("SELECT status, n FROM subscriber_counts WHERE n > 0").fetchall())
+
+
+def import_subscribers(rows: list[tuple]) -> int:
+    """Första inläsningen från arket: [(email, name, categories, status, token, sheet_row)].
+
+    Returnerar antal inlästa rader (nya eller kopplade till en befintlig prenumerant).
+    """
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    added = 0
+    with connect() as con:
+        sql = (
+            "INSERT INTO subscribers"
+            " (email, name, categories, status, token, created_at, updated_at, sheet_row, dirty)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)"
+            # Redan tillagd lokalt (före importen): behåll vår rad men knyt den till arkets rad
+            " ON CONFLICT(email) DO UPDATE SET sheet_row = COALESCE(sheet_row, excluded.sheet_row)"
+        )
+        for email, name, categories, status, token, sheet_row in rows:
+            try:
+                cur = con.execute(sql, (email, name, categories, status, token or None, now, now, sheet_row))
+            except sqlite3.IntegrityError:  # samma token på två rader i arket
+                cur = con.execute(sql, (email, name, categories, status, None, now, now, sheet_row))
+            added += cur.rowcount
+    return added
+
+
+def dirty_subscribers() -> list[dict]:
+    """Prenumeranter med ändringar som inte speglats till arket (inkl. nyckeln "dirty")."""
+    cols = (*SUBSCRIBER_COLS, "dirty")
+    with connect() as con:
+        rows = con.execute(
+            f"SELECT {', '.join(cols)} FROM subscribers WHERE dirty > 0 ORDER BY id"
+        ).fetchall()
+    return [dict(zip(cols, r)) for r in rows]
+
+
+def mark_subscribers_synced(rows: list[tuple[int, int | None, int]]) -> None:
+    """[(id, sheet_row, dirty som speglades)] – ändringar gjorda under tiden förblir dirty."""
+    with connect() as con:
+        con.executemany(
+            "UPDATE subscribers SET sheet_row = COALESCE(?, sheet_row),"
+            " dirty = CASE WHEN dirty = ? THEN 0 ELSE dirty END WHERE id = ?",
+            [(row, dirty, i) for i, row, dirty in rows],
+        )
+
+
+# ────────── Aggregat för adminpanelen ──────────
+def article_stats(since: str) -> list[tuple[str, str, int]]:
+    """[(dag, kategori, antal)] från och med dagen `since` (YYYY-MM-DD)."""
+    with connect() as con:
+        return con.execute(
+            "SELECT day, category, n FROM article_stats WHERE day >= ? AND n > 0 ORDER BY day",
+            (since,),
+        ).fetchall()
+
+
+def article_totals() -> dict[str, int]:
+    """{kategori: antal artiklar} totalt."""
+    with connect() as con:
+        return dict(con.execute(
+            "SELECT category, SUM(n) FROM article_stats GROUP BY category HAVING SUM(n) > 0"
+        ).fetchall())
+
+
+RUN_COLS = ("name", "started_at", "status", "duration", "added", "prompt_tokens", "completion_tokens", "cost_usd")
+
+
+def record_run(report: dict) -> None:
+    """Spara en körrapport (metrics.RunReport.finish()) som en rad i runs."""
+    tokens = report.get("openai_tokens") or {}
+    with connect() as con:
+        con.execute(
+            f"INSERT OR REPLACE INTO runs ({', '.join(RUN_COLS)}) VALUES ({', '.join('?' * len(RUN_COLS))})",
+            (
+                report["name"], report["started_at"], report.get("status"), report.get("duration_seconds"),
+                (report.get("totals") or {}).get("added"), tokens.get("prompt", 0),
+                tokens.get("completion", 0), report.get("openai_cost_usd", 0.0),
+            ),
+        )
+
+
+def recent_runs(name: str = "fetch", limit: int = 20) -> list[dict]:
+    """De senaste körningarna, nyast först."""
+    with connect() as con:
+        rows = con.execute(
+            f"SELECT {', '.join(RUN_COLS)} FROM runs WHERE name = ? ORDER BY started_at DESC LIMIT ?",
+            (name, limit),
+        ).fetchall()
+    return [dict(zip(RUN_COLS, r)) for r in rows]
+
+
+def run_costs(since: str, name: str = "fetch") -> list[tuple[str, float, int]]:
+    """[(dag, OpenAI-kostnad i USD, tokens)] per dag från och med `since`."""
+    with connect() as con:
+        return con.execute(
+            "SELECT substr(started_at, 1, 10), SUM(cost_usd), SUM(prompt_tokens + completion_tokens)"
+            " FROM runs WHERE name = ? AND started_at >= ? GROUP BY 1 ORDER BY 1",
+            (name, since),
+        ).fetchall()
+
+
+# ────────── Vektorcache (classify.py) ──────────
+def get_vectors(ids: list[str], dim: int) -> dict[str, bytes]:
+    """{id: vektor} för de id:n som finns i cachen med samma dimension."""
+    ids = [i for i in dict.fromkeys(ids) if i]
+    found = {}
+    with connect() as con:
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            found.update(con.execute(
+                f"SELECT id, vec FROM article_vectors WHERE dim = ? AND id IN ({','.join('?' * len(chunk))})",
+                (dim, *chunk),
+            ).fetchall())
+    return found
+
+
+def save_vectors(rows: list[tuple[str, bytes]], dim: int) -> None:
+    if not rows:
+        return
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with connect() as con:
+        con.executemany(
+            "INSERT OR REPLACE INTO article_vectors (id, dim, vec, created_at) VALUES (?, ?, ?, ?)",
+            [(i, dim, v, now) for i, v in rows],
+        )
+
+
+def prune_vectors(max_days: int) -> int:
+    """Ta bort cachade vektorer äldre än max_days. Returnerar antal borttagna."""
+    cutoff = (datetime.utcnow() - timedelta(days=max_days)).isoformat(timespec="seconds")
+    with connect() as con:
+        return con.execute("DELETE FROM article_vectors WHERE created_at < ?", (cutoff,)).rowcount
+
+
+def category_examples(categories: list[str], limit: int) -> list[tuple[str, str, str, str]]:
+    """[(id, title, summary, kategori)] – de `limit` senaste artiklarna per kategori."""
+    out = []
+    with connect() as con:
+        for category in dict.fromkeys(categories):
+            out.extend(con.execute(
+                "SELECT id, title, summary, category FROM articles WHERE category = ?"
+                " ORDER BY import_date DESC, id DESC LIMIT ?",
+                (category, limit),
+            ).fetchall())
+    return out
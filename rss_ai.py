@@ -1,20 +1,24 @@
-import os, hashlib, time, html, re, sys
+import hashlib, html, re, sys
 from datetime import datetime
 from urllib.parse import urlparse
 
-import feedparser
 import gspread
-from dateutil.parser import parse as dt
-from openai import OpenAI
 
-from news_db import init, insert, exists
+from news_db import init, existing_urls, feed_states, save_feed_states, upsert_sheet_articles
+from news_db import clear_sheet_rows, known_sheet_ids, SHEET_ROW_UNKNOWN
+from feed_fetch import download_feeds, parse_feed
+from summarizer import summarize_many
+import dedupe
+import feed_dates
+from sheet_sync import refresh_id_index, note_appended_ids
+from sheet_writer import SheetWriter
 
 
 def dbg(msg: str):
     print("[rss_ai]", msg, file=sys.stderr)
 
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+SUMMARY_PROMPT = "Sammanfatta följande nyhetsartikel på svenska i max 50 ord."
 
 PAYWALL_DOMAINS = {
     "dn.se", "svd.se", "ft.com", "nytimes.com", "theguardian.com", "kvalitetsmagasinet.se",
@@ -23,19 +27,17 @@ PAYWALL_HINTS = ("premium", "subscriber", "betalvägg", "paywall")
 
 
 def already_in_sheet(worksheet, article_id: str) -> bool:
-    """Kolla om artikel-id redan finns i Sheet (kolumn A)."""
-    try:
-        ids = worksheet.col_values(1)
-        return article_id in ids
-    except Exception as e:
-        dbg(f"Fel vid kontroll av dubblett i Sheet: {e}")
-        return False
+    """Kolla om artikel-id redan finns i Sheet (kolumn A), via det lokala id-indexet.
+
+    Indexet uppdateras med refresh_id_index(worksheet) en gång per körning.
+    """
+    return article_id in known_sheet_ids([article_id])
 
 
 def fetch_and_summarize():
     dbg("Startar RSS/AIs-jobb")
 
-    from app import sh
+    from app import sh, sheet_cache
     init()  # säkerställ att SQLite är initierad
 
     try:
@@ -50,36 +52,55 @@ def fetch_and_summarize():
     rows = sh.worksheet("Inställningar").get_all_records()
     dbg(f"Antal kategorirader: {len(rows)}")
 
+    try:
+        refresh_id_index(art_ws)  # läser bara id:n som tillkommit sedan förra körningen
+    except Exception as e:
+        dbg(f"Fel vid uppdatering av id-index: {e}")
+
+    sources = []
     for row in rows:
         category = row.get("Kategori", "").strip() or "Okänd"
         raw_feeds = row.get("Källa", "")
         feeds = [u.strip() for u in re.split(r"[,\s]+", raw_feeds) if u.strip()]
-        if not feeds:
-            continue
+        if feeds:
+            sources.append((category, feeds))
 
+    all_feeds = [u for _, feeds in sources for u in feeds]
+    downloads = download_feeds(all_feeds, feed_states(all_feeds))
+
+    pending, seen = [], set()
+    for category, feeds in sources:
         dbg(f"{category}: {len(feeds)} feeds")
         for feed_url in feeds:
             dbg(f"  Hämtar från: {feed_url}")
-            parsed = feedparser.parse(feed_url)
+            result = downloads[feed_url]
+            if result["error"]:
+                dbg(f"    fel: {result['error']}")
+                continue
+            if result["unchanged"]:
+                dbg("    oförändrad sedan förra körningen")
+                continue
+            parsed = parse_feed(result)
             dbg(f"    {len(parsed.entries)} entries")
 
-            for entry in parsed.entries[:10]:
+            entries = parsed.entries[:10]
+            known = existing_urls([e.get("link") for e in entries])
+            in_sheet = known_sheet_ids(
+                [hashlib.sha1(e["link"].encode()).hexdigest() for e in entries if e.get("link")]
+            )
+            for entry in entries:
                 url = entry.get("link")
-                if not url or exists(url):
+                if not url or url in known:
                     continue
 
                 art_id = hashlib.sha1(url.encode()).hexdigest()
-                if already_in_sheet(art_ws, art_id):
+                if art_id in seen or art_id in in_sheet:
                     continue
+                seen.add(art_id)
 
                 title = html.unescape(entry.get("title", "")).strip()
-                raw_date = entry.get("published") or entry.get("updated") or ""
                 import_date = datetime.utcnow().date().isoformat()
-
-                try:
-                    date = dt(raw_date).date().isoformat()
-                except Exception:
-                    date = import_date
+                date = feed_dates.entry_date(entry)
 
                 domain = urlparse(url).netloc.replace("www.", "")
                 is_paywall = domain in PAYWALL_DOMAINS or any(
@@ -87,61 +108,54 @@ def fetch_and_summarize():
                     for h in PAYWALL_HINTS
                 )
 
-                try:
-                    resp = client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": (
-                                    "Sammanfatta följande nyhetsartikel på svenska "
-                                    "i max 50 ord.\n\n"
-                                    f"Titel: {title}\nLänk: {url}"
-                                ),
-                            }
-                        ],
-                        max_tokens=120,
-                        temperature=0.2,
-                    )
-                    summary = resp.choices[0].message.content.strip()
-                except Exception as e:
-                    dbg(f"OpenAI-fel: {e}")
-                    continue
-
-                insert(
-                    (
-                        art_id,
-                        title,
-                        url,
-                        date,
-                        summary,
-                        category,
-                        int(is_paywall),
-                        import_date,
-                    )
+                pending.append(
+                    (feed_url, [art_id, title, url, date, "", category, is_paywall, import_date],
+                     entry.get("summary", ""))
                 )
 
-                art_ws.append_row(
-                    [
-                        art_id,
-                        title,
-                        url,
-                        date,
-                        summary,
-                        category,
-                        "1" if is_paywall else "0",
-                        import_date,
-                    ]
-                )
+    # En representant per story (kanonisk URL eller nästan samma text)
+    stories = [{"id": a[0], "url": a[2], "title": a[1], "text": t} for _, a, t in pending]
+    dups = dedupe.cluster(stories) if stories else []
+    for (_, a, _), dup in zip(pending, dups):
+        if dup:
+            dbg(f"    ~ samma story som {dup[:8]}: {a[1][:40]}")
+    stories = {st["id"]: st for st, dup in zip(stories, dups) if not dup}
+    pending = [(f, a) for (f, a, _), dup in zip(pending, dups) if not dup]
+
+    # Sammanfatta alla nya artiklar i ett svep (parallellt, under rate limit)
+    summaries = summarize_many([(a[1], a[2]) for _, a in pending], instruction=SUMMARY_PROMPT)
+
+    db_rows, sheet_rows, retry_feeds = [], [], set()
+    for (feed_url, art), summary in zip(pending, summaries):
+        if not summary:
+            retry_feeds.add(feed_url)  # OpenAI-fel – försök igen nästa körning
+            continue
+        art_id, title, url, date, _, category, is_paywall, import_date = art
+        db_rows.append((art_id, title, url, date, summary, category, int(is_paywall), import_date))
+        sheet_rows.append(
+            [art_id, title, url, date, summary, category, "1" if is_paywall else "0", import_date]
+        )
+        dbg(f"    + sparad: {title[:40]}{'...' if len(title) > 40 else ''}")
+
+    if sheet_rows:
+        # Arket först, SQLite sedan (med radnummer) – annars kan bakgrundssynkens
+        # push_articles hinna skriva samma rader en gång till
+        writer = SheetWriter(art_ws)
+        writer.append(sheet_rows)
+        row_nums = writer.flush()["rows"]
+        upsert_sheet_articles([
+            (*row, sheet_row or SHEET_ROW_UNKNOWN) for row, sheet_row in zip(db_rows, row_nums)
+        ])  # en transaktion för hela körningen
+        note_appended_ids([r[0] for r in sheet_rows], row_nums)
+        dedupe.remember([stories[r[0]] for r in sheet_rows])
+        sheet_cache.invalidate("Artiklar")
 
-                dbg(f"    + sparad: {title[:40]}{'...' if len(title) > 40 else ''}")
-                time.sleep(1)
+    save_feed_states([r for u, r in downloads.items() if u not in retry_feeds])
 
 
 def remove_duplicates_from_sheet():
     """Rensar bort dubbletter i Artiklar-fliken baserat på artikel-ID."""
-    from app import sh
-    import time
+    from app import sh, sheet_cache
 
     try:
         ws = sh.worksheet("Artiklar")
@@ -168,11 +182,15 @@ def remove_duplicates_from_sheet():
 
     print(f"[dup-rensning] Hittade {len(rows_to_delete)} dubbletter – rensar...", file=sys.stderr)
 
-    for row_num in reversed(rows_to_delete):
-        try:
-            ws.delete_rows(row_num)
-            time.sleep(1)
-        except Exception as e:
-            print(f"[dup-rensning] Misslyckades att ta bort rad {row_num}: {e}", file=sys.stderr)
+    # Sammanhängande rader slås ihop; allt skickas i ett batch_update
+    writer = SheetWriter(ws)
+    writer.delete_rows(rows_to_delete)
+    try:
+        res = writer.flush()
+        print(f"[dup-rensning] {res['deleted']} rader borttagna på {res['calls']} anrop", file=sys.stderr)
+    except Exception as e:
+        print(f"[dup-rensning] Misslyckades att ta bort rader: {e}", file=sys.stderr)
 
+    clear_sheet_rows()  # radnumren har flyttats – läs om vid nästa synk
+    sheet_cache.invalidate("Artiklar")
     print("[dup-rensning] Klart.", file=sys.stderr)
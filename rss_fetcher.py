@@ -3,11 +3,21 @@ import os, re, sys, hashlib, html, time, logging
 from datetime import datetime, timezone
 from urllib.parse import urlparse
 
-import feedparser
 import gspread
-from dateutil.parser import parse as dtparse
 from google.oauth2.service_account import Credentials
-from openai import OpenAI  # OpenAI 1.x
+
+import jobs
+import metrics
+import news_db
+import dedupe
+import feed_schedule
+import feed_dates
+import classify
+from feed_fetch import download_feeds, parse_feed
+from summarizer import summarize_many
+from sheet_sync import refresh_id_index, note_appended_ids
+from sheet_writer import SheetWriter
+from keywords import compile_keywords
 
 # ──────────────────────────────────────────────────────────────
 # 0) Loggning
@@ -23,10 +33,14 @@ log.setLevel(logging.INFO)
 # ──────────────────────────────────────────────────────────────
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 CREDS_PATH     = os.getenv("GOOGLE_CREDS_PATH", "/etc/secrets/service_account.json")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 MAX_ENTRIES_PER_FEED = int(os.getenv("MAX_ENTRIES_PER_FEED", "10"))
-SLEEP_BETWEEN_ITEMS  = float(os.getenv("SLEEP_BETWEEN_ITEMS", "0.4"))
+FETCH_PROFILE = os.getenv("FETCH_PROFILE", "")  # "cprofile" | "pyinstrument" – profilera varje körning
+
+SUMMARY_PROMPT = (
+    "Sammanfatta nyheten på svenska i max 40 ord. "
+    "Ingen rubrik, inga emojis. Vad har hänt och varför spelar det roll?"
+)
 
 # Paywall-heuristik
 PAYWALL_DOMAINS = {
@@ -46,8 +60,6 @@ def get_sheet_client():
     gc    = gspread.authorize(creds)
     return gc.open_by_key(SPREADSHEET_ID)
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-
 # ──────────────────────────────────────────────────────────────
 # 3) Hjälpare
 # ──────────────────────────────────────────────────────────────
@@ -87,14 +99,17 @@ def ensure_worksheets(sh):
 
     return ws_settings, ws_articles
 
-def get_existing_ids(ws_articles):
-    """Hämta alla redan kända id:n (kol A, exkl. header)."""
+def refresh_existing_ids(ws_articles) -> int:
+    """Uppdatera det lokala id-indexet (kol A) med rader som tillkommit sedan förra körningen.
+
+    Returnerar antal kända id:n. Själva uppslagen görs mot news_db.known_sheet_ids().
+    """
     try:
-        ids = ws_articles.col_values(1)[1:]  # hoppa header
-        return set(ids)
+        read = refresh_id_index(ws_articles)
+        log.info(f"Id-index: {read} nya rader lästa från Sheet")
     except Exception as e:
-        log.info(f"Kunde inte läsa existerande id:n: {e}")
-        return set()
+        log.info(f"Kunde inte uppdatera id-index: {e}")
+    return news_db.count_sheet_ids()
 
 def normalize_feeds(raw):
     """Städa upp en cell med en/ﬂera URL:er → unik lista med schema."""
@@ -124,13 +139,9 @@ def sha1_id(url: str) -> str:
     return hashlib.sha1(url.encode("utf-8")).hexdigest()
 
 def parse_date(value: str) -> str:
-    """Returnera YYYY-MM-DD, fallback till dagens datum (UTC)."""
-    if not value:
-        return datetime.now(timezone.utc).date().isoformat()
-    try:
-        return dtparse(value).date().isoformat()
-    except Exception:
-        return datetime.now(timezone.utc).date().isoformat()
+    """Returnera ISO 8601-tid i UTC (se feed_dates), fallback till nu."""
+    dt = feed_dates.parse_datetime(value)
+    return feed_dates.format_datetime(dt or datetime.now(timezone.utc))
 
 def is_paywalled(url: str, title: str = "", summary: str = "") -> bool:
     domain = urlparse(url).netloc.replace("www.", "").lower()
@@ -141,58 +152,75 @@ def is_paywalled(url: str, title: str = "", summary: str = "") -> bool:
 
 def summarize_sv(title: str, url: str) -> str:
     """Kort svensk sammanfattning via OpenAI. Fail-safe: tom sträng vid fel eller saknad nyckel."""
-    if not openai_client:
-        return ""
-    try:
-        resp = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{
-                "role": "user",
-                "content": (
-                    "Sammanfatta nyheten på svenska i max 40 ord. "
-                    "Ingen rubrik, inga emojis. Vad har hänt och varför spelar det roll?\n\n"
-                    f"Titel: {title}\nLänk: {url}"
-                ),
-            }],
-            max_tokens=120,
-            temperature=0.2,
-        )
-        return (resp.choices[0].message.content or "").strip()
-    except Exception as e:
-        log.info(f"OpenAI-fel: {e}")
-        return ""
+    return summarize_many([(title, url)], instruction=SUMMARY_PROMPT)[0]
 
 def matches_keywords(title: str, summary: str, keywords_str: str) -> bool:
-    """Returnerar True om keywords-strängen är tom, eller om minst ett nyckelord matchar."""
-    if not keywords_str:
-        return True
-    kws = [k.strip().lower() for k in re.split(r"[,;]+", keywords_str) if k.strip()]
-    if not kws:
-        return True
-    text = f"{title} {summary}".lower()
-    return any(k in text for k in kws)
+    """Returnerar True om keywords-strängen är tom, eller om minst ett nyckelord matchar.
+
+    Se keywords.py för syntax (helord, negativa nyckelord, diakritokänsligt).
+    """
+    return compile_keywords(keywords_str or "").match(title, summary)[0]
 
 # ──────────────────────────────────────────────────────────────
 # 4) Huvudflöde
 # ──────────────────────────────────────────────────────────────
-def fetch_and_append() -> int:
+def fetch_and_append(job=jobs.NO_JOB, profile: str | None = None, force: bool = False) -> int:
+    """Hämta, filtrera, sammanfatta och skriv nya artiklar. Returnerar antal nya rader.
+
+    `job` (jobs.Job) får progress-räknare och avbrytningspunkter fram till
+    att raderna skrivs – därefter körs allt klart. Varje körning skriver en
+    körrapport (metrics.RunReport); `profile` = "cprofile" | "pyinstrument"
+    profilerar körningen (standard: FETCH_PROFILE).
+
+    Bara flöden som är förfallna enligt feed_schedule hämtas; `force` hämtar alla.
+    """
+    report = metrics.RunReport("fetch")
+    status, added = "failed", 0
+    try:
+        with metrics.profiled(profile if profile is not None else FETCH_PROFILE, report):
+            added = _fetch_and_append(job, report, force)
+        status = "ok"
+        return added
+    except jobs.JobCancelled:
+        status = "cancelled"
+        raise
+    finally:
+        summary = report.finish(status, added=added)
+        try:
+            news_db.record_run(summary)  # adminpanelens statistik
+        except Exception as e:
+            log.warning(f"Kunde inte spara körningen i news_db: {e}")
+        job.progress(force=True, report=summary.get("path"))
+        slowest = ", ".join(f"{k} {v:.1f}s" for k, v in list(summary["stages"].items())[:4])
+        log.info(f"Körrapport: {summary['duration_seconds']:.1f}s ({slowest}), bortfall {summary['dropped']}")
+
+
+def _entry_timestamps(entries) -> list[float]:
+    """Postdatum (epoch, UTC) för de poster som har ett tolkat datum."""
+    return [dt.timestamp() for e in entries if (dt := feed_dates.entry_datetime(e))]
+
+
+def _fetch_and_append(job, report: metrics.RunReport, force: bool = False) -> int:
     if not SPREADSHEET_ID:
         raise RuntimeError("Saknar SPREADSHEET_ID")
-    sh = get_sheet_client()
-    ws_settings, ws_articles = ensure_worksheets(sh)
+    with report.stage("settings"):
+        sh = get_sheet_client()
+        ws_settings, ws_articles = ensure_worksheets(sh)
+        news_db.init()
 
-    # Läs inställningar
-    settings = ws_settings.get_all_records()
+        # Läs inställningar
+        settings = ws_settings.get_all_records()
     if not settings:
         log.info("Inställningar är tom – inget att göra.")
         return 0
 
     # Läs existerande id:n (för dedupe)
-    existing_ids = get_existing_ids(ws_articles)
-    log.info(f"Existerande artiklar i Sheet: {len(existing_ids)}")
+    with report.stage("id_index"):
+        log.info(f"Existerande artiklar i Sheet: {refresh_existing_ids(ws_articles)}")
+    run_ids = set()  # id:n som lagts till i denna körning
 
-    # Hämta och bygg rader
-    new_rows = []
+    # Samla alla källor först (ordningen bestämmer ordningen i Artiklar)
+    sources = []
     for row in settings:
         category  = (row.get("Kategori") or "").strip() or "Okänd"
         feeds     = normalize_feeds(row.get("Källa"))
@@ -204,45 +232,98 @@ def fetch_and_append() -> int:
         log.info(f"{category}: {len(feeds)} feed(s)")
         for f in feeds:
             log.info(f"  feed: {f}")
-
+        sources.append((category, feeds, keywords))
+
+    # Bara flöden som är förfallna enligt schemat (feed_schedule) hämtas
+    all_feeds = list(dict.fromkeys(u for _, feeds, _ in sources for u in feeds))
+    due, later = feed_schedule.plan(all_feeds, force=force)
+    for url, next_poll in later.items():
+        report.skipped(url, next_poll=next_poll)
+    log.info(f"Förfallna flöden: {len(due)}/{len(all_feeds)}" + (" (force)" if force else ""))
+
+    # Ladda ner flödena parallellt (villkorlig GET mot sparade validatorer)
+    job.progress(force=True, stage="download", feeds=len(due), not_due=len(later))
+    job.check()
+    started = time.monotonic()
+    with report.stage("download"):
+        downloads = download_feeds(due, news_db.feed_states(due))
+    unchanged = sum(1 for r in downloads.values() if r["unchanged"])
+    log.info(f"Hämtade {len(downloads)} feed(s) på {time.monotonic() - started:.1f}s ({unchanged} oförändrade)")
+    polled = dict(downloads)              # url -> resultat för schemat (parsefel räknas som fel)
+    timestamps: dict[str, list[float]] = {}
+
+    # Parsa och bygg rader i deterministisk ordning
+    new_rows, texts, row_feeds = [], [], []
+    feeds_done = 0
+    for category, feeds, keywords in sources:
+        matcher = compile_keywords(keywords)
         for feed_url in feeds:
+            job.progress(stage="parse", feeds_done=feeds_done, candidates=len(new_rows))
+            job.check()
+            result = downloads.get(feed_url)
+            if result is None:
+                continue  # inte förfallet enligt schemat
+            feeds_done += 1
+            if result["error"]:
+                report.fetched(result, "error")
+                log.info(f"  Fel vid hämtning av {feed_url}: {result['error']}")
+                continue
+            if result["unchanged"]:
+                report.fetched(result, "unchanged")
+                log.info(f"  {feed_url} → oförändrad sedan förra körningen")
+                continue
             try:
-                parsed = feedparser.parse(feed_url)
+                with report.stage("parse"):
+                    parsed = parse_feed(result)
             except Exception as e:
+                report.fetched(result, "parse_error")
+                polled[feed_url] = dict(result, error=f"parse: {e}")
                 log.info(f"  Fel vid parse av {feed_url}: {e}")
                 continue
+            report.fetched(result, "ok")
+            timestamps[feed_url] = _entry_timestamps(parsed.entries)
+            report.feed(feed_url, entries=len(parsed.entries))
 
             log.info(f"  {feed_url} → {len(parsed.entries)} entries")
             added_this_feed = 0
 
-            for entry in parsed.entries[:MAX_ENTRIES_PER_FEED]:
+            entries = parsed.entries[:MAX_ENTRIES_PER_FEED]
+            if len(parsed.entries) > len(entries):
+                report.drop("over_limit", feed_url, len(parsed.entries) - len(entries))
+            with report.stage("dedupe"):
+                known = news_db.known_sheet_ids([sha1_id(e["link"]) for e in entries if e.get("link")])
+
+            for entry in entries:
                 url   = entry.get("link")
                 title = html.unescape(entry.get("title") or "").strip()
                 entry_summary = entry.get("summary", "")
 
                 if not url:
+                    report.drop("no_link", feed_url)
                     log.info("    - skip: saknar link")
                     continue
                 if not title:
+                    report.drop("no_title", feed_url)
                     log.info(f"    - skip: saknar title ({url})")
                     continue
-                if not matches_keywords(title, entry_summary, keywords):
+                with report.stage("keywords"):
+                    keep, matched = matcher.match(title, entry_summary)
+                if not keep:
+                    report.drop("keyword_miss", feed_url)
                     log.info("    - skip: matchar ej nyckelord")
                     continue
 
                 _id = sha1_id(url)
-                if _id in existing_ids:
+                if _id in known or _id in run_ids:
+                    report.drop("duplicate", feed_url)
                     log.info(f"    - dup: {title[:60]}{'...' if len(title)>60 else ''}")
                     continue  # dedupe
 
-                # datum
-                raw_date = entry.get("published") or entry.get("updated") or ""
-                date = parse_date(raw_date)
+                # datum (feedparsers tolkade struct_time först, se feed_dates)
+                with report.stage("dates"):
+                    date = feed_dates.entry_date(entry)
                 import_date = datetime.now(timezone.utc).date().isoformat()
 
-                # summarization
-                summary = summarize_sv(title, url)
-
                 # paywall
                 paywall = is_paywalled(url, title, entry_summary)
 
@@ -252,31 +333,110 @@ def fetch_and_append() -> int:
                     title,
                     url,
                     date,
-                    summary,
+                    "",  # summary fylls i efter loopen
                     category,
                     "TRUE" if paywall else "FALSE",
                     import_date,
                 ])
 
-                existing_ids.add(_id)  # undvik dubbletter i samma körning
+                texts.append(entry_summary)
+                row_feeds.append(feed_url)
+                run_ids.add(_id)  # undvik dubbletter i samma körning
                 added_this_feed += 1
-                log.info(f"    + add: {title[:60]}{'...' if len(title)>60 else ''}")
-                time.sleep(SLEEP_BETWEEN_ITEMS)
+                hits = f" [{', '.join(matched)}]" if matched else ""
+                log.info(f"    + add: {title[:60]}{'...' if len(title)>60 else ''}{hits}")
 
             log.info(f"  {feed_url} → klart, nya i denna feed: {added_this_feed} (totalt stacked: {len(new_rows)})")
 
-    # Batch-append
+    # Slå ihop samma story (kanonisk URL eller nästan samma text) – en representant per story
+    stories = [{"id": r[0], "url": r[2], "title": r[1], "text": t} for r, t in zip(new_rows, texts)]
+    with report.stage("dedupe"):
+        dups = dedupe.cluster(stories) if stories else []
+    for r, dup, feed_url in zip(new_rows, dups, row_feeds):
+        if dup:
+            report.drop("near_duplicate", feed_url)
+            log.info(f"    ~ samma story som {dup[:8]}: {r[1][:60]}")
+    stories   = [st for st, dup in zip(stories, dups) if not dup]
+    row_feeds = [f for f, dup in zip(row_feeds, dups) if not dup]
+    new_rows  = [r for r, dup in zip(new_rows, dups) if not dup]
+
+    # Kategori + relevans (valfritt, classify.py) – innan sammanfattningen kostar tokens
+    if classify.CLASSIFY_MODE and new_rows:
+        job.progress(force=True, stage="classify", new=len(new_rows))
+        with report.stage("classify"):
+            # Flera rader i Inställningar kan ha samma kategori – allas nyckelord hör till prototypen
+            category_keywords: dict[str, list[str]] = {}
+            for category, _, keywords in sources:
+                category_keywords.setdefault(category, []).append(keywords)
+            verdicts = classify.assess(
+                [{"id": r[0], "text": f"{r[1]} {st['text']}", "category": r[5]} for r, st in zip(new_rows, stories)],
+                {category: ", ".join(k for k in kws if k) for category, kws in category_keywords.items()},
+            )
+        keep = []
+        for r, feed_url, (category, relevance, reason) in zip(new_rows, row_feeds, verdicts):
+            metrics.CLASSIFY_RELEVANCE.observe(relevance)
+            if reason:
+                report.drop(reason, feed_url)
+                log.info(f"    - {reason} ({relevance:.3f}): {r[1][:60]}")
+            elif category != r[5]:
+                log.info(f"    > {r[5]} → {category} ({relevance:.3f}): {r[1][:60]}")
+                r[5] = category
+            keep.append(not reason)
+        stories   = [st for st, k in zip(stories, keep) if k]
+        row_feeds = [f for f, k in zip(row_feeds, keep) if k]
+        new_rows  = [r for r, k in zip(new_rows, keep) if k]
+
+    # Sammanfatta alla nya artiklar i ett svep (parallellt, under rate limit)
+    job.progress(force=True, stage="summarize", feeds_done=feeds_done, new=len(new_rows))
+    job.check()
     if new_rows:
-        ws_articles.append_rows(new_rows, value_input_option="USER_ENTERED")
+        started = time.monotonic()
+        with report.stage("summarize"):
+            summaries = summarize_many([(r[1], r[2]) for r in new_rows], instruction=SUMMARY_PROMPT)
+        for r, summary in zip(new_rows, summaries):
+            r[4] = summary
+        log.info(f"Sammanfattade {len(new_rows)} artiklar på {time.monotonic() - started:.1f}s")
+
+    # Batch-append – sista avbrytningspunkten (sammanfattningarna finns kvar i cachen)
+    job.check()
+    job.progress(force=True, stage="append")
+    if new_rows:
+        with report.stage("append"):
+            writer = SheetWriter(ws_articles, value_input_option="USER_ENTERED")
+            writer.append(new_rows)
+            row_nums = writer.flush()["rows"]
         log.info(f"KLART: {len(new_rows)} nya artiklar tillagda.")
+
+        # Spegla till SQLite (läsmodellen) med radnummer i arket
+        with report.stage("persist"):
+            news_db.upsert_sheet_articles([
+                (*r[:6], 1 if r[6] == "TRUE" else 0, r[7], row or news_db.SHEET_ROW_UNKNOWN)
+                for r, row in zip(new_rows, row_nums)
+            ])
+            note_appended_ids([r[0] for r in new_rows], row_nums)
+            dedupe.remember(stories)
+        for feed_url in row_feeds:
+            report.added(feed_url)
     else:
         log.info("Inga nya artiklar hittades.")
 
+    # Spara validatorer och schema först när raderna är skrivna – annars görs flödet om nästa gång.
+    # `polled` har parsefelen markerade som fel: de flödena får inga nya validatorer och
+    # räknas alltså inte som oförändrade nästa körning.
+    with report.stage("persist"):
+        news_db.save_feed_states(list(polled.values()))
+        for row in feed_schedule.record(list(polled.values()), timestamps):
+            report.feed(row["url"], failures=row["failures"], rate_per_day=round(row["rate"] or 0, 2),
+                        next_poll=row["next_poll"])
+
+    job.progress(force=True, stage="klar", appended=len(new_rows))
     return len(new_rows)
 
 if __name__ == "__main__":
     try:
-        added = fetch_and_append()
+        # Samma lås som jobben i appen – krockar aldrig med en pågående hämtning där
+        with jobs.exclusive("fetch"):
+            added = fetch_and_append(force="--force" in sys.argv)
         log.info(f"Done. Added: {added}")
     except Exception as e:
         log.info(f"FATAL: {e}")
@@ -0,0 +1,294 @@
+# sheet_sync.py
+"""
+Synk mellan Google Sheet och SQLite (news_db)
+─────────────────────────────────────────────
+• sync_all()          – kör hela synken (körs i bakgrunden av app.py, oavsett READ_MODEL;
+                        push bara med READ_MODEL=sqlite)
+• pull_articles()     – nya rader i 'Artiklar' → SQLite, från senast synkade rad;
+                        rader som tagits bort ur arket tas bort ur SQLite
+• push_articles()     – lokalt skapade artiklar (needs_push) → append i 'Artiklar'
+• sync_small_tabs()   – ögonblicksbild av 'Inställningar' / 'Kategorier'
+• refresh_id_index()  – lokalt id-index för dedupe (news_db.sheet_ids), läser
+                        bara id-kolumnen från senast kända rad
+• note_appended_ids() – uppdatera id-indexet direkt efter en egen append
+• sync_subscribers()  – engångsimport av 'Prenumeranter' till news_db.subscribers,
+                        sedan spegling av lokala ändringar tillbaka till arket
+
+Nya artiklar läggs sist i 'Artiklar', så vi läser bara rader efter
+`sync_state.last_row`. Om raden på last_row inte längre har samma id (rader
+har tagits bort – av en redaktör eller rss_ai.remove_duplicates_from_sheet)
+görs en full omläsning. Arket är facit för vilka artiklar som finns: den som
+fanns i arket men saknas vid en full omläsning tas bort ur SQLite och sparas
+som gravsten (news_db.deleted_articles), så att den varken skrivs tillbaka
+eller hämtas in igen. Bara artiklar som skapats lokalt (news_db.insert, flaggan
+needs_push) skrivs till arket – aldrig bara för att radnumret saknas.
+
+För prenumeranter är SQLite facit efter importen: nya prenumeranter läggs
+sist i fliken, ändrade (status/namn/kategorier) skrivs på sin rad. Ändringar
+som görs direkt i arket efter importen läses inte in.
+"""
+
+from __future__ import annotations
+import sys
+
+import gspread
+from gspread.utils import rowcol_to_a1
+
+import news_db
+from sheet_writer import SheetWriter
+
+SMALL_TABS = ("Inställningar", "Kategorier")
+SUBSCRIBER_TAB = "Prenumeranter"
+SUBSCRIBER_HEADER = ("Namn", "E-post", "Kategorier", "Status", "Token")
+SUBSCRIBER_FIELDS = dict(zip(SUBSCRIBER_HEADER, ("name", "email", "categories", "status", "token")))
+
+
+def dbg(msg: str):
+    print("[sync]", msg, file=sys.stderr)
+
+
+# ────────── Hjälpare ──────────
+def _paywall(value) -> int:
+    return 1 if str(value).strip().upper() in ("TRUE", "1", "JA", "YES") else 0
+
+
+def _header_index(ws) -> dict[str, int]:
+    header = [h.strip().lower() for h in ws.row_values(1)]
+    return {name: header.index(name) for name in news_db.ARTICLE_COLS if name in header}
+
+
+def _row_to_article(values: list, idx: dict[str, int], row_num: int) -> tuple | None:
+    def col(name):
+        i = idx.get(name)
+        return values[i] if i is not None and i < len(values) else ""
+
+    art_id = str(col("id")).strip()
+    if not art_id:
+        return None
+    return (
+        art_id, col("title"), col("url") or None, col("date"), col("summary"),
+        col("category"), _paywall(col("paywall")), col("import_date"), row_num,
+    )
+
+
+# ────────── Artiklar ──────────
+def pull_articles(ws) -> int:
+    """Läs in rader som tillkommit i arket sedan förra synken. Returnerar antal lästa rader."""
+    idx = _header_index(ws)
+    if "id" not in idx:
+        dbg("Fliken 'Artiklar' saknar id-kolumn – hoppar över")
+        return 0
+
+    state = news_db.get_sync_state("Artiklar")
+    last_row = state["last_row"] or 1
+    # Full läsning: allt som fanns i SQLite innan dess och inte syns i arket är borttaget
+    watermark = news_db.article_watermark() if last_row <= 1 else None
+
+    # Läs från last_row (inte +1) för att kunna verifiera att numreringen är oförändrad
+    values = ws.get(f"A{last_row}:Z") if last_row > 1 else ws.get("A2:Z")
+    start = last_row if last_row > 1 else 2
+    if last_row > 1:
+        first_id = str(values[0][idx["id"]]).strip() if values and len(values[0]) > idx["id"] else ""
+        if first_id != state["last_id"]:
+            dbg("Radnumreringen i arket har ändrats – läser om allt")
+            news_db.clear_sheet_rows()
+            return pull_articles(ws)
+        values, start = values[1:], last_row + 1
+
+    rows = [a for n, v in enumerate(values, start=start) if (a := _row_to_article(v, idx, n))]
+    news_db.upsert_sheet_articles(rows)
+    if watermark is not None:
+        if rows:
+            removed = news_db.tombstone_missing({a[0] for a in rows}, watermark)
+            if removed:
+                dbg(f"{removed} artiklar har tagits bort ur arket – tas bort ur SQLite")
+        elif watermark:
+            dbg("Arket gav inga artiklar vid full läsning – tar inte bort något")
+
+    if rows:
+        last = rows[-1]
+        news_db.set_sync_state("Artiklar", last[8], last[0], last[7])
+    elif state["synced_at"] is None:
+        news_db.set_sync_state("Artiklar", None)  # tomt ark – första inläsningen är ändå klar
+    return len(values)
+
+
+def push_articles(ws) -> int:
+    """Skriv lokalt skapade artiklar (needs_push) till arket. Returnerar antal skrivna rader."""
+    pending = news_db.unsynced_articles()
+    if not pending:
+        return 0
+
+    header = [h.strip().lower() for h in ws.row_values(1)]
+    out = []
+    for a in pending:
+        a = dict(a, paywall="TRUE" if a["paywall"] else "FALSE")
+        out.append([a.get(h, "") for h in header])
+
+    writer = SheetWriter(ws, value_input_option="USER_ENTERED")
+    writer.append(out)
+    rows = writer.flush()["rows"]
+    # Okänt radnummer: skriven ändå, radnumret fylls i vid nästa pull
+    news_db.set_sheet_rows([(a["id"], row or news_db.SHEET_ROW_UNKNOWN) for a, row in zip(pending, rows)])
+
+    # Flytta bara fram pull-läget över rader som ansluter direkt – rader som någon
+    # annan lagt in före eller mellan våra bitar har pull ännu inte läst
+    state = news_db.get_sync_state("Artiklar")
+    n = _contiguous(state["last_row"], rows)
+    if n:
+        last = pending[n - 1]
+        news_db.set_sync_state("Artiklar", rows[n - 1], last["id"], last["import_date"])
+    return len(out)
+
+
+def _contiguous(last_row: int | None, rows: list[int | None]) -> int:
+    """Antal rader i början av `rows` som följer direkt efter last_row (0 om last_row är okänd)."""
+    n = 0
+    while last_row and n < len(rows) and rows[n] == last_row + n + 1:
+        n += 1
+    return n
+
+
+# ────────── Id-index för dedupe ──────────
+ID_INDEX = "Artiklar#ids"
+
+
+def refresh_id_index(ws) -> int:
+    """Läs in nya id:n från kolumn A sedan förra gången. Returnerar antal lästa rader.
+
+    Raden på last_row läses om och jämförs mot sparat id; om den ändrats
+    (rader borttagna/flyttade) byggs indexet om från början.
+    """
+    state = news_db.get_sync_state(ID_INDEX)
+    last_row = state["last_row"] or 1
+    values = [(r[0] if r else "") for r in ws.get(f"A{last_row}:A")]
+    start = last_row
+    if last_row > 1:
+        if not values or str(values[0]).strip() != state["last_id"]:
+            dbg("Id-kolumnen har ändrats – bygger om id-indexet")
+            news_db.clear_sheet_ids()
+            return refresh_id_index(ws)
+    # Första raden är antingen headern eller redan känd
+    values, start = values[1:], start + 1
+
+    ids = [str(v).strip() for v in values]
+    news_db.add_sheet_ids(ids)
+    filled = [(n, i) for n, i in enumerate(ids, start=start) if i]
+    if filled:
+        news_db.set_sync_state(ID_INDEX, filled[-1][0], filled[-1][1])
+    return len(ids)
+
+
+def note_appended_ids(ids: list[str], rows: list[int | None]) -> None:
+    """Lägg till egna nyss skrivna id:n (rows = radnummer per id, från SheetWriter.flush).
+
+    last_row flyttas bara fram över de rader som ansluter direkt till den.
+    """
+    news_db.add_sheet_ids(ids)
+    n = _contiguous(news_db.get_sync_state(ID_INDEX)["last_row"], rows)
+    if n:
+        news_db.set_sync_state(ID_INDEX, rows[n - 1], ids[n - 1])
+
+
+# ────────── Små flikar ──────────
+def sync_small_tabs(sh) -> None:
+    for tab in SMALL_TABS:
+        try:
+            rows = sh.worksheet(tab).get_all_records()
+        except gspread.WorksheetNotFound:
+            rows = None
+        news_db.replace_tab_rows(tab, rows)
+
+
+# ────────── Prenumeranter ──────────
+def ensure_subscribers(sh) -> int:
+    """Läs in 'Prenumeranter' till SQLite – bara första gången. Returnerar antal inlästa rader."""
+    news_db.init()
+    if news_db.get_sync_state(SUBSCRIBER_TAB)["last_row"] is not None:
+        return 0
+    try:
+        records = sh.worksheet(SUBSCRIBER_TAB).get_all_records()
+    except gspread.WorksheetNotFound:
+        records = []
+
+    rows = []
+    for n, r in enumerate(records, start=2):
+        email = str(r.get("E-post", "")).strip().lower()
+        if email:
+            rows.append((
+                email, str(r.get("Namn", "")).strip(), str(r.get("Kategorier", "")).strip(),
+                str(r.get("Status", "")).strip().lower() or "pending", str(r.get("Token", "")).strip(), n,
+            ))
+    imported = news_db.import_subscribers(rows)
+    news_db.set_sync_state(SUBSCRIBER_TAB, len(records) + 1)
+    dbg(f"Importerade {imported} prenumeranter från arket")
+    return imported
+
+
+def push_subscribers(sh) -> int:
+    """Spegla ändrade prenumeranter till arket. Returnerar antal skrivna rader."""
+    pending = news_db.dirty_subscribers()
+    if not pending:
+        return 0
+    try:
+        ws = sh.worksheet(SUBSCRIBER_TAB)
+        header = [h.strip() for h in ws.row_values(1)]
+    except gspread.WorksheetNotFound:
+        ws = sh.add_worksheet(title=SUBSCRIBER_TAB, rows=1, cols=len(SUBSCRIBER_HEADER))
+        ws.append_row(list(SUBSCRIBER_HEADER))
+        header = list(SUBSCRIBER_HEADER)
+
+    # Skriv bara våra kolumner på befintliga rader – övriga kolumner i arket lämnas orörda
+    owned = [i for i, h in enumerate(header) if h in SUBSCRIBER_FIELDS]
+    runs = []
+    for i in owned:
+        if runs and i == runs[-1][1] + 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+
+    writer = SheetWriter(ws)
+    new = []
+    for sub in pending:
+        values = [str(sub.get(SUBSCRIBER_FIELDS.get(h), "") or "") for h in header]
+        if sub["sheet_row"]:
+            for first, last in runs:
+                a1 = f"{rowcol_to_a1(sub['sheet_row'], first + 1)}:{rowcol_to_a1(sub['sheet_row'], last + 1)}"
+                writer.update(a1, [values[first:last + 1]])
+        else:
+            new.append(sub)
+            writer.append([values])
+    rows = dict(zip((sub["id"] for sub in new), writer.flush()["rows"]))
+    news_db.mark_subscribers_synced([(s["id"], rows.get(s["id"]), s["dirty"]) for s in pending])
+    return len(pending)
+
+
+def sync_subscribers(sh) -> dict:
+    """Import (första gången) + spegling. Kör under jobs.exclusive("subscribers") så att
+    två processer inte lägger till samma rad."""
+    imported = ensure_subscribers(sh)
+    pushed = push_subscribers(sh)
+    if pushed:
+        dbg(f"Speglade {pushed} prenumeranter till arket")
+    return {"imported": imported, "pushed": pushed}
+
+
+# ────────── Allt ──────────
+def sync_all(sh, push: bool = True) -> dict:
+    """Pull först (så att rader som redan skrivits till arket får radnummer), sedan push.
+
+    push=False (READ_MODEL=sheet): hämtarna skriver direkt till arket, så synken bara läser.
+    """
+    news_db.init()
+    try:
+        ws = sh.worksheet("Artiklar")
+    except gspread.WorksheetNotFound:
+        dbg("Fliken 'Artiklar' saknas – inget att synka")
+        return {"pulled": 0, "pushed": 0}
+
+    pulled = pull_articles(ws)
+    pushed = push_articles(ws) if push else 0
+    sync_small_tabs(sh)
+    if pulled or pushed:
+        dbg(f"Synk klar: {pulled} rader in, {pushed} rader ut")
+    return {"pulled": pulled, "pushed": pushed}
@@ -0,0 +1,153 @@
+# sheet_writer.py
+"""
+Skrivningar mot Google Sheets i få, stora anrop
+───────────────────────────────────────────────
+• SheetWriter(ws)          – köar append / update / delete mot en flik
+    .append(rows)          – rader läggs sist (skickas i bitar om APPEND_CHUNK rader)
+    .update(a1, values)    – cellområden (ett batch_update för upp till UPDATE_CHUNK områden)
+    .delete_rows(nums)     – radnummer; sammanhängande rader slås ihop till ett intervall
+                             och alla intervall skickas i ett batch_update
+    .flush()               – skickar allt: updates → deletes → appends
+• appended_start_row()     – radnummer för första raden i ett append-svar
+
+Appends i flera bitar är inte nödvändigtvis ett sammanhängande block – en
+annan skrivare (cron-hämtaren, synken i en annan worker) kan lägga rader
+emellan. flush() returnerar därför radnumret för varje skriven rad ("rows",
+None där svaret saknar intervall); "first_row" sätts bara när alla rader
+hamnade i ett sammanhängande block.
+
+Anrop görs om vid 429 / 5xx med exponentiell backoff + jitter (Retry-After
+från Google respekteras om den finns). Appends och radborttagningar är inte
+idempotenta – ett 5xx kan komma efter att Google redan skrivit – så de görs
+bara om vid 429 (som avvisas innan något skrivs), annars dubbleras rader
+eller fel rader tas bort.
+"""
+
+from __future__ import annotations
+import os, re, sys, time, random
+
+import gspread
+
+APPEND_CHUNK  = int(os.getenv("SHEETS_APPEND_CHUNK", "500"))
+UPDATE_CHUNK  = int(os.getenv("SHEETS_UPDATE_CHUNK", "200"))
+DELETE_CHUNK  = int(os.getenv("SHEETS_DELETE_CHUNK", "500"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "6"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+QUOTA_STATUS = {429}  # för anrop som inte tål att köras två gånger
+
+
+def dbg(msg: str):
+    print("[sheets]", msg, file=sys.stderr)
+
+
+def appended_start_row(resp) -> int | None:
+    """Plocka ut startraden ur `updates.updatedRange` (t.ex. 'Artiklar!A120:H125')."""
+    try:
+        rng = resp["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    m = re.search(r"![A-Z]+(\d+)", rng)
+    return int(m.group(1)) if m else None
+
+
+def call_with_retry(fn, *args, retry_status=RETRY_STATUS, **kwargs):
+    """Kör ett Sheets-anrop; gör om vid statuskoderna i retry_status (kvot- och serverfel)."""
+    for attempt in range(SHEETS_MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            response = getattr(e, "response", None)
+            status = getattr(response, "status_code", None)
+            if status not in retry_status or attempt >= SHEETS_MAX_RETRIES:
+                raise
+            try:
+                delay = float(response.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                delay = min(64.0, 2.0 ** attempt) + random.uniform(0, 1)
+            dbg(f"HTTP {status}, nytt försök om {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _row_ranges(rows: list[int]) -> list[tuple[int, int]]:
+    """[5, 6, 7, 10] → [(10, 10), (5, 7)] – sammanhängande, sjunkande ordning."""
+    ranges = []
+    for r in sorted(set(rows)):
+        if ranges and r == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], r)
+        else:
+            ranges.append((r, r))
+    return list(reversed(ranges))
+
+
+class SheetWriter:
+    def __init__(self, ws, value_input_option: str = "RAW"):
+        self.ws = ws
+        self.value_input_option = value_input_option
+        self._appends: list[list] = []
+        self._updates: list[dict] = []
+        self._deletes: list[int] = []
+        self.calls = 0
+
+    def append(self, rows: list[list]) -> None:
+        self._appends.extend(rows)
+
+    def update(self, a1_range: str, values: list[list]) -> None:
+        self._updates.append({"range": a1_range, "values": values})
+
+    def delete_rows(self, row_nums: list[int]) -> None:
+        self._deletes.extend(row_nums)
+
+    def flush(self) -> dict:
+        """Skicka allt som köats. Returnerar {"first_row", "rows", "appended", "updated", "deleted", "calls"}."""
+        result = {"first_row": None, "rows": [], "appended": 0, "updated": 0, "deleted": 0}
+
+        # 1) Updates först – radnumren gäller arket som det ser ut innan något tas bort
+        updates, self._updates = self._updates, []
+        for i in range(0, len(updates), UPDATE_CHUNK):
+            chunk = updates[i:i + UPDATE_CHUNK]
+            call_with_retry(self.ws.batch_update, chunk, value_input_option=self.value_input_option)
+            self.calls += 1
+            result["updated"] += len(chunk)
+
+        # 2) Deletes – nerifrån och upp så att index inte flyttas under tiden
+        deletes, self._deletes = self._deletes, []
+        ranges = _row_ranges(deletes)
+        for i in range(0, len(ranges), DELETE_CHUNK):
+            requests = [
+                {
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": self.ws.id,
+                            "dimension": "ROWS",
+                            "startIndex": start - 1,
+                            "endIndex": end,
+                        }
+                    }
+                }
+                for start, end in ranges[i:i + DELETE_CHUNK]
+            ]
+            call_with_retry(self.ws.spreadsheet.batch_update, {"requests": requests},
+                            retry_status=QUOTA_STATUS)
+            self.calls += 1
+        result["deleted"] = len(set(deletes))
+
+        # 3) Appends i bitar
+        appends, self._appends = self._appends, []
+        for i in range(0, len(appends), APPEND_CHUNK):
+            chunk = appends[i:i + APPEND_CHUNK]
+            resp = call_with_retry(
+                self.ws.append_rows, chunk, value_input_option=self.value_input_option,
+                retry_status=QUOTA_STATUS,
+            )
+            self.calls += 1
+            start = appended_start_row(resp)
+            result["rows"] += [start + n if start else None for n in range(len(chunk))]
+            result["appended"] += len(chunk)
+
+        rows = result["rows"]
+        if rows and rows[0] and rows == list(range(rows[0], rows[0] + len(rows))):
+            result["first_row"] = rows[0]
+
+        result["calls"] = self.calls
+        return result
@@ -0,0 +1,227 @@
+# summarizer.py
+"""
+Sammanfattningssteg för RSS-jobben
+──────────────────────────────────
+• summarize_many()  – sammanfattar alla nya artiklar i en körning
+    - begränsad parallellism (SUMMARY_WORKERS)
+    - token bucket för requests/min och tokens/min (OPENAI_RPM / OPENAI_TPM)
+    - omförsök vid 429 och 5xx med jitter-backoff (respekterar Retry-After)
+    - batchläge (SUMMARY_BATCH_SIZE > 0): flera artiklar i ett anrop, JSON-svar
+    - innehållsadresserad cache i SQLite (news_db.summary_cache): samma
+      titel + kanoniska URL + prompt + modell sammanfattas aldrig två gånger
+
+Genomströmningen styrs alltså av API-kvoten, inte av fasta sleep-anrop.
+Sätt OPENAI_BASE_URL för att peka mot en lokal fake-server vid test.
+"""
+
+from __future__ import annotations
+import os, sys, json, time, random, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from openai import OpenAI  # OpenAI 1.x
+
+import news_db
+from dedupe import canonical_url
+from metrics import OPENAI_TOKENS, OPENAI_REQUESTS, OPENAI_SECONDS, SUMMARY_CACHE, profile_thread
+
+# ────────── Konfiguration ──────────
+OPENAI_API_KEY     = os.getenv("OPENAI_API_KEY", "")
+OPENAI_BASE_URL    = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MODEL       = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_RPM         = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM         = int(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+SUMMARY_WORKERS    = int(os.getenv("SUMMARY_WORKERS", "4"))
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "0"))  # 0 = ett anrop per artikel
+SUMMARY_CACHE_MAX_ROWS = int(os.getenv("SUMMARY_CACHE_MAX_ROWS", "50000"))
+SUMMARY_CACHE_MAX_DAYS = int(os.getenv("SUMMARY_CACHE_MAX_DAYS", "90"))
+
+# Klienten gör inga egna omförsök – det sköter schemaläggaren nedan
+client = (
+    OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
+    if OPENAI_API_KEY else None
+)
+
+
+def dbg(msg: str):
+    print("[summarizer]", msg, file=sys.stderr)
+
+
+# ────────── Cache-nycklar ──────────
+def cache_key(title: str, url: str, instruction: str) -> str:
+    """Nyckel för sammanfattningscachen: (titel, kanonisk URL, promptversion, modell)."""
+    prompt_version = hashlib.sha1(instruction.encode("utf-8")).hexdigest()[:12]
+    norm_title = " ".join((title or "").lower().split())
+    raw = "\x1f".join((norm_title, canonical_url(url), prompt_version, OPENAI_MODEL))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+# ────────── Token bucket ──────────
+class TokenBucket:
+    """Enkel token bucket: `per_minute` enheter fylls på jämnt över en minut."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(1, per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, n: float = 1.0) -> None:
+        n = min(n, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_requests = TokenBucket(OPENAI_RPM)
+_tokens   = TokenBucket(OPENAI_TPM)
+
+
+# ────────── Anrop med omförsök ──────────
+def _retry_delay(attempt: int, err: Exception) -> float:
+    """Backoff med full jitter; Retry-After från servern går före."""
+    response = getattr(err, "response", None)
+    if response is not None:
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(60.0, 2.0 ** attempt))
+
+
+def _retryable(err: Exception) -> bool:
+    if isinstance(err, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(err, openai.APIStatusError) and err.status_code >= 500
+
+
+def _complete(prompt: str, max_tokens: int, **kwargs) -> str:
+    """Ett chat-anrop under rate limit. Kastar vid fel som inte går att försöka om."""
+    estimate = len(prompt) // 3 + max_tokens
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        _requests.take(1)
+        _tokens.take(estimate)
+        try:
+            with OPENAI_SECONDS.time():
+                resp = client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=0.2,
+                    **kwargs,
+                )
+            OPENAI_REQUESTS.inc(outcome="ok")
+            if usage := getattr(resp, "usage", None):
+                OPENAI_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+                OPENAI_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+            return (resp.choices[0].message.content or "").strip()
+        except Exception as e:
+            if attempt >= OPENAI_MAX_RETRIES or not _retryable(e):
+                OPENAI_REQUESTS.inc(outcome="error")
+                raise
+            OPENAI_REQUESTS.inc(outcome="retry")
+            delay = _retry_delay(attempt, e)
+            dbg(f"OpenAI {e.__class__.__name__}, nytt försök om {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _item_text(title: str, url: str) -> str:
+    return f"Titel: {title}\nLänk: {url}"
+
+
+def _summarize_one(item: tuple[str, str], instruction: str, max_tokens: int) -> str:
+    title, url = item
+    try:
+        return _complete(f"{instruction}\n\n{_item_text(title, url)}", max_tokens)
+    except Exception as e:
+        dbg(f"OpenAI-fel: {e}")
+        return ""
+
+
+def _summarize_batch(items: list[tuple[str, str]], instruction: str, max_tokens: int) -> list[str]:
+    """Flera artiklar i ett anrop. Vid trasigt svar körs artiklarna en och en."""
+    listing = "\n\n".join(f"{i}. {_item_text(t, u)}" for i, (t, u) in enumerate(items, start=1))
+    prompt = (
+        f"{instruction}\n\n"
+        "Gör detta för var och en av artiklarna nedan. Svara enbart med JSON på formen "
+        '{"summaries": ["...", "..."]} med en sammanfattning per artikel, i samma ordning.\n\n'
+        f"{listing}"
+    )
+    try:
+        raw = _complete(prompt, max_tokens * len(items), response_format={"type": "json_object"})
+        summaries = json.loads(raw).get("summaries")
+        if isinstance(summaries, list) and len(summaries) == len(items):
+            return [str(s or "").strip() for s in summaries]
+        dbg(f"Batchsvar hade fel antal ({len(summaries or [])}/{len(items)}) – kör en och en")
+    except Exception as e:
+        dbg(f"Batchfel: {e} – kör en och en")
+    return [_summarize_one(it, instruction, max_tokens) for it in items]
+
+
+# ────────── Publikt API ──────────
+def summarize_many(
+    items: list[tuple[str, str]],
+    *,
+    instruction: str,
+    max_tokens: int = 120,
+    batch_size: int | None = None,
+) -> list[str]:
+    """Sammanfatta [(titel, url), ...]. Returnerar en sträng per artikel i samma ordning.
+
+    Fail-safe: tom sträng för artiklar som inte gick att sammanfatta.
+    Redan kända artiklar tas ur cachen utan API-anrop.
+    """
+    if not items:
+        return []
+
+    keys = [cache_key(t, u, instruction) for t, u in items]
+    try:
+        cached = news_db.cached_summaries(list(set(keys)))
+    except Exception as e:
+        dbg(f"Cache ej tillgänglig: {e}")
+        cached = {}
+
+    # Unika missar (samma nyckel kan förekomma flera gånger i en körning)
+    misses = {}
+    for k, it in zip(keys, items):
+        if k not in cached and k not in misses:
+            misses[k] = it
+    hits = len(items) - sum(1 for k in keys if k in misses)
+    SUMMARY_CACHE.inc(hits, result="hit")
+    SUMMARY_CACHE.inc(len(items) - hits, result="miss")
+    if cached:
+        dbg(f"Cacheträffar: {hits}/{len(items)}")
+
+    fresh = {}
+    if misses and client:
+        todo = list(misses.items())
+        batch_size = SUMMARY_BATCH_SIZE if batch_size is None else batch_size
+        with ThreadPoolExecutor(max_workers=max(1, SUMMARY_WORKERS)) as pool:
+            if batch_size > 1:
+                chunks = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+                results = pool.map(
+                    profile_thread(lambda c: _summarize_batch([it for _, it in c], instruction, max_tokens)),
+                    chunks,
+                )
+                summaries = [s for chunk in results for s in chunk]
+            else:
+                summaries = list(
+                    pool.map(profile_thread(lambda kv: _summarize_one(kv[1], instruction, max_tokens)), todo)
+                )
+        fresh = {k: s for (k, _), s in zip(todo, summaries)}
+        try:
+            news_db.cache_summaries(fresh)
+            news_db.prune_summary_cache(SUMMARY_CACHE_MAX_ROWS, SUMMARY_CACHE_MAX_DAYS)
+        except Exception as e:
+            dbg(f"Kunde inte spara i cache: {e}")
+
+    return [cached.get(k) or fresh.get(k, "") for k in keys]
@@ -0,0 +1,10 @@
+# tests/conftest.py
+"""Gemensamt för testerna: modulerna ligger i repots rot och news_db får en egen fil."""
+
+import os, sys, tempfile, pathlib
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Måste sättas innan news_db importeras (DB_PATH läses vid import)
+os.environ.setdefault("NEWS_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="news_db_test_"), "news.sqlite"))
@@ -0,0 +1,58 @@
+# tests/test_admin_stats.py
+"""Artikelstatistiken i READ_MODEL=sheet: arkivet i arket räknas in via synkens pull."""
+
+from datetime import date
+
+import pytest
+
+import admin_stats
+import news_db
+import sheet_sync
+
+HEADER = ["id", "title", "url", "date", "summary", "category", "paywall", "import_date"]
+
+
+class FakeWorksheet:
+    def __init__(self, rows):
+        self.rows = [HEADER, *rows]
+
+    def row_values(self, n):
+        return self.rows[n - 1]
+
+    def get(self, a1):
+        first = int(a1.split(":")[0][1:])
+        return self.rows[first - 1:]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_db, "DB_PATH", tmp_path / "news.sqlite")
+    news_db.init()
+
+
+def article(n, day, category):
+    return [f"id{n}", f"titel {n}", f"https://example.se/{n}", day, "", category, "FALSE", day]
+
+
+def test_totals_include_the_sheet_archive_after_pull(db):
+    assert admin_stats.snapshot(today=date(2026, 3, 10))["articles"]["backfilled"] is False
+
+    ws = FakeWorksheet([article(1, "2025-01-02", "AI"), article(2, "2025-01-03", "AI"),
+                        article(3, "2026-03-09", "Robotik")])
+    assert sheet_sync.pull_articles(ws) == 3
+
+    a = admin_stats.snapshot(today=date(2026, 3, 10))["articles"]
+    assert a["backfilled"] is True
+    assert a["total"] == 3
+    assert a["recent"] == 1
+    assert {c["category"]: c["total"] for c in a["per_category"]} == {"AI": 2, "Robotik": 1}
+
+    # Nästa pull läser bara nya rader – inget räknas två gånger
+    ws.rows.append(article(4, "2026-03-10", "AI"))
+    assert sheet_sync.pull_articles(ws) == 1
+    assert admin_stats.snapshot(today=date(2026, 3, 10))["articles"]["total"] == 4
+
+
+def test_empty_sheet_counts_as_backfilled(db):
+    assert sheet_sync.pull_articles(FakeWorksheet([])) == 0
+    assert admin_stats.snapshot()["articles"]["backfilled"] is True
@@ -0,0 +1,96 @@
+# tests/test_article_index.py
+"""Sidvisning i sheet-läge: ArticleIndex mot en rak sortering, och att indexet byggs per version."""
+
+import random
+
+import app
+from app import ArticleIndex, SheetCache
+
+
+def reference(rows, limit, after, categories, date_from, date_to, paywall):
+    """Den ursprungliga algoritmen: sortera allt, skanna linjärt."""
+    out = []
+    for r in sorted(rows, key=ArticleIndex.key, reverse=True):
+        k = ArticleIndex.key(r)
+        if after and not k < after:
+            continue
+        if categories and r.get("category") not in categories:
+            continue
+        if date_from and k[0] < date_from:
+            continue
+        if date_to and k[0] > date_to:
+            continue
+        if paywall is not None and (str(r.get("paywall")).upper() in ("TRUE", "1")) != paywall:
+            continue
+        out.append(r)
+        if len(out) >= limit:
+            break
+    return out
+
+
+def random_rows(rnd, n):
+    return [{
+        "id": f"a{i}",
+        "import_date": f"2026-01-{rnd.randint(1, 20):02d}",
+        "category": rnd.choice(["AI", "Sport", "Ekonomi", ""]),
+        "paywall": rnd.choice(["TRUE", "FALSE", "1", ""]),
+    } for i in rnd.sample(range(n * 2), n)]
+
+
+def test_pages_match_a_full_sort():
+    rnd = random.Random(7)
+    rows = random_rows(rnd, 400)
+    index = ArticleIndex(rows)
+    for _ in range(300):
+        after = ArticleIndex.key(rnd.choice(rows)) if rnd.random() < 0.6 else None
+        categories = rnd.sample(["AI", "Sport", "Ekonomi", "Kultur"], rnd.randint(0, 3))
+        date_from = f"2026-01-{rnd.randint(1, 20):02d}" if rnd.random() < 0.3 else None
+        date_to = f"2026-01-{rnd.randint(1, 20):02d}" if rnd.random() < 0.3 else None
+        paywall = rnd.choice([None, True, False])
+        limit = rnd.randint(1, 30)
+        args = (limit, after, categories, date_from, date_to, paywall)
+        assert index.page(*args) == reference(rows, *args)
+
+
+def test_walking_the_cursor_covers_every_row_once():
+    rows = random_rows(random.Random(3), 120)
+    index = ArticleIndex(rows)
+    seen, after = [], None
+    while page := index.page(7, after, ["AI", "Sport"], None, None, None):
+        seen += page
+        after = ArticleIndex.key(page[-1])
+    assert seen == reference(rows, len(rows), None, ["AI", "Sport"], None, None, None)
+
+
+def test_index_is_rebuilt_only_when_the_tab_changes():
+    data = {"Artiklar": [{"id": "a1", "import_date": "2026-01-01"}]}
+    cache = SheetCache(lambda tab: list(data[tab]), ttl=0, stale=0)
+    built = []
+
+    def build(rows):
+        built.append(rows)
+        return ArticleIndex(rows)
+
+    first = cache.derived("Artiklar", "index", build)
+    cache.invalidate("Artiklar")
+    assert cache.derived("Artiklar", "index", build) is first  # samma innehåll, ny läsning
+    assert len(built) == 1
+
+    data["Artiklar"].append({"id": "a2", "import_date": "2026-01-02"})
+    cache.invalidate("Artiklar")
+    latest = cache.derived("Artiklar", "index", build)
+    assert latest is not first and len(built) == 2
+    assert [r["id"] for r in latest.page(10, None, [], None, None, None)] == ["a2", "a1"]
+
+
+def test_public_articles_pages_from_the_index(monkeypatch):
+    rows = [{"id": f"a{i}", "import_date": f"2026-01-{i:02d}", "category": "AI"} for i in range(1, 6)]
+    monkeypatch.setattr(app, "READ_MODEL", "sheet")
+    monkeypatch.setattr(app, "sheet_cache", SheetCache(lambda tab: rows, ttl=60, stale=60))
+    client = app.app.test_client()
+
+    first = client.get("/public/articles?limit=3&category=AI").get_json()
+    assert [r["id"] for r in first["items"]] == ["a5", "a4", "a3"]
+    rest = client.get(f"/public/articles?limit=3&cursor={first['next_cursor']}").get_json()
+    assert [r["id"] for r in rest["items"]] == ["a2", "a1"]
+    assert rest["next_cursor"] is None
@@ -0,0 +1,118 @@
+# tests/test_classify.py
+"""classify.assess: tröskel, omdirigering, CLASSIFY_MAX_ITEMS och för lite historik."""
+
+import itertools
+import random
+
+import pytest
+
+import classify
+import news_db
+
+TOPICS = {
+    "AI": "språkmodell neuralt nätverk träning gpu chattbot maskininlärning openai modellen",
+    "Sport": "fotboll match mål allsvenskan tränaren laget straff derby",
+    "Ekonomi": "börsen räntan inflation riksbanken kronan aktier tillväxt budget",
+}
+FILLER = "och att det som en på är för med till av den har inte"
+OFF_TOPIC = "recept kanelbullar bakning vetemjöl smör kardemumma ugn deg"
+KEYWORDS = {"AI": '"ai", robot', "Sport": "fotboll", "Ekonomi": "börs"}
+
+
+def text(topic: str, rng: random.Random, n: int = 12) -> str:
+    return " ".join(rng.choices(topic.split(), k=n) + rng.choices(FILLER.split(), k=6))
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_db, "DB_PATH", tmp_path / "news.sqlite")
+    news_db.init()
+    monkeypatch.setattr(classify, "_model_cache", None)
+    monkeypatch.setattr(classify, "CLASSIFY_MODE", "score")
+    monkeypatch.setattr(classify, "CLASSIFY_THRESHOLD", 0.1)
+    monkeypatch.setattr(classify, "CLASSIFY_MARGIN", 0.05)
+    monkeypatch.setattr(classify, "CLASSIFY_MAX_ITEMS", 0)
+    monkeypatch.setattr(classify, "CLASSIFY_MIN_EXAMPLES", 10)
+
+    rng = random.Random(1)
+    news_db.upsert_sheet_articles([
+        (f"{cat}{n}", text(words, rng, 6), f"https://example.se/{cat}/{n}", "2025-06-10",
+         text(words, rng), cat, 0, "2025-06-10", None)
+        for cat, words in TOPICS.items() for n in range(20)
+    ])
+
+
+_ids = itertools.count()  # vektorerna cachas per artikel-id – nya id:n för varje post
+
+
+def assess(*items, categories=None):
+    return classify.assess(
+        [{"id": f"ny{next(_ids)}", "text": t, "category": c} for c, t in items],
+        {**KEYWORDS, **(categories or {})},
+    )
+
+
+def test_on_topic_kept_and_off_topic_dropped():
+    rng = random.Random(2)
+    (cat, rel, reason), (_, low, drop) = assess(("AI", text(TOPICS["AI"], rng)), ("AI", OFF_TOPIC))
+    assert (cat, reason) == ("AI", None) and rel >= classify.CLASSIFY_THRESHOLD
+    assert drop == "low_relevance" and low < classify.CLASSIFY_THRESHOLD
+
+
+def test_route_moves_to_a_clearly_better_category(monkeypatch):
+    sport = text(TOPICS["Sport"], random.Random(3))
+    assert assess(("AI", sport))[0][0] == "AI"  # score-läget flyttar aldrig
+
+    monkeypatch.setattr(classify, "CLASSIFY_MODE", "route")
+    category, relevance, reason = assess(("AI", sport))[0]
+    assert (category, reason) == ("Sport", None)
+    assert relevance >= classify.CLASSIFY_THRESHOLD
+
+    # Ingen kategori tydligt bättre (ingen historik alls) => kvar
+    assert assess(("AI", OFF_TOPIC))[0][0] == "AI"
+
+
+def test_max_items_keeps_the_most_relevant(monkeypatch):
+    monkeypatch.setattr(classify, "CLASSIFY_MAX_ITEMS", 2)
+    rng = random.Random(4)
+    items = [("Ekonomi", text(TOPICS["Ekonomi"], rng, n)) for n in (3, 20, 8, 30)]
+    verdicts = assess(*items)
+    kept = [i for i, v in enumerate(verdicts) if v[2] is None]
+    assert len(kept) == 2
+    assert [v[2] for v in verdicts].count("rank_cutoff") == 2
+    assert min(verdicts[i][1] for i in kept) >= max(v[1] for v in verdicts if v[2] == "rank_cutoff")
+
+
+def test_not_enough_history_is_never_filtered(monkeypatch):
+    monkeypatch.setattr(classify, "CLASSIFY_MAX_ITEMS", 1)
+    monkeypatch.setattr(classify, "CLASSIFY_THRESHOLD", 0.99)
+    verdicts = assess(("Ny", OFF_TOPIC), ("AI", text(TOPICS["AI"], random.Random(5))), categories={"Ny": "bakning"})
+    assert verdicts[0][0] == "Ny" and verdicts[0][2] is None  # otränad kategori – rangordnas först
+    assert verdicts[1][2] in ("low_relevance", "rank_cutoff")
+
+
+def test_merged_keywords_reach_the_prototype():
+    # Nyckelord från två rader i Inställningar med samma kategori, sammanslagna (rss_fetcher)
+    one = assess(("Ny", "kardemumma"), categories={"Ny": "bakning"})[0][1]
+    both = assess(("Ny", "kardemumma"), categories={"Ny": "bakning, kardemumma"})[0][1]
+    assert one == 0.0 < both
+
+
+def test_numpy_and_python_give_the_same_scores(monkeypatch):
+    np = pytest.importorskip("numpy")
+    rng = random.Random(6)
+    docs = [classify.features(text(TOPICS[c], rng)) for c in TOPICS for _ in range(15)]
+    doc_cats = [i for i in range(len(TOPICS)) for _ in range(15)]
+    keyword_docs = [classify.features(KEYWORDS[c]) for c in TOPICS]
+    items = [classify.features(text(TOPICS[c], rng)) for c in TOPICS] + [classify.features(OFF_TOPIC), {}]
+    args = (list(TOPICS), {}, docs, doc_cats, keyword_docs)
+
+    with_numpy = classify.Model(*args).score_vectors(items)
+    monkeypatch.setattr(classify, "np", None)
+    pure = classify.Model(*args).score_vectors(items)
+
+    assert np is not None
+    for a, b in zip(with_numpy, pure):
+        assert a.keys() == b.keys()
+        for c in a:
+            assert a[c] == pytest.approx(b[c], abs=1e-5)
@@ -0,0 +1,151 @@
+# tests/test_digest.py
+"""Nyhetsbrevet mot en lokal Mailjet-attrapp (samma mekanism som MAILJET_API_URL).
+
+Attrappen tar emot POST /v3.1/send och svarar per mejl enligt testets
+`outcome(email, attempt)` – "success", "retry" (429 för just det mejlet) eller
+"fail" (400) – eller med ett helt 503 via `status`.
+"""
+
+import json
+import threading
+from collections import Counter
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import mailjet_rest
+import pytest
+
+import news_db
+import util_email
+
+
+class MailjetStandIn:
+    def __init__(self):
+        self.requests: list[dict] = []
+        self.attempts: Counter = Counter()
+        self.outcome = lambda email, attempt: "success"
+        self.status: list[tuple[int, dict]] = []  # (status, headers) före vanliga svar
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stand_in.requests.append(body)
+                if stand_in.status:
+                    status, headers = stand_in.status.pop(0)
+                    return self._reply(status, {"ErrorMessage": "upptaget"}, headers)
+                out = []
+                for msg in body["Messages"]:
+                    email = msg["To"][0]["Email"]
+                    stand_in.attempts[email] += 1
+                    result = stand_in.outcome(email, stand_in.attempts[email])
+                    if result == "success":
+                        out.append({"Status": "success", "To": [{"Email": email}]})
+                    else:
+                        code = 429 if result == "retry" else 400
+                        out.append({"Status": "error", "Errors": [{"StatusCode": code, "ErrorMessage": result}]})
+                self._reply(200, {"Messages": out})
+
+            def _reply(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def messages(self):
+        return [m for r in self.requests for m in r["Messages"]]
+
+
+@pytest.fixture
+def mailjet(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_db, "DB_PATH", tmp_path / "news.sqlite")
+    news_db.init()
+    today = date.today().isoformat()
+    news_db.upsert_sheet_articles([
+        (f"id{i}", f"Nyhet {i}", f"https://example.se/{i}", today, "Sammanfattning", category, 0, today, i + 2)
+        for i, category in enumerate(["AI", "AI", "Robotik", "Politik"])
+    ])
+
+    stand_in = MailjetStandIn()
+    monkeypatch.setattr(util_email, "mj", mailjet_rest.Client(auth=("k", "s"), version="v3.1", api_url=stand_in.url))
+    monkeypatch.setattr(util_email, "MJ_KEY", "k")
+    monkeypatch.setattr(util_email, "MJ_SECRET", "s")
+    monkeypatch.setattr(util_email, "MAILJET_WORKERS", 1)
+    sleeps = []
+    monkeypatch.setattr(util_email, "time", SimpleNamespace(sleep=sleeps.append, monotonic=lambda: 0.0))
+    stand_in.sleeps = sleeps
+    yield stand_in
+    stand_in.server.shutdown()
+
+
+def sub(email, categories="all"):
+    return {"Namn": "", "E-post": email, "Kategorier": categories, "Status": "active", "Token": "t-" + email}
+
+
+def test_renders_once_per_category_set(mailjet):
+    subs = [sub("a@x.se", "AI"), sub("b@x.se", " AI "), sub("c@x.se", "Robotik, AI"), sub("d@x.se", "AI,Robotik"),
+            sub("e@x.se", "all"), sub("f@x.se", ""), {**sub("g@x.se"), "Status": "pending"}]
+    assert util_email.send_digest(subs) == 6
+
+    groups = {}
+    for r in mailjet.requests:
+        groups.setdefault(r["Globals"]["HTMLPart"], set()).update(m["To"][0]["Email"] for m in r["Messages"])
+    assert sorted(map(sorted, groups.values())) == [["a@x.se", "b@x.se"], ["c@x.se", "d@x.se"], ["e@x.se", "f@x.se"]]
+    for html, emails in groups.items():
+        if emails == {"a@x.se", "b@x.se"}:
+            assert "Nyhet 0" in html and "Nyhet 2" not in html
+        if emails == {"e@x.se", "f@x.se"}:
+            assert "Nyhet 3" in html
+        assert "{{var:unsub}}" in html
+
+    # Varje mottagare får bara sin egen avanmälningslänk
+    links = {m["To"][0]["Email"]: m["Variables"]["unsub"] for m in mailjet.messages()}
+    assert links["c@x.se"].endswith("email=c%40x.se&tok=t-c%40x.se")
+
+
+def test_batches_by_batch_size(mailjet, monkeypatch):
+    monkeypatch.setattr(util_email, "MAILJET_BATCH_SIZE", 2)
+    assert util_email.send_digest([sub(f"{i}@x.se") for i in range(5)]) == 5
+    assert [len(r["Messages"]) for r in mailjet.requests] == [2, 2, 1]
+
+
+def test_retries_only_failed_messages(mailjet):
+    mailjet.outcome = lambda email, attempt: (
+        "retry" if email == "slow@x.se" and attempt == 1 else "fail" if email == "bad@x.se" else "success"
+    )
+    subs = [sub("ok@x.se"), sub("slow@x.se"), sub("bad@x.se")]
+    assert util_email.send_digest(subs, digest_date="2025-06-10") == 2
+
+    assert [[m["To"][0]["Email"] for m in r["Messages"]] for r in mailjet.requests] == [
+        ["ok@x.se", "slow@x.se", "bad@x.se"],
+        ["slow@x.se"],
+    ]
+    assert len(mailjet.sleeps) == 1
+    ledger = news_db.digest_ledger("2025-06-10", ["ok@x.se", "slow@x.se", "bad@x.se"])
+    assert {e: status for e, (status, _) in ledger.items()} == {
+        "ok@x.se": "sent", "slow@x.se": "sent", "bad@x.se": "failed",
+    }
+
+    # Nästa körning samma dag skickar bara om det misslyckade mejlet
+    mailjet.requests.clear()
+    util_email.send_digest(subs, digest_date="2025-06-10")
+    assert [[m["To"][0]["Email"] for m in r["Messages"]] for r in mailjet.requests] == [["bad@x.se"]]
+
+
+def test_whole_request_503_honours_retry_after(mailjet):
+    mailjet.status = [(503, {"Retry-After": "7"})]
+    assert util_email.send_digest([sub("a@x.se"), sub("b@x.se")]) == 2
+    assert [len(r["Messages"]) for r in mailjet.requests] == [2, 2]
+    assert mailjet.sleeps == [7.0]
@@ -0,0 +1,72 @@
+# tests/test_feed_dates.py
+"""feed_dates mot referensen dateutil: snabbvägarna ska ge samma tid (i UTC)."""
+
+import time
+import warnings
+from datetime import datetime, timezone
+
+import pytest
+from dateutil.parser import parse as dateutil_parse
+
+import feed_dates
+
+# RFC 822 definierar de nordamerikanska zonnamnen; dateutil känner inte till dem
+# utan tzinfos (och tolkar då tiden som UTC), så referensen får dem här.
+RFC822_ZONES = {
+    "EST": -5 * 3600, "EDT": -4 * 3600, "CST": -6 * 3600, "CDT": -5 * 3600,
+    "MST": -7 * 3600, "MDT": -6 * 3600, "PST": -8 * 3600, "PDT": -7 * 3600,
+}
+
+EXTRA_DATES = [
+    "  Tue, 10 Jun 2025 04:00:00 GMT  ",
+    "Tue, 10 Jun 2025 04:00:00 PDT",
+    "Tue,10 Jun 2025 04:00:00 +0530",
+    "10 Jun 2025 04:00 +0200",
+    "2025-06-10T04:00:00z",
+    "2025-06-10T04:00:00.5+05:30",
+    "2025-06-10T04:00",
+    "2025-06-10T04:00:00 +02:00",
+    "10 June 2025 04:00:00",
+    "Tuesday, June 10, 2025 4:00 PM",
+    "2025/06/10 04:00:00",
+]
+
+
+def reference(text: str) -> datetime:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # okända zonnamn (CEST)
+        return feed_dates._utc(dateutil_parse(text, tzinfos=RFC822_ZONES))
+
+
+@pytest.fixture(autouse=True)
+def cold_cache():
+    feed_dates._fallback.cache_clear()
+
+
+@pytest.mark.parametrize("text", feed_dates.SAMPLE_DATES + EXTRA_DATES)
+def test_matches_dateutil(text):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        ours = feed_dates.parse_datetime(text)
+    assert ours == reference(text)
+    assert ours.tzinfo == timezone.utc
+
+
+@pytest.mark.parametrize("text", [None, "", "   ", "inte ett datum", "2025-13-45", "Tue, 99 Foo 2025"])
+def test_unparseable_is_none(text):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        assert feed_dates.parse_datetime(text) is None
+
+
+def test_entry_prefers_struct_time():
+    # feedparser har redan tolkat datumet till struct_time i UTC
+    entry = {"published": "Tue, 10 Jun 2025 06:00:00 +0200",
+             "published_parsed": time.strptime("2025-06-10 04:00:00", "%Y-%m-%d %H:%M:%S")}
+    assert feed_dates.entry_date(entry) == "2025-06-10T04:00:00+00:00"
+
+
+def test_entry_falls_back_to_updated_string_and_default():
+    assert feed_dates.entry_date({"updated": "2025-06-10T06:15:42+02:00"}) == "2025-06-10T04:15:42+00:00"
+    default = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert feed_dates.entry_date({"published": "okänt"}, default) == "2025-01-01T00:00:00+00:00"
@@ -0,0 +1,57 @@
+# tests/test_metrics.py
+"""cProfile-körningar ska även täcka arbete i trådpoolen (metrics.profile_thread)."""
+
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+
+
+def work_in_pool_thread(n):
+    return sum(i * i for i in range(n))
+
+
+def run_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "RUN_REPORT_DIR", tmp_path)
+    report = metrics.RunReport("test")
+    with metrics.profiled("cprofile", report):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            assert list(pool.map(metrics.profile_thread(work_in_pool_thread), [1000] * 8)) == [332833500] * 8
+    return report
+
+
+@pytest.mark.skipif(not metrics.PER_THREAD_PROFILES, reason="cProfile bygger på sys.monitoring från 3.12")
+def test_cprofile_includes_pool_threads(tmp_path, monkeypatch):
+    report = run_profiled(tmp_path, monkeypatch)
+    assert report.profile["threads"] == 9
+    stats = pstats.Stats(report.profile["path"])
+    calls = {fn[2]: v[1] for fn, v in stats.stats.items()}
+    assert calls["work_in_pool_thread"] == 8
+
+
+def test_profile_thread_is_a_no_op_outside_a_run():
+    assert metrics.profile_thread(work_in_pool_thread)(4) == 14
+    assert metrics._worker_profiles is None
+
+
+def test_main_thread_only_without_per_thread_profiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PER_THREAD_PROFILES", False)
+    report = run_profiled(tmp_path, monkeypatch)
+    assert report.profile["threads"] == 1
+
+
+class BusyProfile:
+    """Som cProfile.Profile när en annan profilerare redan är aktiv (sys.monitoring)."""
+
+    def enable(self):
+        raise ValueError("Another profiling tool is already active")
+
+
+def test_pool_task_runs_unprofiled_when_enable_fails(monkeypatch):
+    monkeypatch.setattr(metrics, "_worker_profiles", [])
+    monkeypatch.setattr(metrics, "cProfile", SimpleNamespace(Profile=BusyProfile))
+    assert metrics.profile_thread(work_in_pool_thread)(4) == 14
+    assert metrics._worker_profiles == []
@@ -0,0 +1,102 @@
+# tests/test_query_plans.py
+"""Frågeplaner för de heta läsfrågorna i news_db på en databas med en miljon artiklar.
+
+Frågorna fångas med trace-callbacken när news_db-funktionerna körs (med
+bundna parametrar) och körs sedan om med EXPLAIN QUERY PLAN. Testdatat
+fördelas över 2 500 dagar och 20 kategorier.
+"""
+
+import os
+
+import pytest
+
+import news_db
+
+ROWS = int(os.getenv("QUERY_PLAN_ROWS", "1000000"))
+CATEGORIES = 20
+
+
+@pytest.fixture(scope="module")
+def big_db(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(news_db, "DB_PATH", tmp_path_factory.mktemp("plans") / "news.sqlite")
+        news_db.init()
+        with news_db.connect() as con:
+            # Triggers (FTS, versioner, statistik) påverkar inte planerna – bort för snabbare sådd
+            for (name,) in con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'articles'"
+            ).fetchall():
+                con.execute(f"DROP TRIGGER {name}")
+            con.execute(
+                f"""
+                INSERT INTO articles (id, title, url, date, summary, category, paywall, import_date)
+                WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < {ROWS - 1})
+                SELECT printf('id%07d', i), 'titel ' || i, 'https://example.se/' || i,
+                       date('2020-01-01', '+' || (i % 2500) || ' days'), '',
+                       'Kat' || (i % {CATEGORIES}), i % 2,
+                       date('2020-01-01', '+' || (i % 2500) || ' days')
+                FROM n
+                """
+            )
+        assert news_db._connection().execute("SELECT COUNT(*) FROM articles").fetchone()[0] == ROWS
+        yield news_db._connection()
+
+
+def plans(con, fn, *args, **kwargs) -> list[list[str]]:
+    """Kör fn och returnerar planen (detaljraderna) för varje SELECT den körde."""
+    statements = []
+    con.set_trace_callback(statements.append)
+    try:
+        fn(*args, **kwargs)
+    finally:
+        con.set_trace_callback(None)
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert selects, f"{fn.__name__} körde ingen SELECT"
+    return [[row[3] for row in con.execute("EXPLAIN QUERY PLAN " + s)] for s in selects]
+
+
+def assert_uses(plan: list[str], index: str, *, sorted_by_index: bool = True) -> None:
+    text = " | ".join(plan)
+    assert f"USING INDEX {index}" in text or f"USING COVERING INDEX {index}" in text, text
+    assert not any(p.startswith("SCAN articles") and "INDEX" not in p for p in plan), text
+    if sorted_by_index:
+        assert "TEMP B-TREE" not in text, text
+
+
+@pytest.mark.parametrize("analyzed", [False, True], ids=["stale-stats", "analyzed"])
+def test_latest_filtered_uses_import_index(big_db, analyzed):
+    if analyzed:
+        big_db.execute("ANALYZE")
+    for plan in plans(big_db, news_db.latest_filtered, days=3, max_articles=20):
+        assert_uses(plan, "idx_articles_import")
+
+
+def test_latest_uses_import_index(big_db):
+    for plan in plans(big_db, news_db.latest, 20):
+        assert_uses(plan, "idx_articles_import")
+
+
+def test_category_page_uses_category_index(big_db):
+    for plan in plans(big_db, news_db.page_articles, 20, categories=["Kat3"]):
+        assert_uses(plan, "idx_articles_category")
+
+
+def test_category_page_with_cursor_uses_category_index(big_db):
+    for plan in plans(big_db, news_db.page_articles, 20, categories=["Kat3"], after=("2024-01-01", "id0500000")):
+        assert_uses(plan, "idx_articles_category")
+
+
+def test_several_categories_search_the_category_index(big_db):
+    # Flera kategorier slås ihop och sorteras i en temporär b-tree – men utan full scan
+    for plan in plans(big_db, news_db.page_articles, 20, categories=["Kat3", "Kat4"]):
+        assert_uses(plan, "idx_articles_category", sorted_by_index=False)
+
+
+def test_category_examples_use_category_index(big_db):
+    for plan in plans(big_db, news_db.category_examples, ["Kat5"], 200):
+        assert_uses(plan, "idx_articles_category")
+
+
+def test_date_range_page_uses_import_index(big_db):
+    for plan in plans(big_db, news_db.page_articles, 20, date_from="2026-01-01"):
+        assert_uses(plan, "idx_articles_import")
@@ -0,0 +1,168 @@
+# tests/test_sheet_sync.py
+"""Synken Sheet ⇄ SQLite: borttagningar i arket följer med, bara lokala artiklar pushas."""
+
+import gspread
+import pytest
+
+import news_db
+import sheet_sync
+import sheet_writer
+
+HEADER = ["id", "title", "url", "date", "summary", "category", "paywall", "import_date"]
+
+
+class FakeWorksheet:
+    id = 0
+
+    def __init__(self, rows=()):
+        self.rows = [HEADER, *rows]
+
+    def row_values(self, n):
+        return self.rows[n - 1]
+
+    def get(self, a1):
+        first = int(a1.split(":")[0][1:])
+        return [list(r) for r in self.rows[first - 1:]]
+
+    def append_rows(self, rows, value_input_option=None):
+        start = len(self.rows) + 1
+        self.rows.extend(rows)
+        return {"updates": {"updatedRange": f"Artiklar!A{start}:H{len(self.rows)}"}}
+
+    def delete(self, art_id):
+        self.rows = [r for r in self.rows if r[0] != art_id]
+
+
+class FakeSpreadsheet:
+    def __init__(self, ws):
+        self.ws = ws
+
+    def worksheet(self, tab):
+        if tab == "Artiklar":
+            return self.ws
+        raise gspread.WorksheetNotFound(tab)
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_db, "DB_PATH", tmp_path / "news.sqlite")
+    news_db.init()
+
+
+def article(n):
+    return [f"id{n}", f"titel {n}", f"https://example.se/{n}", "2025-06-10", "", "AI", "FALSE", "2025-06-10"]
+
+
+def sheet_rows():
+    with news_db.connect() as con:
+        return dict(con.execute("SELECT id, sheet_row FROM articles").fetchall())
+
+
+def ids():
+    return [a["id"] for a in news_db.all_articles()]
+
+
+def test_deleted_rows_are_removed_not_pushed_back():
+    ws = FakeWorksheet([article(n) for n in range(1, 5)])
+    sheet_sync.pull_articles(ws)
+    assert ids() == ["id1", "id2", "id3", "id4"]
+
+    ws.delete("id2")  # redaktören tar bort en rad – numreringen flyttas
+    ws.delete("id4")
+    sheet_sync.pull_articles(ws)
+    assert ids() == ["id1", "id3"]
+    assert news_db.existing_urls(["https://example.se/2", "https://example.se/5"]) == {"https://example.se/2"}
+
+    assert sheet_sync.push_articles(ws) == 0
+    assert [r[0] for r in ws.rows[1:]] == ["id1", "id3"]
+
+
+def test_rows_without_sheet_row_are_not_pushed():
+    # Äldre databas: artiklar utan radnummer (t.ex. efter clear_sheet_rows) som saknas i arket
+    news_db.upsert_sheet_articles([(*article(1)[:6], 0, "2025-06-10", None), (*article(2)[:6], 0, "2025-06-10", None)])
+    ws = FakeWorksheet([article(1)])
+    assert sheet_sync.sync_all(FakeSpreadsheet(ws)) == {"pulled": 1, "pushed": 0}
+    assert ids() == ["id1"]
+    assert len(ws.rows) == 2
+
+
+def test_locally_created_articles_are_pushed_once():
+    ws = FakeWorksheet([article(1)])
+    sheet_sync.pull_articles(ws)
+    news_db.insert(tuple(article(9)[:6]) + (0, "2025-06-11"))
+
+    assert sheet_sync.sync_all(FakeSpreadsheet(ws), push=False)["pushed"] == 0
+    assert sheet_sync.sync_all(FakeSpreadsheet(ws)) == {"pulled": 0, "pushed": 1}
+    assert [r[0] for r in ws.rows[1:]] == ["id1", "id9"]
+    assert news_db.get_sync_state("Artiklar")["last_row"] == 3
+    assert sheet_sync.sync_all(FakeSpreadsheet(ws))["pushed"] == 0
+
+    # En lokal artikel som ännu inte pushats tas inte bort av en full läsning
+    news_db.insert(tuple(article(10)[:6]) + (0, "2025-06-12"))
+    ws.delete("id1")
+    sheet_sync.sync_all(FakeSpreadsheet(ws), push=False)
+    assert ids() == ["id9", "id10"]
+
+
+def test_articles_added_after_the_read_are_kept():
+    ws = FakeWorksheet([article(1)])
+    watermark = news_db.article_watermark()
+    news_db.upsert_sheet_articles([(*article(2)[:6], 0, "2025-06-10", news_db.SHEET_ROW_UNKNOWN)])
+    assert news_db.tombstone_missing({"id1"}, watermark) == 0
+    assert ids() == ["id2"]
+
+
+def test_restored_row_is_read_in_again():
+    ws = FakeWorksheet([article(1), article(2)])
+    sheet_sync.pull_articles(ws)
+    ws.delete("id1")
+    sheet_sync.pull_articles(ws)
+    assert ids() == ["id2"]
+
+    ws.rows.append(article(1))
+    sheet_sync.pull_articles(ws)
+    assert ids() == ["id2", "id1"]
+    assert news_db.existing_urls(["https://example.se/1"]) == {"https://example.se/1"}
+
+
+def test_empty_read_removes_nothing():
+    ws = FakeWorksheet([article(1)])
+    sheet_sync.pull_articles(ws)
+    news_db.clear_sheet_rows()
+    sheet_sync.pull_articles(FakeWorksheet([]))
+    assert ids() == ["id1"]
+
+
+
+def test_push_with_an_interleaved_writer(monkeypatch):
+    # Någon annan (cron-hämtaren) skriver en rad mellan våra två append-bitar
+    monkeypatch.setattr(sheet_writer, "APPEND_CHUNK", 2)
+    ws = FakeWorksheet([article(1)])
+    sheet_sync.pull_articles(ws)
+    for n in (7, 8, 9):
+        news_db.insert(tuple(article(n)[:6]) + (0, "2025-06-11"))
+
+    append_rows = ws.append_rows
+
+    def interleaved(rows, value_input_option=None):
+        if ws.rows[-1][0] == "id8":
+            ws.rows.append(article(5))
+        return append_rows(rows, value_input_option)
+
+    ws.append_rows = interleaved
+    assert sheet_sync.push_articles(ws) == 3
+    assert [r[0] for r in ws.rows[1:]] == ["id1", "id7", "id8", "id5", "id9"]
+    assert sheet_rows() == {"id1": 2, "id7": 3, "id8": 4, "id9": 6}
+    assert news_db.get_sync_state("Artiklar")["last_row"] == 4
+
+    # Den främmande raden läses in av nästa pull
+    sheet_sync.pull_articles(ws)
+    assert sheet_rows()["id5"] == 5
+
+
+def test_id_index_only_advances_over_contiguous_rows():
+    ws = FakeWorksheet([article(1)])
+    sheet_sync.refresh_id_index(ws)
+    sheet_sync.note_appended_ids(["id2", "id3", "id4"], [3, 4, 6])
+    assert news_db.get_sync_state(sheet_sync.ID_INDEX)["last_row"] == 4
+    assert news_db.known_sheet_ids(["id2", "id4"]) == {"id2", "id4"}
@@ -0,0 +1,118 @@
+# tests/test_sheet_writer.py
+"""Omförsök i SheetWriter: appends och borttagningar görs bara om vid 429."""
+
+from types import SimpleNamespace
+
+import gspread
+import pytest
+import requests
+
+import sheet_writer
+from sheet_writer import SheetWriter
+
+
+def api_error(status: int, retry_after: str | None = None) -> gspread.exceptions.APIError:
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = b'{"error": {"code": %d, "message": "fel", "status": "X"}}' % status
+    if retry_after is not None:
+        resp.headers["Retry-After"] = retry_after
+    return gspread.exceptions.APIError(resp)
+
+
+class FlakyCall:
+    """Kastar felen i tur och ordning, lyckas sedan."""
+
+    def __init__(self, *errors, result=None):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+class FakeWorksheet:
+    id = 0
+
+    def __init__(self, append=None, update=None, delete=None):
+        self.append_rows = append or FlakyCall(result={"updates": {"updatedRange": "Artiklar!A10:C10"}})
+        self.batch_update = update or FlakyCall()
+        self.spreadsheet = SimpleNamespace(batch_update=delete or FlakyCall())
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(sheet_writer.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_append_is_retried_on_429_with_retry_after(no_sleep):
+    ws = FakeWorksheet(append=FlakyCall(api_error(429, "3"), result={"updates": {"updatedRange": "A!A7:B7"}}))
+    w = SheetWriter(ws)
+    w.append([["a", "b"]])
+    assert w.flush()["first_row"] == 7
+    assert ws.append_rows.calls == 2
+    assert no_sleep == [3.0]
+
+
+@pytest.mark.parametrize("status", [500, 503])
+def test_append_is_not_retried_on_server_error(status):
+    ws = FakeWorksheet(append=FlakyCall(api_error(status)))
+    w = SheetWriter(ws)
+    w.append([["a"]])
+    with pytest.raises(gspread.exceptions.APIError):
+        w.flush()
+    assert ws.append_rows.calls == 1
+
+
+def test_delete_is_not_retried_on_server_error():
+    ws = FakeWorksheet(delete=FlakyCall(api_error(502)))
+    w = SheetWriter(ws)
+    w.delete_rows([4, 5])
+    with pytest.raises(gspread.exceptions.APIError):
+        w.flush()
+    assert ws.spreadsheet.batch_update.calls == 1
+
+
+def test_update_is_retried_on_server_error():
+    # Att skriva samma värden i samma celler igen är ofarligt
+    ws = FakeWorksheet(update=FlakyCall(api_error(500), api_error(503)))
+    w = SheetWriter(ws)
+    w.update("A2:B2", [["x", "y"]])
+    assert w.flush()["updated"] == 1
+    assert ws.batch_update.calls == 3
+
+
+class GrowingSheet:
+    """append_rows mot ett ark där någon annan skriver en rad före varje bit."""
+
+    def __init__(self, rows=1):
+        self.rows = rows
+
+    def append_rows(self, chunk, value_input_option=None):
+        self.rows += 1 + len(chunk)  # främmande rad + vår bit
+        start = self.rows - len(chunk) + 1
+        return {"updates": {"updatedRange": f"Artiklar!A{start}:H{self.rows}"}}
+
+
+def test_rows_follow_each_chunk(monkeypatch):
+    monkeypatch.setattr(sheet_writer, "APPEND_CHUNK", 2)
+    ws = GrowingSheet()
+    w = SheetWriter(ws)
+    w.append([[n] for n in range(5)])
+    result = w.flush()
+    assert result["rows"] == [3, 4, 6, 7, 9]
+    assert result["first_row"] is None  # inte ett sammanhängande block
+
+
+def test_first_row_for_a_contiguous_append(monkeypatch):
+    monkeypatch.setattr(sheet_writer, "APPEND_CHUNK", 2)
+    ws = FakeWorksheet(append=FlakyCall(result={"updates": {"updatedRange": "Artiklar!A10:C11"}}))
+    w = SheetWriter(ws)
+    w.append([["a"], ["b"]])
+    assert w.flush()["first_row"] == 10
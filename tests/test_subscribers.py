@@ -0,0 +1,83 @@
+# tests/test_subscribers.py
+"""Prenumeranter i news_db: en anonym anmälan får inte skriva över en befintlig prenumerant."""
+
+import pytest
+
+import news_db
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_db, "DB_PATH", tmp_path / "news.sqlite")
+    news_db.init()
+
+
+def fields(email):
+    sub = news_db.get_subscriber(email)
+    return sub["name"], sub["categories"], sub["status"], sub["token"]
+
+
+def active(email="anna@x.se"):
+    news_db.add_subscriber("Anna", email, "AI", "tok-1")
+    assert news_db.confirm_subscriber(email, "tok-1")
+
+
+def test_new_address_is_pending_until_confirmed():
+    sub, token = news_db.add_subscriber("Anna", " Anna@X.se ", "AI", "tok-1")
+    assert (sub["email"], sub["status"], token) == ("anna@x.se", "pending", "tok-1")
+    assert news_db.confirm_subscriber("anna@x.se", "fel") is None
+    assert news_db.confirm_subscriber("anna@x.se", "tok-1")["status"] == "active"
+
+
+@pytest.mark.parametrize("confirmed", [False, True], ids=["pending", "active"])
+def test_resubscribe_keeps_stored_fields_until_confirmed(confirmed):
+    if confirmed:
+        active()
+    else:
+        news_db.add_subscriber("Anna", "anna@x.se", "AI", "tok-1")
+    before = fields("anna@x.se")
+
+    sub, token = news_db.add_subscriber("Någon annan", "anna@x.se", "Politik", "tok-2")
+    assert token == "tok-2"
+    assert fields("anna@x.se") == before
+    assert sub["token"] == "tok-1"
+
+    # Den ursprungliga token bekräftar bara adressen, inte ändringen
+    news_db.confirm_subscriber("anna@x.se", "tok-1")
+    assert fields("anna@x.se")[:2] == ("Anna", "AI")
+
+    sub = news_db.confirm_subscriber("anna@x.se", "tok-2")
+    assert (sub["name"], sub["categories"], sub["status"], sub["token"]) == ("Någon annan", "Politik", "active", "tok-1")
+    assert news_db.confirm_subscriber("anna@x.se", "tok-2") is None  # förbrukad
+
+
+def test_latest_change_request_wins():
+    active()
+    news_db.add_subscriber("Anna", "anna@x.se", "Politik", "tok-2")
+    news_db.add_subscriber("Anna", "anna@x.se", "Robotik", "tok-3")
+    assert news_db.confirm_subscriber("anna@x.se", "tok-2") is None
+    assert fields("anna@x.se")[1] == "AI"
+    assert news_db.confirm_subscriber("anna@x.se", "tok-3")["categories"] == "Robotik"
+
+
+def test_unchanged_active_subscription_needs_no_confirmation():
+    active()
+    sub, token = news_db.add_subscriber("Anna", "anna@x.se", "AI", "tok-2")
+    assert token is None and sub["status"] == "active"
+
+
+def test_unsubscribed_address_starts_over():
+    active()
+    assert news_db.unsubscribe("anna@x.se", "tok-1")["status"] == "unsubscribed"
+    sub, token = news_db.add_subscriber("Anna B", "anna@x.se", "Robotik", "tok-2")
+    assert (sub["name"], sub["categories"], sub["status"], token) == ("Anna B", "Robotik", "pending", "tok-2")
+    assert news_db.confirm_subscriber("anna@x.se", "tok-1") is None
+
+
+def test_change_is_mirrored_only_after_confirmation():
+    active()
+    news_db.mark_subscribers_synced([(s["id"], 2, s["dirty"]) for s in news_db.dirty_subscribers()])
+    news_db.add_subscriber("X", "anna@x.se", "Politik", "tok-2")
+    assert news_db.dirty_subscribers() == []
+    news_db.confirm_subscriber("anna@x.se", "tok-2")
+    assert [s["categories"] for s in news_db.dirty_subscribers()] == ["Politik"]
@@ -0,0 +1,169 @@
+# tests/test_summarizer.py
+"""summarizer.py mot en stubbad OpenAI-klient: 429 + Retry-After, token buckets, batchläge."""
+
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import summarizer
+
+
+class FakeClock:
+    """Ersätter time i summarizer – sleep flyttar bara klockan."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class StubClient:
+    """chat.completions.create(**kwargs) → nästa svar i kön (str = innehåll, Exception = kastas)."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls.append(kwargs)
+        reply = self.replies.pop(0) if self.replies else "ok"
+        if callable(reply):
+            reply = reply(kwargs)
+        if isinstance(reply, Exception):
+            raise reply
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=usage)
+
+
+def rate_limited(retry_after):
+    request = httpx.Request("POST", "http://fake/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": str(retry_after)}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def server_error(status=503):
+    request = httpx.Request("POST", "http://fake/v1/chat/completions")
+    return openai.InternalServerError("boom", response=httpx.Response(status, request=request), body=None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(summarizer, "time", SimpleNamespace(monotonic=fake.monotonic, sleep=fake.sleep))
+    # Nya buckets som använder den falska klockan (gott om kvot om inget annat sägs)
+    monkeypatch.setattr(summarizer, "_requests", summarizer.TokenBucket(10_000))
+    monkeypatch.setattr(summarizer, "_tokens", summarizer.TokenBucket(10_000_000))
+    return fake
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setattr(summarizer.news_db, "cached_summaries", lambda keys: {})
+    monkeypatch.setattr(summarizer.news_db, "cache_summaries", lambda fresh: None)
+    monkeypatch.setattr(summarizer.news_db, "prune_summary_cache", lambda rows, days: None)
+
+
+def use(monkeypatch, client):
+    monkeypatch.setattr(summarizer, "client", client)
+    monkeypatch.setattr(summarizer, "SUMMARY_WORKERS", 1)
+    return client
+
+
+# ────────── 429 / 5xx ──────────
+def test_429_waits_retry_after_then_succeeds(monkeypatch, clock, no_cache):
+    client = use(monkeypatch, StubClient([rate_limited(7), "Sammanfattning"]))
+    assert summarizer.summarize_many([("Titel", "https://x.se/a")], instruction="Sammanfatta") == ["Sammanfattning"]
+    assert len(client.calls) == 2
+    assert clock.sleeps == [7.0]
+
+
+def test_5xx_is_retried_with_backoff(monkeypatch, clock, no_cache):
+    client = use(monkeypatch, StubClient([server_error(502), server_error(503), "ok"]))
+    assert summarizer.summarize_many([("T", "https://x.se/b")], instruction="S") == ["ok"]
+    assert len(client.calls) == 3
+    assert len(clock.sleeps) == 2 and all(0 <= s <= 60 for s in clock.sleeps)
+
+
+def test_gives_up_after_max_retries_and_returns_empty(monkeypatch, clock, no_cache):
+    monkeypatch.setattr(summarizer, "OPENAI_MAX_RETRIES", 2)
+    client = use(monkeypatch, StubClient([rate_limited(1)] * 10))
+    assert summarizer.summarize_many([("T", "https://x.se/c")], instruction="S") == [""]
+    assert len(client.calls) == 3
+
+
+def test_non_retryable_error_is_not_retried(monkeypatch, clock, no_cache):
+    request = httpx.Request("POST", "http://fake")
+    bad = openai.BadRequestError("bad", response=httpx.Response(400, request=request), body=None)
+    client = use(monkeypatch, StubClient([bad]))
+    assert summarizer.summarize_many([("T", "https://x.se/d")], instruction="S") == [""]
+    assert len(client.calls) == 1 and clock.sleeps == []
+
+
+# ────────── Token buckets ──────────
+def test_bucket_allows_burst_then_paces(clock):
+    bucket = summarizer.TokenBucket(60)  # 1 per sekund
+    for _ in range(60):
+        bucket.take()
+    assert clock.sleeps == []
+    bucket.take()
+    assert clock.sleeps == [pytest.approx(1.0)]
+    bucket.take(3)
+    assert sum(clock.sleeps) == pytest.approx(4.0)
+
+
+def test_bucket_caps_requests_larger_than_capacity(clock):
+    bucket = summarizer.TokenBucket(100)
+    bucket.take(500)  # kapas till kapaciteten i stället för att vänta för evigt
+    assert clock.sleeps == []
+
+
+def test_requests_per_minute_limit_paces_calls(monkeypatch, clock, no_cache):
+    monkeypatch.setattr(summarizer, "_requests", summarizer.TokenBucket(2))  # 2 anrop/min
+    use(monkeypatch, StubClient(["a", "b", "c", "d"]))
+    items = [(f"T{i}", f"https://x.se/{i}") for i in range(4)]
+    assert summarizer.summarize_many(items, instruction="S") == ["a", "b", "c", "d"]
+    # Två direkt, sedan ett per 30 s
+    assert sum(clock.sleeps) == pytest.approx(60.0)
+
+
+def test_token_limit_uses_prompt_estimate(monkeypatch, clock, no_cache):
+    monkeypatch.setattr(summarizer, "_tokens", summarizer.TokenBucket(600))  # 10 tokens/s
+    use(monkeypatch, StubClient(["a", "b"]))
+    summarizer.summarize_many([("T1", "https://x.se/1"), ("T2", "https://x.se/2")],
+                              instruction="S", max_tokens=500)
+    # Andra anropet får vänta in det som första anropet (≈ 500 + prompt/3 tokens) förbrukade
+    assert len(clock.sleeps) == 1 and clock.sleeps[0] > 40
+
+
+# ────────── Batchläge ──────────
+def test_batch_mode_packs_items_into_one_call(monkeypatch, clock, no_cache):
+    client = use(monkeypatch, StubClient([json.dumps({"summaries": ["s1", "s2", "s3"]})]))
+    items = [(f"T{i}", f"https://x.se/{i}") for i in range(3)]
+    assert summarizer.summarize_many(items, instruction="S", batch_size=3) == ["s1", "s2", "s3"]
+    assert len(client.calls) == 1
+    assert client.calls[0]["response_format"] == {"type": "json_object"}
+
+
+def test_batch_with_wrong_count_falls_back_to_single_calls(monkeypatch, clock, no_cache):
+    client = use(monkeypatch, StubClient([json.dumps({"summaries": ["bara en"]}), "s1", "s2"]))
+    items = [("T1", "https://x.se/1"), ("T2", "https://x.se/2")]
+    assert summarizer.summarize_many(items, instruction="S", batch_size=2) == ["s1", "s2"]
+    assert len(client.calls) == 3
+    assert "response_format" not in client.calls[1]
+
+
+def test_batch_with_invalid_json_falls_back_to_single_calls(monkeypatch, clock, no_cache):
+    client = use(monkeypatch, StubClient(["inte json", "s1", "s2"]))
+    items = [("T1", "https://x.se/1"), ("T2", "https://x.se/2")]
+    assert summarizer.summarize_many(items, instruction="S", batch_size=2) == ["s1", "s2"]
+    assert len(client.calls) == 3
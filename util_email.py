@@ -6,22 +6,50 @@ E-post-hjälp för AI-Nyheter
 • send_confirm()       – bekräftelsemejl
 • send_goodbye()       – bekräftar avanmälan
 • send_digest()        – dagligt/veckovis nyhetsbrev via Mailjet
+
+Nyhetsbrevet renderas en gång per unik kategorimängd (inte per prenumerant)
+och skickas i batchar om MAILJET_BATCH_SIZE mejl per API-anrop: brödtexten
+ligger i Mailjets "Globals" och varje mottagare får bara sin egen
+avanmälningslänk som variabel ({{var:unsub}}). Batcharna skickas av en
+begränsad trådpool; mejl som fallerat med 429/5xx görs om, resten rapporteras.
+Sätt MAILJET_API_URL för att peka mot en lokal Mailjet-attrapp vid test.
+
+Varje utskick loggas i news_db.digest_sends (datum, mottagare, innehållshash):
+pending → sending → sent | failed. En avbruten körning fortsätter där den
+slutade – den som redan fått dagens brev hoppas över, misslyckade försöks
+igen (högst DIGEST_MAX_ATTEMPTS gånger). Mottagare som stod som "sending"
+när processen dog räknas som osäkra och skickas inte om automatiskt
+(resend_uncertain=True). DIGEST_MAX_PER_RUN delar stora utskick på flera
+körningar.
 """
 
 from __future__ import annotations
-import os, secrets, datetime, sys, typing as _t
+import os, secrets, datetime, sys, time, random, hashlib, typing as _t
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 import mailjet_rest
-from flask import render_template
+from mailjet_rest.client import ApiError
+from flask import render_template, has_app_context
 
-from news_db import latest_filtered
+from news_db import latest_filtered, digest_ledger, digest_record, digest_counts, active_subscribers
+from sheet_sync import ensure_subscribers
 
 # ────────── Mailjet-konfiguration ──────────
 MJ_KEY    = os.getenv("MAILJET_API_KEY")
 MJ_SECRET = os.getenv("MAILJET_API_SECRET")
 SENDER    = os.getenv("SENDER_EMAIL", "nyheter@example.com")
+MAILJET_API_URL     = os.getenv("MAILJET_API_URL") or None  # None = Mailjets riktiga API
+MAILJET_BATCH_SIZE  = int(os.getenv("MAILJET_BATCH_SIZE", "50"))  # Mailjet tar max 50 per anrop
+MAILJET_WORKERS     = int(os.getenv("MAILJET_WORKERS", "4"))
+MAILJET_MAX_RETRIES = int(os.getenv("MAILJET_MAX_RETRIES", "4"))
+PUBLIC_BASE_URL     = os.getenv("PUBLIC_BASE_URL", "https://ai-nyheter-backend.onrender.com")
+DIGEST_MAX_PER_RUN  = int(os.getenv("DIGEST_MAX_PER_RUN", "0"))   # 0 = alla på en gång
+DIGEST_MAX_ATTEMPTS = int(os.getenv("DIGEST_MAX_ATTEMPTS", "3"))
+
+DIGEST_SUBJECT = "AI-Nyheter – Dagens sammanfattning"
 
-mj = mailjet_rest.Client(auth=(MJ_KEY, MJ_SECRET), version="v3.1")
+mj = mailjet_rest.Client(auth=(MJ_KEY, MJ_SECRET), version="v3.1", api_url=MAILJET_API_URL)
 
 
 # ────────── Små hjälpare ──────────
@@ -46,24 +74,20 @@ def _send(subject: str, html: str, to_addr: str) -> bool:
         ]
     }
 
-    res = mj.send.create(data=data)
-
-    # 🧪 Extra loggning av ALLA försök
-    print("[email] Mailjet status:", res.status_code, file=sys.stderr)
     try:
-        print("[email] Mailjet response:", res.json(), file=sys.stderr)
-    except Exception as e:
-        print("[email] Mailjet response parse error:", str(e), file=sys.stderr)
+        res = mj.send.create(data=data)
+    except (ApiError, TimeoutError) as e:
+        print(f"[email] Mailjet-fel: {e!r}", file=sys.stderr)
+        return False
 
+    if res.status_code != 200:
+        print(f"[email] Mailjet status {res.status_code}: {res.text[:300]}", file=sys.stderr)
     return res.status_code == 200
 
 
 # ────────── 1. Bekräftelse-mejl ──────────
 def send_confirm(email: str, token: str) -> None:
-    link = (
-        "https://ai-nyheter-backend.onrender.com/api/confirm"
-        f"?email={email}&tok={token}"
-    )
+    link = f"{PUBLIC_BASE_URL}/api/confirm?email={quote(email)}&tok={quote(token)}"
     html = f"""
     <p>Hej!</p>
     <p>Tack för att du vill prenumerera på AI-Nyheter.
@@ -83,6 +107,135 @@ def send_goodbye(email: str) -> None:
 
 
 # ────────── 3. Dagligt/veckovis digest ──────────
+UNSUB_PLACEHOLDER = "__AI_NYHETER_UNSUB__"
+
+
+def _wanted(categories: str | None) -> tuple[str, ...] | None:
+    """Normaliserad kategorimängd för en prenumerant; None = alla kategorier."""
+    parts = sorted({c.strip() for c in str(categories or "").split(",") if c.strip()})
+    if not parts or any(c.upper() == "ALL" for c in parts):
+        return None
+    return tuple(parts)
+
+
+def _unsub_link(sub: dict) -> str:
+    return (
+        f"{PUBLIC_BASE_URL}/api/unsubscribe"
+        f"?email={quote(str(sub.get('E-post', '')))}&tok={quote(str(sub.get('Token', '')))}"
+    )
+
+
+def _active_subscribers(sh) -> list[dict]:
+    """Aktiva prenumeranter ur news_db, med samma nycklar som raderna i arket."""
+    ensure_subscribers(sh)
+    return [
+        {"Namn": s["name"], "E-post": s["email"], "Kategorier": s["categories"],
+         "Status": s["status"], "Token": s["token"]}
+        for s in active_subscribers()
+    ]
+
+
+def _render_digest(articles: list[dict], date: str) -> str:
+    """Rendera brevet en gång; avanmälningslänken blir Mailjet-variabeln {{var:unsub}}."""
+    def render():
+        return render_template(
+            "digest.html", date=date, articles=articles, unsubscribe_link=UNSUB_PLACEHOLDER,
+        )
+
+    if has_app_context():
+        html = render()
+    else:
+        from app import app
+        with app.app_context():
+            html = render()
+    # Mailjets mallspråk får inte tolka klamrar i artikeltexterna
+    html = html.replace("{{", "{ {").replace("{%", "{ %")
+    return html.replace(UNSUB_PLACEHOLDER, "{{var:unsub}}")
+
+
+def _retryable(errors: list[dict]) -> bool:
+    codes = [e.get("StatusCode") or 0 for e in errors]
+    return any(c == 429 or c >= 500 for c in codes)
+
+
+def _send_batch(globals_: dict, messages: list[dict]) -> tuple[list[str], list[str]]:
+    """Ett Mailjet-anrop med upp till MAILJET_BATCH_SIZE mejl. Returnerar (skickade, misslyckade).
+
+    Mejl som fallerat tillfälligt (429/5xx, nätverksfel) skickas om med backoff.
+    """
+    sent, failed = [], []
+    pending = messages
+    retry_after = None
+    for attempt in range(MAILJET_MAX_RETRIES + 1):
+        if attempt:
+            # Exponentiell backoff med jitter – Retry-After från Mailjet går före
+            delay = random.uniform(0, min(30.0, 2.0 ** attempt))
+            time.sleep(delay if retry_after is None else retry_after)
+            retry_after = None
+        try:
+            res = mj.send.create(data={"Globals": globals_, "Messages": pending})
+        except (ApiError, TimeoutError) as e:
+            print(f"[digest] Mailjet-fel ({len(pending)} mejl): {e!r}", file=sys.stderr)
+            continue
+        try:
+            results = res.json().get("Messages")
+        except (ValueError, AttributeError):
+            results = None
+
+        if isinstance(results, list) and len(results) == len(pending):
+            retry = []
+            for msg, result in zip(pending, results):
+                email = msg["To"][0]["Email"]
+                if result.get("Status") == "success":
+                    sent.append(email)
+                elif _retryable(result.get("Errors") or []):
+                    retry.append(msg)
+                else:
+                    failed.append(email)
+                    errors = "; ".join(e.get("ErrorMessage", "") for e in result.get("Errors") or [])
+                    print(f"[digest] {email}: {errors or result.get('Status')}", file=sys.stderr)
+            pending = retry
+        elif res.status_code == 429 or res.status_code >= 500:
+            try:
+                retry_after = float(res.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                pass
+            print(f"[digest] Mailjet status {res.status_code} – nytt försök", file=sys.stderr)
+        else:
+            print(f"[digest] Mailjet status {res.status_code}: {res.text[:300]}", file=sys.stderr)
+            break
+        if not pending:
+            break
+
+    failed += [m["To"][0]["Email"] for m in pending]
+    return sent, failed
+
+
+def _send_batches(batches: list[tuple[dict, list[dict], str]], digest_date: str | None = None):
+    """Skicka alla batchar med högst MAILJET_WORKERS samtidiga anrop.
+
+    Med digest_date loggas varje batch i utskicksloggen direkt före och efter anropet.
+    Returnerar (skickade, misslyckade).
+    """
+    def run(batch):
+        globals_, messages, content_hash = batch
+        emails = [m["To"][0]["Email"] for m in messages]
+        if digest_date:
+            digest_record(digest_date, [(e, content_hash) for e in emails], "sending")
+        ok, bad = _send_batch(globals_, messages)
+        if digest_date:
+            digest_record(digest_date, [(e, content_hash) for e in ok], "sent")
+            digest_record(digest_date, [(e, content_hash) for e in bad], "failed")
+        return ok, bad
+
+    sent, failed = [], []
+    with ThreadPoolExecutor(max_workers=max(1, MAILJET_WORKERS)) as pool:
+        for ok, bad in pool.map(run, batches):
+            sent += ok
+            failed += bad
+    return sent, failed
+
+
 def send_digest(
     subscribers: list[dict] | None = None,
     *,
@@ -91,9 +244,17 @@ def send_digest(
     force:  bool = False,
     days: int = 1,
     max_articles: int = 20,
+    digest_date: str | None = None,
+    max_sends: int | None = None,
+    resend_uncertain: bool = False,
 ) -> int:
     """
-    Skicka nyhetsbrev till prenumeranter.
+    Skicka nyhetsbrev till prenumeranter. Returnerar antal skickade (eller, vid dryrun, att skicka).
+
+    Prenumeranterna grupperas på sin kategorimängd; varje grupp renderas en
+    gång och skickas i batchar. test_to skickar ett brev med alla artiklar
+    (utan att röra utskicksloggen). max_sends (standard DIGEST_MAX_PER_RUN)
+    begränsar antalet mottagare i denna körning – resten tas nästa gång.
     """
     from app import sh
 
@@ -108,45 +269,80 @@ def send_digest(
         articles = sh.worksheet("Artiklar").get_all_records()[-6:]
 
     if subscribers is None:
-        subscribers = sh.worksheet("Prenumeranter").get_all_records()
-
-    sent = 0
-    for sub in subscribers:
-        if sub.get("Status") != "active":
+        subscribers = _active_subscribers(sh)
+
+    active = [s for s in subscribers if s.get("Status") == "active"]
+    groups: dict[tuple | None, list[dict]] = {}
+    if test_to:
+        # Testläge => ett brev med alla artiklar
+        groups[None] = [dict(active[0] if active else {}, **{"E-post": test_to})]
+    else:
+        for sub in active:
+            groups.setdefault(_wanted(sub.get("Kategorier")), []).append(sub)
+
+    date = datetime.date.today().strftime("%Y-%m-%d")
+    digest_date = digest_date or date
+    ledger = {} if test_to else digest_ledger(
+        digest_date, [sub["E-post"] for subs in groups.values() for sub in subs]
+    )
+    skipped = {"sent": 0, "sending": 0, "failed": 0}
+    limit = DIGEST_MAX_PER_RUN if max_sends is None else max_sends
+    remaining = limit if limit and limit > 0 else None
+
+    sender = {"Email": SENDER, "Name": "AI-Nyheter"}
+    batches, pending = [], []
+    for wanted, subs in groups.items():
+        # Hoppa över dem som redan fått (eller kanske fått) dagens brev
+        todo = []
+        for sub in subs:
+            status, attempts = ledger.get(sub["E-post"], ("pending", 0))
+            if status == "sent" or (status == "sending" and not resend_uncertain):
+                skipped[status] += 1
+            elif status == "failed" and attempts >= DIGEST_MAX_ATTEMPTS:
+                skipped["failed"] += 1
+            elif remaining is None or remaining > 0:
+                todo.append(sub)
+                remaining = None if remaining is None else remaining - 1
+        if not todo:
             continue
 
-        wanted = None
-        if sub["Kategorier"] != "ALL" and sub["Kategorier"].strip():
-            wanted = [c.strip() for c in sub["Kategorier"].split(",")]
-
-        # Testläge => skicka alla artiklar
-        user_articles = articles if test_to else [
-            a for a in articles if (wanted is None or a["category"] in wanted)
+        group_articles = articles if wanted is None else [a for a in articles if a["category"] in wanted]
+        html_body = _render_digest(group_articles, date)
+        content_hash = hashlib.sha1(html_body.encode("utf-8")).hexdigest()[:16]
+        globals_ = {
+            "From": sender,
+            "Subject": DIGEST_SUBJECT,
+            "HTMLPart": html_body,
+            "TemplateLanguage": True,
+        }
+        messages = [
+            {"To": [{"Email": sub["E-post"]}], "Variables": {"unsub": _unsub_link(sub)}}
+            for sub in todo
         ]
+        pending += [(sub["E-post"], content_hash) for sub in todo]
+        for i in range(0, len(messages), MAILJET_BATCH_SIZE):
+            batches.append((globals_, messages[i:i + MAILJET_BATCH_SIZE], content_hash))
+
+    recipients = sum(len(m) for _, m, _ in batches)
+    left = sum(len(subs) for subs in groups.values()) - recipients - sum(skipped.values())
+    print(
+        f"[digest] {digest_date}: {recipients} att skicka i {len(batches)} batchar"
+        f" · redan skickade {skipped['sent']} · osäkra {skipped['sending']}"
+        f" · gav upp {skipped['failed']} · kvar till nästa körning {left}",
+        file=sys.stderr,
+    )
+    if dryrun:
+        if not test_to:
+            print(f"[digest] Logg för {digest_date}: {digest_counts(digest_date)}", file=sys.stderr)
+        return recipients
+    if not (MJ_KEY and MJ_SECRET):
+        print("[email] Mailjet-nycklar saknas – inget skickat", file=sys.stderr)
+        return 0
 
-        unsub = (
-            "https://ai-nyheter-backend.onrender.com/api/unsubscribe"
-            f"?email={sub['E-post']}&tok={sub['Token']}"
-        )
-
-        html_body = render_template(
-            "digest.html",
-            date=datetime.date.today().strftime("%Y-%m-%d"),
-            articles=user_articles,
-            unsubscribe_link=unsub,
-        )
-
-        recipient = test_to or sub["E-post"]
-
-        if not dryrun:
-            if _send("AI-Nyheter – Dagens sammanfattning", html_body, recipient):
-                sent += 1
-        else:
-            sent += 1
-
-        if test_to:
-            break
-
-    print(f"[digest] {sent} brev {'skickade' if not dryrun else 'att skicka'}",
-          file=sys.stderr)
-    return sent
+    if not test_to:
+        digest_record(digest_date, pending, "pending")
+    started = time.monotonic()
+    sent, failed = _send_batches(batches, None if test_to else digest_date)
+    print(f"[digest] {len(sent)} brev skickade på {time.monotonic() - started:.1f}s"
+          + (f", {len(failed)} misslyckades" if failed else ""), file=sys.stderr)
+    return len(sent)